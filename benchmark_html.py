@@ -0,0 +1,75 @@
+"""
+Сравнение извлечения блоков из сохраненных HTML-страниц hh.ru: lxml (HtmlExtractor) и BeautifulSoup.
+
+Страницы резюме читаются из хранилища '/data/resume.store' и директории '/data/resume',
+страницы поисковой выдачи - из директории '/data/resume_pages'. Для каждой страницы
+проверяется, что результаты совпадают, и выводится время разбора обоими способами.
+
+Запуск: python benchmark_html.py [<директория проекта>] [<максимальное количество страниц>]
+"""
+
+import os
+import sys
+import time
+
+from src.loader.DocumentStore import DocumentStore
+from src.parser.HtmlExtractor import HtmlExtractor
+
+
+def _read_files(base_dir: str, limit: int) -> list:
+    pages = []
+    for root, dirs, filenames in os.walk(base_dir):
+        for filename in sorted(filenames):
+            if filename.endswith('.html') and len(pages) < limit:
+                with open(f'{root}/{filename}', mode='r', encoding='utf8') as fr:
+                    pages.append(fr.read())
+    return pages
+
+
+def _read_resume_pages(working_dir: str, limit: int) -> list:
+    pages = []
+    store = DocumentStore(f'{working_dir}/data/resume.store')
+    if store.exists():
+        for _, data in store.scan(store.get_ids()[:limit]):
+            pages.append(data.decode('utf-8'))
+    return pages + _read_files(f'{working_dir}/data/resume', limit - len(pages))
+
+
+def _benchmark(name: str, pages: list, selectors: list, attr: str = None) -> None:
+    if not pages:
+        print(f'{name}: no saved pages')
+        return
+
+    results = {}
+    timings = {}
+    for fast in (False, True):
+        extractor = HtmlExtractor(fast=fast)
+        start = time.perf_counter()
+        results[fast] = [extractor.select(html, selectors, attr=attr) for html in pages]
+        timings[fast] = time.perf_counter() - start
+
+    mismatches = sum(a != b for a, b in zip(results[False], results[True]))
+    print(f'{name}: {len(pages)} pages, '
+          f'BeautifulSoup {timings[False]:.3f} s ({1000 * timings[False] / len(pages):.2f} ms/page), '
+          f'lxml {timings[True]:.3f} s ({1000 * timings[True] / len(pages):.2f} ms/page), '
+          f'speedup x{timings[False] / max(timings[True], 1e-9):.1f}, '
+          f'mismatches {mismatches}')
+
+
+def main():
+    working_dir = sys.argv[1] if len(sys.argv) > 1 else os.getcwd()
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    _benchmark(
+        'resume',
+        _read_resume_pages(working_dir, limit),
+        selectors=[HtmlExtractor.RESUME_TITLE, HtmlExtractor.RESUME_EXPERIENCE, HtmlExtractor.RESUME_SKILLS])
+    _benchmark(
+        'resume_pages',
+        _read_files(f'{working_dir}/data/resume_pages', limit),
+        selectors=[HtmlExtractor.PAGER_LINKS, HtmlExtractor.RESUME_LINKS],
+        attr='href')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,14 @@
+import sys
+
 from src.DSProject import DSProject
 
 
 def main():
-    DSProject().run()
+    if sys.argv[1:] == ['ann-recall']:
+        # Отчет recall@k индекса приближенного поиска Word2vec.
+        DSProject().ann_recall_report()
+    else:
+        DSProject().run()
 
 
 if __name__ == '__main__':
@@ -7,6 +7,18 @@ from src.Searcher import Searcher
 
 working_dir = os.getcwd()  # Рабочая директория проекта.
 
+# Поиск по сегментам вакансий по дням публикации (см. SegmentIndex).
+segments_enable = False
+segments_max_age_days = 30  # Срок хранения вакансий в сегментах (дней).
+
+# Общий score одним произведением по объединенной матрице полей (см. FusedModel).
+fused_enable = True
+
+# Приближенный поиск Word2vec (см. IVFIndex) включается, только если измеренный при загрузке моделей
+# recall@10 (запросы - названия резюме) не меньше ann_min_recall, отчет: python main.py ann-recall.
+ann_enable = False
+ann_min_recall = 0.95
+
 pd.set_option('display.max_columns', None)  # Выводить все колонки.
 pd.set_option('display.max_rows', None)  # Выводить все строки.
 pd.set_option('display.width', None)  # Не переносить строки при выводе на консоль.
@@ -16,8 +28,9 @@ pd.set_option('display.max_colwidth', 256)  # Выводить все больш
 class DSProject:
     def __init__(self):
         self._loader = Loader(working_dir=working_dir)
-        self._searcher = Searcher(working_dir=working_dir)
-        self._service = RESTService(searcher=self._searcher)
+        self._searcher = Searcher(working_dir=working_dir, segments_enable=segments_enable, fused_enable=fused_enable,
+                                  ann_enable=ann_enable, ann_min_recall=ann_min_recall)
+        self._service = RESTService(searcher=self._searcher, vacancy_loader=self._get_service_vacancy_dataframe)
         self._resume_df = None
         self._vacancy_df = None
 
@@ -66,18 +79,66 @@ class DSProject:
         print('-' * 80)
         self._searcher.tfidf(vacancy_df=self._vacancy_df, query=query)
 
+        print('-' * 80)
+        self._searcher.hashing(vacancy_df=self._vacancy_df, query=query)
+
         print('-' * 80)
         self._searcher.w2v(vacancy_df=self._vacancy_df, query=query)
 
+    def _on_update(self):
+        # Разбор новых вакансий и их добавление в модели без полного переобучения.
+        self._on_parse()
+
+        if segments_enable:
+            # Новые вакансии добавляются сегментами, устаревшие сегменты удаляются.
+            self._searcher.update_segments(
+                vacancy_df=self._loader.get_vacancy_dataframe(),
+                max_age_days=segments_max_age_days)
+            return
+
+        vacancy_df = self._loader.get_vacancy_dataframe()
+        try:
+            n_added = self._searcher.update(vacancy_df=vacancy_df)
+            print(f'{n_added} new vacancies added to models')
+        except ValueError as err:
+            # Датасет изменился не только добавлением вакансий (строки моделей больше не соответствуют
+            # строкам датасета), модели переобучаются полностью. Новые модели сохраняются новым
+            # поколением, запущенный сервис до этого продолжает работать с текущими.
+            print("err: " + str(err))
+            print('full rebuild of models')
+            self._searcher.rebuild(vacancy_df=vacancy_df)
+
+    def _get_service_vacancy_dataframe(self) -> pd.DataFrame:
+        # Сервису нужны только поля для ответа и фильтров, токены нужны только для обучения отсутствующих моделей.
+        columns = [
+            'id', 'title', 'url', 'category', 'salary_from', 'salary_to', 'salary_currency',
+            'schedule', 'employment', 'area', 'experience',
+        ] if self._searcher.is_saved() else None
+        return self._loader.get_vacancy_dataframe(columns=columns)
+
     def _on_service(self):
-        self._vacancy_df = self._loader.get_vacancy_dataframe()
+        self._vacancy_df = self._get_service_vacancy_dataframe()
+        if ann_enable:
+            self._searcher.set_ann_queries(self._get_ann_queries())
+
+        # Запуск локального REST-сервиса (по одному рабочему процессу на ядро).
+        self._service.run(vacancy_df=self._vacancy_df, workers=os.cpu_count() or 1)
 
-        # Запуск локального REST-сервиса.
-        self._service.run(vacancy_df=self._vacancy_df)
+    def _get_ann_queries(self):
+        # Реальные запросы к сервису - резюме, для оценки recall используются названия резюме.
+        resume_df = self._loader.get_resume_dataframe(columns=['title'])
+        if resume_df.empty or 'title' not in resume_df.columns:
+            return None
+        return resume_df['title'].dropna().drop_duplicates().head(500).tolist()
+
+    def ann_recall_report(self) -> None:
+        # Отчет recall@10 индекса приближенного поиска Word2vec при разных значениях n_probe.
+        self._searcher.ann_recall_report(vacancy_df=self._loader.get_vacancy_dataframe(),
+                                         queries=self._get_ann_queries())
 
     def run(self) -> None:
-        # Скачиваем данные один раз, если ножно обновить данные, то
-        # следует удалить директорию /data/model и файлы /data/*.pkl5 перед запуском.
+        # Скачиваем данные один раз, новые вакансии (разобранные из новых файлов) добавляются
+        # в модели без переобучения, для полного переобучения следует удалить директорию /data/model.
         if not os.path.exists(f'{working_dir}/data/model'):
             # Скачать вакансии/резюме.
             # см. HHSettings.HH_VACANCY_MAX_PAGE
@@ -87,6 +148,9 @@ class DSProject:
             self._on_parse()
             # Индексация данных вакансий.
             self._on_search()
+        else:
+            # Добавление новых вакансий в модели.
+            self._on_update()
 
         # Запуск REST-сервиса.
         self._on_service()
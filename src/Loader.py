@@ -5,9 +5,14 @@ import pandas as pd
 
 from src.api import HHSettings
 from src.api.HHApi import HHApi
+from src.api.RateController import RateController
+from src.loader.CrawlEngine import CrawlEngine
+from src.loader.CrawlState import CrawlState
 from src.loader.ResumeLoader import ResumeLoader
 from src.loader.VacancyLoader import VacancyLoader
+from src.parser.ColumnStore import ColumnStore
 from src.parser.DataParser import DataParser
+from src.parser.ParseManifest import ParseManifest
 
 
 class Loader:
@@ -17,7 +22,23 @@ class Loader:
         """
 
         self._working_dir = working_dir
-        self._hh = HHApi(user_agents_file=f'{working_dir}/data/etc/user-agents.txt')
+        self._rate_controller = RateController(
+            rate=HHSettings.HH_RATE,
+            min_rate=HHSettings.HH_RATE_MIN,
+            max_rate=HHSettings.HH_RATE_MAX,
+            concurrency=HHSettings.HH_RATE_CONCURRENCY,
+            max_concurrency=HHSettings.HH_CRAWL_CONCURRENCY,
+            increase=HHSettings.HH_RATE_INCREASE,
+            decrease=HHSettings.HH_RATE_DECREASE,
+            latency_threshold=HHSettings.HH_RATE_LATENCY_THRESHOLD)
+        self._hh = HHApi(
+            user_agents_file=f'{working_dir}/data/etc/user-agents.txt',
+            pool_size=HHSettings.HH_CRAWL_CONCURRENCY,
+            rate_controller=self._rate_controller)
+        self._crawl_state = CrawlState(
+            file_path=f'{working_dir}/data/crawl_state.sqlite3',
+            page_ttl=HHSettings.HH_CRAWL_PAGE_TTL,
+            max_attempts=HHSettings.HH_CRAWL_MAX_ATTEMPTS)
 
     def _load_categories(self, categories_file_path: str) -> None:
         """
@@ -52,38 +73,119 @@ class Loader:
         Функция реализует:
         1. Выгрузку описания открытых вакансий и резюме из площадки "hh.ru".
         2. Предобработку текста описаний вакансий и резюме.
-        3. Подготовку датасета и сохрание его на диске в формате pickle.
+        3. Подготовку датасета и сохрание его на диске.
+
+        Все запросы вакансий и резюме выполняются одновременно одним конвейером CrawlEngine
+        с общим ограничением количества одновременных запросов. Состояние скачивания сохраняется
+        в '/data/crawl_state.sqlite3', повторный запуск продолжает скачивание с места остановки.
         """
 
-        # Скачать вакансии для указанных настроек.
         vacancy_loader = VacancyLoader(hh=self._hh, working_dir=self._working_dir)
+        resume_loader = ResumeLoader(hh=self._hh, working_dir=self._working_dir)
 
-        for option in HHSettings.HH_PROFESSIONAL_INFO:
-            vacancy_loader.load(
+        # Вакансии для указанных настроек.
+        queries = [
+            vacancy_loader.get_query(
                 area=option['area'],
                 professional_role=option['roles'],
                 search_in_days=HHSettings.HH_SEARCH_IN_DAYS,
                 max_page=HHSettings.HH_VACANCY_MAX_PAGE)
+            for option in HHSettings.HH_PROFESSIONAL_INFO
+        ]
 
-        # Скачать резюме для указанных названий.
-        resume_loader = ResumeLoader(
-            hh=self._hh,
-            working_dir=self._working_dir,
-            threadpool_max_workers=4)
-
-        for title in HHSettings.HH_RESUME_TITLES:
-            resume_loader.load(
+        # Резюме для указанных названий.
+        queries += [
+            resume_loader.get_query(
                 text=title,
                 area=HHSettings.HH_AREA,
                 search_in_days=HHSettings.HH_SEARCH_IN_DAYS,
                 max_page=HHSettings.HH_RESUME_MAX_PAGE)
+            for title in HHSettings.HH_RESUME_TITLES
+        ]
+
+        engine = CrawlEngine(
+            max_concurrency=HHSettings.HH_CRAWL_CONCURRENCY,
+            queue_size=HHSettings.HH_CRAWL_QUEUE_SIZE,
+            state=self._crawl_state)
+        engine.run(queries)
+        print(f'rate controller: {self._rate_controller.stats()}')
+        print(f'crawl state: {self._crawl_state.stats()}')
+
+    def _parse_incremental(self, name: str, file_paths: list, parse, limit: int = None, fingerprint=None) -> None:
+        """
+        Инкрементальный парсинг данных.
+
+        Разбираются только новые и измененные (по размеру и времени изменения) файлы,
+        их записи заменяют старые записи в датасете, записи удаленных файлов удаляются.
+        Список разобранных файлов хранится в манифесте '/data/<name>.manifest.json'.
+        Если ни одна запись не удалена и ни один файл не разобран, датасет и манифест не перезаписываются.
+
+        :param name: Название датасета ('vacancy', 'resume').
+        :param file_paths: Текущий список файлов.
+        :param parse: Функция разбора списка файлов, см. DataParser.parse_vacancy_files().
+        :param limit: Максимальное количество записей в датасете. Датасет, достигший ограничения, не
+                      меняется: старые записи не вытесняются (модели дополняются только новыми записями
+                      в конце датасета, см. ModelRegistry.update), новые файлы не разбираются и не
+                      попадают в манифест, т.е. будут разобраны, когда в датасете освободится место.
+        :param fingerprint: Функция вычисления отпечатка файла, см. DataParser.get_fingerprint().
+        :return:
+        """
 
-    def parse(self, vacancy_limit: int = 5000, resume_limit: int = 250) -> None:
+        store = self._get_store(name)
+        manifest = ParseManifest(
+            file_path=f'{self._working_dir}/data/{name}.manifest.json',
+            base_dir=f'{self._working_dir}/data',
+            fingerprint=fingerprint)
+
+        df = pd.DataFrame()
+        if manifest.exists():
+            df = self._read_dataset(name)
+        elif store.exists():
+            # Датасет собран без манифеста, его нужно пересобрать один раз.
+            print(f'{name}: manifest not found, full rebuild')
+
+        changed, removed = manifest.diff(file_paths)
+        if not changed and not removed and store.exists():
+            print(f'{name}: nothing to parse')
+            return
+
+        # Удалить записи измененных и удаленных файлов.
+        stale = removed + [manifest.get_relative_path(path) for path in changed]
+        if not df.empty:
+            df = df[~df['file'].isin(stale)]
+        n_removed = manifest.remove(stale)
+
+        # Разобрать новые и измененные файлы с учетом ограничения на размер датасета.
+        limit_left = None if limit is None else max(limit - len(df), 0)
+        processed = []
+        if changed and limit_left != 0:
+            new_df, processed = parse(changed, limit=limit_left)
+            print(f'{name}: {len(processed)} of {len(changed)} new or changed files parsed')
+            df = pd.concat([df, new_df], ignore_index=True)
+            manifest.update(processed)
+        if len(processed) < len(changed):
+            print(f'{name}: limit of {limit} records reached, {len(changed) - len(processed)} files skipped')
+
+        if not n_removed and not processed and store.exists():
+            print(f'{name}: nothing changed')
+            return
+
+        if not df.empty:
+            # Вакансия (резюме) могла быть сохранена повторно, оставляем последнюю версию.
+            df = df.drop_duplicates(subset=['id'], keep='last').reset_index(drop=True)
+
+        store.write(df)
+        manifest.save()
+
+    def parse(self, vacancy_limit: int = 5000, resume_limit: int = 250, workers: int = None) -> None:
         """
         Парсинг данных и подготовка датасета.
 
+        Повторный запуск разбирает только новые и измененные файлы.
+
         :param vacancy_limit: Количество вакансий в DataFrame.
         :param resume_limit: Количество резюме в DataFrame.
+        :param workers: Количество процессов для парсинга, по умолчанию по числу ядер.
         :return:
         """
 
@@ -92,28 +194,61 @@ class Loader:
         self._load_categories(categories_file_path=categories_file_path)
 
         # Парсим данные.
-        parser = DataParser(working_dir=self._working_dir, categories_file_path=categories_file_path)
-
-        # Парсинг вакансий, формирование DataFrame и сохранение его на диск в формате pickle.
-        file_path = f'{self._working_dir}/data/vacancy.pkl{pickle.HIGHEST_PROTOCOL}'
-        if not os.path.isfile(file_path):
-            vacancy_df = parser.get_vacancy_dataframe(limit=vacancy_limit)
-            vacancy_df.to_pickle(file_path)
-
-        # Парсинг вакансий, формирование DataFrame и сохранение его на диск в формате pickle.
-        file_path = f'{self._working_dir}/data/resume.pkl{pickle.HIGHEST_PROTOCOL}'
-        if not os.path.isfile(file_path):
-            resume_df = parser.get_resume_dataframe(limit=resume_limit)
-            resume_df.to_pickle(file_path)
-
-    def get_vacancy_dataframe(self) -> pd.DataFrame:
-        file_path = f'{self._working_dir}/data/vacancy.pkl{pickle.HIGHEST_PROTOCOL}'
-        if os.path.isfile(file_path):
-            return pd.read_pickle(file_path)
-        return pd.DataFrame()
+        parser = DataParser(
+            working_dir=self._working_dir,
+            categories_file_path=categories_file_path,
+            workers=workers or os.cpu_count() or 1)
+
+        # Парсинг вакансий, формирование DataFrame и сохранение его на диск в колоночном формате.
+        self._parse_incremental(
+            'vacancy',
+            file_paths=parser.get_vacancy_file_paths(),
+            parse=parser.parse_vacancy_files,
+            limit=vacancy_limit,
+            fingerprint=parser.get_fingerprint)
+
+        # Парсинг резюме, формирование DataFrame и сохранение его на диск в колоночном формате.
+        self._parse_incremental(
+            'resume',
+            file_paths=parser.get_resume_file_paths(),
+            parse=parser.parse_resume_files,
+            limit=resume_limit,
+            fingerprint=parser.get_fingerprint)
+
+    def _get_store(self, name: str) -> ColumnStore:
+        return ColumnStore(f'{self._working_dir}/data/{name}.columns')
+
+    def _read_dataset(self, name: str, columns: list = None) -> pd.DataFrame:
+        """
+        Чтение датасета из колоночного хранилища (либо из pickle-файла предыдущей версии).
 
-    def get_resume_dataframe(self) -> pd.DataFrame:
-        file_path = f'{self._working_dir}/data/resume.pkl{pickle.HIGHEST_PROTOCOL}'
+        :param name: Название датасета ('vacancy', 'resume').
+        :param columns: Список столбцов, по умолчанию все столбцы.
+        :return:
+        """
+
+        store = self._get_store(name)
+        if store.exists():
+            # Датасет мог быть разобран предыдущей версией без части столбцов.
+            if columns:
+                columns = [column for column in columns if column in store.columns]
+            return store.read(columns=columns)
+
+        file_path = f'{self._working_dir}/data/{name}.pkl{pickle.HIGHEST_PROTOCOL}'
         if os.path.isfile(file_path):
-            return pd.read_pickle(file_path)
+            df = pd.read_pickle(file_path)
+            return df[[column for column in columns if column in df.columns]] if columns else df
+
         return pd.DataFrame()
+
+    def get_vacancy_dataframe(self, columns: list = None) -> pd.DataFrame:
+        """
+        :param columns: Список столбцов, по умолчанию все столбцы.
+        """
+        return self._read_dataset('vacancy', columns=columns)
+
+    def get_resume_dataframe(self, columns: list = None) -> pd.DataFrame:
+        """
+        :param columns: Список столбцов, по умолчанию все столбцы.
+        """
+        return self._read_dataset('resume', columns=columns)
@@ -1,43 +1,206 @@
 import json
+import time
 import pandas as pd
 
+from threading import Lock, Thread
+from typing import Callable
+
 from flask import Flask, request
 
 from src.Searcher import Searcher
+from src.searcher.FilterIndex import FilterIndex
 
 
 class RESTService:
-    def __init__(self, searcher: Searcher):
+    def __init__(self,
+                 searcher: Searcher,
+                 vacancy_loader: Callable[[], pd.DataFrame] = None,
+                 refresh_interval: float = 5.0):
+        """
+        :param searcher: Поиск вакансий.
+        :param vacancy_loader: Функция чтения датасета вакансий, вызывается после обновления моделей
+                               новыми вакансиями (None - датасет не перечитывается).
+        :param refresh_interval: Как часто (в секундах) фоновый поток проверяет, что модели на диске были обновлены.
+        """
+
         self._searcher = searcher
+        self._vacancy_loader = vacancy_loader
+        self._refresh_interval = refresh_interval
         self._vacancy_df = None
+        self._generation = None
+        self._lock = Lock()
         self._n_top = 10
+        self._ready = False
+
+    def _refresh(self) -> None:
+        """
+        Перезагрузка моделей, если они были обновлены на диске, и чтение датасета вакансий,
+        согласованного с новыми моделями. Выполняется фоновым потоком под блокировкой.
+        """
+
+        with self._lock:
+            self._searcher.refresh()
+            generation = self._searcher.generation
+            if self._vacancy_loader is not None and self._generation != generation:
+                self._vacancy_df = self._vacancy_loader()
+            self._generation = generation
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self._refresh_interval)
+            try:
+                self._refresh()
+            except Exception as err:
+                print("err: " + str(err))
+
+    def _get_vacancy_df(self) -> pd.DataFrame:
+        """
+        Датасет вакансий, согласованный с текущими моделями.
+
+        Модели и датасет обновляет фоновый поток (см. _watch), запрос не выполняет файловых
+        операций: если модели уже подменены, а датасет еще читается, запрос ждет его чтения.
+        """
+
+        if self._generation != self._searcher.generation:
+            with self._lock:
+                pass
+        return self._vacancy_df
+
+    @staticmethod
+    def _get_params() -> dict:
+        """
+        Параметры запроса {"params": {...}}.
+
+        :raises ValueError: Тело запроса не является JSON-объектом с объектом "params".
+        """
+
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError('Request body must be a JSON object')
+        params = data.get('params')
+        if params is None:
+            return {}
+        if not isinstance(params, dict):
+            raise ValueError('"params" must be an object')
+        return params
+
+    @staticmethod
+    def _get_str(params: dict, name: str, default: str = '') -> str:
+        """
+        Строковый параметр запроса (без пробелов по краям), None - значение по умолчанию.
+
+        :raises ValueError: Параметр не является строкой.
+        """
+
+        value = params.get(name)
+        if value is None:
+            return default
+        if not isinstance(value, str):
+            raise ValueError(f'"{name}" must be a string')
+        return value.strip()
+
+    @staticmethod
+    def _response(app: Flask, records, status: int = 200):
+        return app.response_class(
+            response=json.dumps(records, ensure_ascii=False),
+            mimetype='application/json',
+            status=status)
+
+    def create_app(self, vacancy_df: pd.DataFrame) -> Flask:
+        """
+        Загрузка моделей и создание Flask-приложения.
+        """
 
-    def run(self, vacancy_df: pd.DataFrame):
         self._vacancy_df = vacancy_df.copy()
 
+        # Загрузить и прогреть все модели до старта сервиса,
+        # запросы обслуживаются из общего состояния только для чтения.
+        # Готовность выставляется в рабочем процессе (см. on_worker_start).
+        self._searcher.load_models(vacancy_df=self._vacancy_df)
+        self._generation = self._searcher.generation
+        self._ready = False
+
         app = Flask(__name__)
 
+        @app.route('/api/ready', methods=['GET'])
+        def api_ready():
+            # Процесс не готов, если прогрев не выполнен либо последняя перезагрузка моделей не удалась.
+            ready = self._ready and self._searcher.load_error is None
+            return self._response(app, {'ready': ready}, status=200 if ready else 503)
+
         @app.route('/api/getSimilarVacancies', methods=['POST'])
         def api():
-            params = request.json.get('params', {})
-            query = params.get('query', '').strip()
-            # print(f'query: {query}')
-            model = params.get('model', '').strip().lower()
+            # Некорректные параметры запроса (тип параметра, фильтр, способ объединения результатов) - ответ 400.
+            try:
+                params = self._get_params()
+                query = self._get_str(params, 'query')
+                # print(f'query: {query}')
+                model = self._get_str(params, 'model').lower()
+                fusion = self._get_str(params, 'fusion', 'rrf').lower()
+                filters = FilterIndex.normalize_filters(params.get('filters'))
+            except ValueError as err:
+                return self._response(app, {'error': str(err)}, status=400)
+
             print(f'model: {model}')
 
             df = None
+            error = 'unknown model'
+            vacancy_df = self._get_vacancy_df()
 
-            if model == 'bow':
-                df = self._searcher.bow_api(vacancy_df=self._vacancy_df, query=query, n_top=self._n_top)
-            elif model == 'tfidf':
-                df = self._searcher.tfidf_api(vacancy_df=self._vacancy_df, query=query, n_top=self._n_top)
-            elif model == 'w2v':
-                df = self._searcher.w2v_api(vacancy_df=self._vacancy_df, query=query, n_top=self._n_top)
+            try:
+                if model == 'bow':
+                    df = self._searcher.bow_api(
+                        vacancy_df=vacancy_df, query=query, n_top=self._n_top, filters=filters)
+                elif model == 'tfidf':
+                    df = self._searcher.tfidf_api(
+                        vacancy_df=vacancy_df, query=query, n_top=self._n_top, filters=filters)
+                elif model == 'hashing':
+                    df = self._searcher.hashing_api(
+                        vacancy_df=vacancy_df, query=query, n_top=self._n_top, filters=filters)
+                elif model == 'w2v':
+                    df = self._searcher.w2v_api(
+                        vacancy_df=vacancy_df, query=query, n_top=self._n_top, filters=filters)
+                elif model == 'hybrid':
+                    df = self._searcher.hybrid_api(
+                        vacancy_df=vacancy_df, query=query, n_top=self._n_top, filters=filters,
+                        fusion=fusion)
+            except ValueError as err:
+                # Неизвестный фильтр (способ объединения результатов).
+                return self._response(app, {'error': str(err)}, status=400)
 
             records = {}
 
             if df is not None:
                 records = df.to_dict(orient='records')
+            else:
+                records = {'error': error}
+
+            return self._response(app, records)
+
+        @app.route('/api/getSimilarVacanciesBatch', methods=['POST'])
+        def api_batch():
+            try:
+                params = self._get_params()
+                queries = params.get('queries')
+                if queries is None:
+                    queries = []
+                if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+                    raise ValueError('"queries" must be a list of strings')
+                queries = [query.strip() for query in queries]
+                model = self._get_str(params, 'model').lower()
+            except ValueError as err:
+                return self._response(app, {'error': str(err)}, status=400)
+
+            print(f'model: {model}, queries: {len(queries)}')
+
+            if model in self._searcher.models:
+                records = [
+                    df.to_dict(orient='records') for df in self._searcher.search_batch(
+                        vacancy_df=self._get_vacancy_df(),
+                        queries=queries,
+                        model=model,
+                        n_top=self._n_top)
+                ]
             else:
                 records = {'error': 'unknown model'}
 
@@ -46,4 +209,83 @@ class RESTService:
                 mimetype='application/json',
                 status=200)
 
-        app.run(host='0.0.0.0', port=8080, debug=False)
+        @app.route('/api/cacheStats', methods=['GET'])
+        def api_cache_stats():
+            return app.response_class(
+                response=json.dumps(self._searcher.cache_stats(), ensure_ascii=False),
+                mimetype='application/json',
+                status=200)
+
+        return app
+
+    def on_worker_start(self) -> None:
+        """
+        Прогрев моделей в рабочем процессе, после успешного прогрева процесс сообщает о готовности
+        (/api/ready). Вызывается в каждом рабочем процессе после fork (либо перед запуском
+        встроенного сервера Flask) и запускает фоновый поток перезагрузки моделей
+        (потоки родительского процесса не переживают fork).
+        """
+
+        try:
+            self._searcher.warm_up()
+            self._ready = True
+        except Exception as err:
+            print("err: " + str(err))
+            self._ready = False
+
+        Thread(target=self._watch, name='model-refresh', daemon=True).start()
+
+    def run(self,
+            vacancy_df: pd.DataFrame,
+            host: str = '0.0.0.0',
+            port: int = 8080,
+            workers: int = 1,
+            threads: int = 4,
+            graceful_timeout: int = 30):
+        """
+        Запуск REST-сервиса.
+
+        При workers > 1 сервис запускается в режиме pre-fork (gunicorn): модели загружаются
+        один раз в родительском процессе до запуска рабочих процессов, рабочие процессы
+        получают их через fork (матрицы моделей разделяются через memory map).
+        При остановке (SIGTERM) рабочие процессы завершают текущие запросы в течение
+        graceful_timeout секунд.
+
+        :param vacancy_df: Датасет вакансий.
+        :param host: Адрес сервиса.
+        :param port: Порт сервиса.
+        :param workers: Количество рабочих процессов (1 - встроенный сервер Flask).
+        :param threads: Количество потоков в каждом рабочем процессе.
+        :param graceful_timeout: Время на завершение текущих запросов при остановке.
+        :return:
+        """
+
+        app = self.create_app(vacancy_df=vacancy_df)
+        service = self
+
+        if workers > 1:
+            try:
+                from gunicorn.app.base import BaseApplication
+            except ImportError:
+                BaseApplication = None
+                print('gunicorn is not installed, fallback to Flask development server')
+
+            if BaseApplication is not None:
+                class Application(BaseApplication):
+                    def load_config(self):
+                        self.cfg.set('bind', f'{host}:{port}')
+                        self.cfg.set('workers', workers)
+                        self.cfg.set('threads', threads)
+                        self.cfg.set('worker_class', 'gthread')
+                        self.cfg.set('graceful_timeout', graceful_timeout)
+                        self.cfg.set('preload_app', True)
+                        self.cfg.set('post_fork', lambda server, worker: service.on_worker_start())
+
+                    def load(self):
+                        return app
+
+                Application().run()
+                return
+
+        self.on_worker_start()
+        app.run(host=host, port=port, debug=False, threaded=True)
@@ -1,16 +1,69 @@
 import os
 import time
+import numpy as np
 import pandas as pd
 
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from sklearn.preprocessing import normalize
+
 from src.parser.TextTransformer import TextTransformer
+from src.searcher.FilterIndex import FilterIndex
+from src.searcher.ModelRegistry import ModelRegistry
+from src.searcher.QueryCache import QueryCache
+from src.searcher.SegmentIndex import SegmentIndex
 from src.searcher.algorithms.BoWModel import BoWModel
+from src.searcher.algorithms.HashingModel import HashingModel
+from src.searcher.algorithms.InvertedIndex import InvertedIndex
 from src.searcher.algorithms.TfidfModel import TfidfModel
 from src.searcher.algorithms.W2VModel import W2VModel
 
 
 class Searcher:
-    def __init__(self, working_dir: str):
+    def __init__(self,
+                 working_dir: str,
+                 cache_max_size: int = 10000,
+                 cache_ttl: float = None,
+                 index_enable: bool = True,
+                 ann_enable: bool = False,
+                 ann_min_recall: float = 0.95,
+                 segments_enable: bool = False,
+                 min_segment_size: int = 1000,
+                 fused_enable: bool = False):
+        """
+        :param working_dir: Директория проекта.
+        :param cache_max_size: Максимальное количество результатов поиска в кэше (0 - кэш отключен).
+        :param cache_ttl: Время жизни результата поиска в кэше (в секундах), None - без ограничения.
+        :param index_enable: Использовать инвертированный индекс для моделей BoW и TF-IDF.
+        :param ann_enable: Использовать индекс приближенного поиска (IVF) для модели Word2vec.
+        :param ann_min_recall: Индекс приближенного поиска используется, только если его recall@10 относительно
+                               точного поиска (измеряется при загрузке моделей) не меньше этого значения.
+        :param segments_enable: Искать по сегментам вакансий по дням публикации (см. SegmentIndex).
+        :param min_segment_size: Сегменты меньшего размера сливаются с соседними.
+        :param fused_enable: Вычислять общий score одним произведением по объединенной матрице полей
+                             (см. FusedModel) вместо отдельного прохода по каждому полю. При включенном
+                             index_enable используется только для модели Word2vec.
+        """
+
         self._working_dir = working_dir
+        self._index_enable = index_enable
+        self._ann_enable = ann_enable
+        self._ann_min_recall = ann_min_recall
+        # Запросы для проверки recall индекса приближенного поиска (см. set_ann_queries).
+        self._ann_queries = None
+        # Индекс приближенного поиска прошел проверку recall (см. _check_ann).
+        self._ann_active = False
+        self._segments_enable = segments_enable
+        self._min_segment_size = min_segment_size
+        self._segment_indexes = {}
+        # Поля вакансий, которые хранятся в сегментах.
+        self._segment_columns = ['id', 'title', 'url', 'day', 'category', 'salary_from', 'salary_to',
+                                 'salary_currency', 'schedule', 'employment', 'area', 'experience']
+        # Индекс фильтров для текущего датасета вакансий (датасет, FilterIndex).
+        self._filter_index = (None, None)
+        # Если фильтр оставляет не больше этой доли вакансий, то индексы не используются.
+        self._filter_rows_ratio = 0.1
 
         # При вычислении общего score учитываем:
         # - 10% сходства названия вакансии
@@ -20,11 +73,51 @@ class Searcher:
             ('description', 0.9),
         ]
 
-        self._text_transformer = TextTransformer(working_dir=working_dir)
+        # Запросы нормализуются со словарем нормальных форм только в памяти: потоки обработки
+        # запросов не обращаются к SQLite (словарь на диске пополняет разбор данных).
+        self._text_transformer = TextTransformer(working_dir=working_dir, token_dict_persist=False)
         self._max_features = 20000
 
+        # Реестр моделей: модели загружаются один раз и разделяются всеми запросами.
+        self._registry = ModelRegistry(working_dir=working_dir, fields=self._fields, fused_enable=fused_enable)
+        # Модели с инвертированным индексом при включенном index_enable обслуживаются по индексу,
+        # объединенная матрица полей для них не строится (для hashing это 2 * 2^20 столбцов).
+        self._registry.register(
+            'bow',
+            lambda: BoWModel(ngram_range=(1, 2), max_features=self._max_features),
+            fused=not index_enable)
+        self._registry.register(
+            'tfidf',
+            lambda: TfidfModel(smooth_idf=True, use_idf=True, ngram_range=(1, 2), max_features=self._max_features),
+            fused=not index_enable)
+        self._registry.register(
+            'hashing',
+            lambda: HashingModel(ngram_range=(1, 2), n_features=2 ** 20),
+            fused=not index_enable)
+        self._registry.register(
+            'w2v',
+            lambda: W2VModel(vector_size=512, window=5, min_count=1, workers=8, epochs=150),
+            split=True)
+
+        # Кэш результатов поиска.
+        self._cache = QueryCache(max_size=cache_max_size, ttl=cache_ttl)
+
+        # Гибридный поиск: модели и их веса (для объединения по score), количество вакансий,
+        # которое запрашивается у каждой модели, параметр k формулы RRF.
+        self._hybrid_weights = {
+            'bow': 0.3,
+            'tfidf': 0.4,
+            'w2v': 0.3,
+        }
+        self._hybrid_depth = 50
+        self._rrf_k = 60
+        # Пул потоков гибридного поиска (создается в каждом процессе сервиса, см. _get_executor).
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = Lock()
+
     @staticmethod
-    def _calc_score(df, fields):
+    def _calc_score(scores: dict, fields) -> np.ndarray:
         """
         Вычислении общего score.
 
@@ -32,91 +125,684 @@ class Searcher:
         score = sum(score[i] * weight[i])
         """
 
-        score = 0.0
+        score = None
         for field, weight in fields:
-            score += df[f'{field}_score'] * weight
+            if score is None:
+                score = scores[field] * weight
+            else:
+                score += scores[field] * weight
         return score
 
-    def _print_stat(self, df: pd.DataFrame, n_top: int = 10):
+    @staticmethod
+    def _get_top_idx(score: np.ndarray, n_top: int = 10) -> np.ndarray:
+        """
+        Индексы N-топ значений score (по убыванию), значения score <= 0 отбрасываются.
+
+        Вместо полной сортировки используется частичная выборка (O(N)),
+        сортируются только отобранные N значений.
+        """
+
+        n_top = min(n_top, score.shape[0])
+        if n_top <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        idx = np.argpartition(-score, n_top - 1)[:n_top]
+        idx = idx[score[idx] > 0.0]
+        return idx[np.argsort(-score[idx], kind='stable')]
+
+    def _print_stat(self, vacancy_df: pd.DataFrame, scores: dict, n_top: int = 10):
         """
         Формирование и вывод на экран статистики поиска ваканисй (N-топ).
         """
 
         # Вычисление суммарного score.
-        df['score'] = df.apply(lambda x: Searcher._calc_score(x, self._fields), axis=1)
-        df.sort_values(by=['score'], ascending=False, inplace=True)
+        score = Searcher._calc_score(scores, self._fields)
+        idx = Searcher._get_top_idx(score, n_top=n_top)
 
         # Формирование списка полей для вывода статистики.
-        fields = ['id', 'title'] + [f'{field}_score' for field, _ in self._fields] + ['score', 'url']
+        fields = {f'{field}_score': scores[field][idx] for field, _ in self._fields}
+        df = vacancy_df.iloc[idx][['id', 'title']].assign(**fields, score=score[idx])
+        df['url'] = vacancy_df['url'].iloc[idx]
         # Напечатать топ-10 ваканисй.
-        print(df[fields][df['score'] > 0.0].head(n_top))
+        print(df)
 
-    def _get_n_top(self, df: pd.DataFrame, n_top: int = 10) -> pd.DataFrame:
-        df['score'] = df.apply(lambda x: Searcher._calc_score(x, self._fields), axis=1)
-        df.sort_values(by=['score'], ascending=False, inplace=True)
-        fields = ['id', 'title', 'url', 'score']
-        return df[fields][df['score'] > 0.0].iloc[:n_top]
+    @staticmethod
+    def _get_rows(vacancy_df: pd.DataFrame, idx: np.ndarray, score: np.ndarray) -> pd.DataFrame:
+        """
+        Из каталога вакансий извлекаются только отобранные строки.
+        """
 
-    def bow(self, vacancy_df: pd.DataFrame, query: str) -> None:
+        # Модели могли быть дополнены новыми вакансиями раньше, чем перечитан датасет.
+        keep = idx < len(vacancy_df)
+        return vacancy_df.iloc[idx[keep]][['id', 'title', 'url']].assign(score=score[keep])
+
+    def _get_model(self, name: str, field: str, vacancy_df: pd.DataFrame):
         """
-        Модель "Bag of Words" в целом работает хорошо, но
-        может находить не совсем подходящие вакансии по описанию резюме.
+        Получить модель из реестра, при необходимости модель загружается (обучается) один раз.
         """
 
-        print('Модель: Bag of Words')
+        if not self._registry.is_loaded(name):
+            self._registry.load(vacancy_df=vacancy_df, names=[name])
+        return self._registry.get(name, field)
+
+    def _prepare_query(self, name: str, tokens: str):
+        """
+        Подготовка нормализованного запроса (строки токенов) для модели name.
+        """
+
+        return tokens.split() if self._registry.is_split(name) else tokens
+
+    def _calc_field_scores(self,
+                           name: str,
+                           vacancy_df: pd.DataFrame,
+                           tokens: str,
+                           verbose: bool = True,
+                           rows: np.ndarray = None) -> dict:
+        """
+        Вычисление score для каждого поля вакансии при помощи модели name.
+
+        :param tokens: Нормализованный запрос (результат TextTransformer.transform).
+        :param rows: Номера вакансий, для которых вычисляется score, None - все вакансии.
+        :return: Словарь {field: np.ndarray} со значениями score для всех вакансий (для вакансий rows).
+        """
 
-        df = vacancy_df.copy()
+        scores = {}
 
         for field, _ in self._fields:
             tm_start = time.time()
 
-            # Инициализация и обучение модели.
-            model = BoWModel(ngram_range=(1, 2), max_features=20000)
-
-            # NOTE: При первом запуске происходит создание и кэширование модели (занимает некоторое время).
-            file_path = f'{self._working_dir}/data/model/bow/{field}.model'
-            if not os.path.isfile(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                # Подготовка данных для обучения модели.
-                corpus = df[f'{field}_tok'].tolist()
-                model.fit(corpus)
-                model.save(file_path)
-            else:
-                model.load(file_path)
+            model = self._get_model(name, field, vacancy_df)
 
             # Подготовка запроса.
-            target = model.transform(self._text_transformer.transform(query, split=False))
+            target = model.transform(self._prepare_query(name, tokens))
 
             # Вычисление score для столбца field.
-            df[f'{field}_score'] = model.get_similarity(target)
+            scores[field] = np.asarray(model.get_similarity(target, rows=rows), dtype=np.float64)
 
-            tm_elapsed = time.time() - tm_start
-            print(f'time: {tm_elapsed:.06f} for "{field}_tok"')
+            if verbose:
+                tm_elapsed = time.time() - tm_start
+                print(f'time: {tm_elapsed:.06f} for "{field}_tok"')
 
-        print()
+        return scores
+
+    def _get_fused(self, name: str, vacancy_df: pd.DataFrame):
+        """
+        Объединенная модель полей из реестра или None если режим fused_enable выключен.
+        """
+
+        if not self._registry.is_loaded(name):
+            self._registry.load(vacancy_df=vacancy_df, names=[name])
+        return self._registry.get_fused(name)
+
+    def _calc_total_score(self, name: str, vacancy_df: pd.DataFrame, tokens: str, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Вычисление общего score: по объединенной матрице полей (одно произведение),
+        либо по каждому полю с последующим взвешенным суммированием (см. _calc_score).
+
+        :param rows: Номера вакансий, для которых вычисляется score, None - все вакансии.
+        """
+
+        fused = self._get_fused(name, vacancy_df)
+        if fused is None:
+            scores = self._calc_field_scores(name, vacancy_df, tokens, rows=rows)
+            return Searcher._calc_score(scores, self._fields)
 
-        self._print_stat(df)
+        target = fused.transform(self._prepare_query(name, tokens))
+        return np.asarray(fused.get_similarity(target, rows=rows), dtype=np.float64)
 
-    def bow_api(self, vacancy_df: pd.DataFrame, query: str, n_top: int = 10) -> pd.DataFrame:
-        df = vacancy_df.copy()
+    @staticmethod
+    def _resize_mask(mask: np.ndarray, n_docs: int) -> np.ndarray:
+        """
+        Маска вакансий по количеству документов модели (модель могла быть дополнена
+        новыми вакансиями раньше, чем перечитан датасет).
+        """
+
+        if mask is None or len(mask) == n_docs:
+            return mask
+        resized = np.zeros(n_docs, dtype=bool)
+        resized[:min(n_docs, len(mask))] = mask[:n_docs]
+        return resized
+
+    def _calc_top_n_index(self,
+                          name: str,
+                          vacancy_df: pd.DataFrame,
+                          tokens: str,
+                          n_top: int = 10,
+                          mask: np.ndarray = None):
+        """
+        Поиск N-топ вакансий по инвертированному индексу (score вычисляется только для
+        вакансий, в которых есть термы запроса).
+
+        :param mask: Маска допустимых вакансий (фильтр), None - все вакансии.
+
+        :return: (номера вакансий, score) или None если модель не поддерживает индекс.
+        """
+
+        terms = []
+        n_docs = 0
+        for field, weight in self._fields:
+            model = self._get_model(name, field, vacancy_df)
+            field_terms = model.get_terms(model.transform(self._prepare_query(name, tokens)), weight)
+            if field_terms is None:
+                return None
+            terms.extend(field_terms)
+            n_docs = max(n_docs, model.n_docs)
+
+        return InvertedIndex.top_n(terms, n_top=n_top, mask=Searcher._resize_mask(mask, n_docs))
+
+    def _calc_top_n_ann(self,
+                        name: str,
+                        vacancy_df: pd.DataFrame,
+                        tokens: str,
+                        n_top: int = 10,
+                        mask: np.ndarray = None):
+        """
+        Поиск N-топ вакансий по индексу приближенного поиска: кандидаты всех полей
+        объединяются, и для них вычисляется точный общий score.
+
+        :param mask: Маска допустимых вакансий (фильтр), None - все вакансии. Если после
+                     фильтра кандидатов меньше n_top, то возвращается None (нужен точный поиск).
+
+        :return: (номера вакансий, score) или None если модель не поддерживает индекс.
+        """
 
+        targets = {}
+        candidates = []
         for field, _ in self._fields:
-            tm_start = time.time()
-            model = BoWModel(ngram_range=(1, 2), max_features=20000)
-            file_path = f'{self._working_dir}/data/model/bow/{field}.model'
-            if not os.path.isfile(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                corpus = df[f'{field}_tok'].tolist()
-                model.fit(corpus)
-                model.save(file_path)
+            model = self._get_model(name, field, vacancy_df)
+            targets[field] = model.transform(self._prepare_query(name, tokens))
+            field_candidates = model.get_candidates(targets[field])
+            if field_candidates is None:
+                return None
+            candidates.append(field_candidates)
+
+        rows = np.unique(np.concatenate(candidates))
+        if mask is not None:
+            rows = rows[Searcher._resize_mask(mask, model.n_docs)[rows]]
+            if len(rows) < n_top:
+                return None
+
+        fused = self._get_fused(name, vacancy_df)
+        if fused is not None:
+            score = np.asarray(fused.get_similarity(fused.transform(self._prepare_query(name, tokens)), rows=rows),
+                               dtype=np.float64)
+        else:
+            scores = {}
+            for field, _ in self._fields:
+                model = self._get_model(name, field, vacancy_df)
+                scores[field] = np.asarray(model.get_similarity(targets[field], rows=rows), dtype=np.float64)
+            score = Searcher._calc_score(scores, self._fields)
+
+        idx = Searcher._get_top_idx(score, n_top=n_top)
+        return rows[idx], score[idx]
+
+    def set_ann_queries(self, queries: list) -> None:
+        """
+        Запросы для проверки recall индекса приближенного поиска при загрузке моделей
+        (например, названия резюме), None - векторы случайных вакансий.
+        """
+
+        self._ann_queries = queries
+
+    def _check_ann(self, vacancy_df: pd.DataFrame = None) -> None:
+        """
+        Включение индекса приближенного поиска: recall@10 при текущем n_probe для всех полей
+        должен быть не меньше ann_min_recall.
+        """
+
+        self._ann_active = False
+        if not self._ann_enable:
+            return
+
+        report = self.ann_recall_report(vacancy_df, queries=self._ann_queries, current=True, verbose=False)
+        if report.empty or len(report) < len(self._fields):
+            print('ann: index not found, exact search is used')
+            return
+
+        recall = float(report['recall'].min())
+        self._ann_active = recall >= self._ann_min_recall
+        print(f'ann: recall@10 {recall:.3f}, min {self._ann_min_recall:.3f}, '
+              f'{"approximate" if self._ann_active else "exact"} search is used')
+
+    def ann_recall_report(self,
+                          vacancy_df: pd.DataFrame = None,
+                          queries: list = None,
+                          n_top: int = 10,
+                          n_samples: int = 100,
+                          current: bool = False,
+                          verbose: bool = True) -> pd.DataFrame:
+        """
+        Отчет recall@k индекса приближенного поиска модели Word2vec относительно точного поиска
+        для каждого поля вакансии при разных значениях n_probe.
+
+        :param queries: Список запросов (например, названия резюме), по умолчанию в качестве запросов
+                        используются векторы n_samples случайных вакансий, сама вакансия-запрос
+                        исключается из результатов.
+        :param n_top: Количество вакансий в результате (k).
+        :param n_samples: Количество случайных вакансий, если запросы не заданы.
+        :param current: Только для текущего значения n_probe индекса.
+        :param verbose: Вывести отчет.
+        """
+
+        tokens = None
+        if queries is not None:
+            tokens = [self._prepare_query('w2v', self._text_transformer.transform(query)) for query in queries]
+
+        reports = []
+        for field, _ in self._fields:
+            model = self._get_model('w2v', field, vacancy_df)
+            if model.ivf is None:
+                continue
+
+            exclude = None
+            if tokens is not None:
+                vectors = normalize(np.asarray(model.transform_batch(tokens)))
+                # Запросы без известных модели слов не участвуют в оценке.
+                vectors = vectors[np.linalg.norm(vectors, axis=1) > 0]
             else:
-                model.load(file_path)
-            target = model.transform(self._text_transformer.transform(query, split=False))
-            df[f'{field}_score'] = model.get_similarity(target)
-            tm_elapsed = time.time() - tm_start
-            print(f'time: {tm_elapsed:.06f} for "{field}_tok"')
+                rng = np.random.default_rng(0)
+                sample = rng.choice(model.matrix.shape[0], size=min(n_samples, model.matrix.shape[0]), replace=False)
+                exclude = np.sort(sample)
+                vectors = np.asarray(model.matrix[exclude])
+
+            n_probes = (model.ivf.n_probe,) if current else None
+            report = model.ivf.recall_report(model.matrix, vectors, n_top=n_top, n_probes=n_probes, exclude=exclude)
+            reports.append(report.assign(field=field))
+
+        df = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
+        if verbose:
+            print(df)
+        return df
+
+    def _calc_field_scores_batch(self, name: str, vacancy_df: pd.DataFrame, queries: list) -> dict:
+        """
+        Вычисление score для каждого поля вакансии сразу для списка запросов.
+
+        Запросы преобразуются в одну матрицу запросов, и сходство со всеми
+        вакансиями вычисляется одним матричным произведением.
+
+        :return: Словарь {field: np.ndarray} с матрицами score (float32) размера (len(queries), len(vacancy_df)).
+        """
+
+        tokens = [self._prepare_query(name, self._text_transformer.transform(query)) for query in queries]
+
+        scores = {}
+        for field, _ in self._fields:
+            model = self._get_model(name, field, vacancy_df)
+            targets = model.transform_batch(tokens)
+            scores[field] = np.asarray(model.get_similarity_batch(targets), dtype=np.float32)
+
+        return scores
+
+    def _calc_score_batch(self, name: str, vacancy_df: pd.DataFrame, queries: list) -> np.ndarray:
+        """
+        Вычисление общего score для списка запросов.
+
+        :return: Матрица score (float32) размера (len(queries), количество вакансий).
+        """
+
+        fused = self._get_fused(name, vacancy_df)
+        if fused is None:
+            return Searcher._calc_score(self._calc_field_scores_batch(name, vacancy_df, queries), self._fields)
+
+        tokens = [self._prepare_query(name, self._text_transformer.transform(query)) for query in queries]
+        return np.asarray(fused.get_similarity_batch(fused.transform_batch(tokens)), dtype=np.float32)
+
+    def _get_batch_chunk_size(self, name: str, vacancy_df: pd.DataFrame, max_memory: int) -> int:
+        """
+        Количество запросов пакетного поиска, обрабатываемых за одно матричное произведение,
+        при котором промежуточные матрицы score занимают не больше max_memory байт.
+
+        На каждую пару (запрос, вакансия) приходится результат произведения (float64), матрицы
+        score полей и общий score с временной матрицей при суммировании (float32).
+        """
+
+        n_docs = max(len(vacancy_df), self._get_model(name, self._fields[0][0], vacancy_df).n_docs, 1)
+        bytes_per_query = n_docs * (8 + 4 * (len(self._fields) + 2))
+        return max(1, max_memory // bytes_per_query)
+
+    @property
+    def models(self) -> list:
+        return self._registry.names
+
+    def is_saved(self) -> bool:
+        return self._registry.is_saved()
+
+    def load_models(self, vacancy_df: pd.DataFrame = None) -> None:
+        """
+        Загрузка всех моделей в память и их прогрев.
+
+        Вызывается один раз при старте сервиса, после этого запросы
+        обслуживаются без обращения к диску.
+        """
+
+        self._registry.load(vacancy_df=vacancy_df)
+        self._check_ann(vacancy_df)
+        self.warm_up()
+
+    def warm_up(self) -> None:
+        """
+        Прогрев загруженных моделей (вызывается также в каждом рабочем процессе сервиса после fork).
+        """
+
+        # Прогрев: первый вызов подгружает ленивые ресурсы (nltk wordnet, словари pymorphy2),
+        # что небезопасно делать одновременно из нескольких потоков.
+        query = self._text_transformer.transform('прогрев модели warm up', split=False)
+        for name in self._registry.names:
+            for field, _ in self._fields:
+                model = self._registry.get(name, field)
+                model.get_similarity(model.transform(self._prepare_query(name, query)))
+            fused = self._registry.get_fused(name)
+            if fused is not None:
+                fused.get_similarity(fused.transform(self._prepare_query(name, query)))
+            if self._segments_enable:
+                # Список сегментов читается до обработки запросов (дальше его обновляет refresh).
+                self._get_segment_index(name)
+
+    def update(self, vacancy_df: pd.DataFrame) -> int:
+        """
+        Добавление новых вакансий в модели без полного переобучения (см. ModelRegistry.update).
+
+        :param vacancy_df: Датасет вакансий, новые вакансии добавлены в его конец.
+        :return: Количество добавленных вакансий.
+        """
+
+        return self._registry.update(vacancy_df)
+
+    def rebuild(self, vacancy_df: pd.DataFrame) -> None:
+        """
+        Полное переобучение моделей (см. ModelRegistry.rebuild), запущенный сервис
+        работает с текущими моделями, пока не будут сохранены новые.
+        """
 
-        return self._get_n_top(df, n_top=n_top)
+        self._registry.rebuild(vacancy_df)
+
+    def refresh(self) -> bool:
+        """
+        Перезагрузка моделей и списков сегментов, если они были обновлены на диске.
+        Вызывается фоновым потоком сервиса (см. RESTService), а не при обработке запросов.
+
+        :return: True если модели или сегменты были перезагружены.
+        """
+
+        refreshed = self._registry.refresh()
+        if refreshed:
+            self._check_ann()
+        for index in list(self._segment_indexes.values()):
+            refreshed = index.refresh() or refreshed
+        return refreshed
+
+    @property
+    def load_error(self):
+        """
+        Ошибка последней перезагрузки моделей или None если модели загружены успешно.
+        """
+
+        return self._registry.load_error
+
+    @property
+    def generation(self) -> int:
+        return self._registry.generation
+
+    def cache_stats(self) -> dict:
+        return self._cache.stats()
+
+    def _get_mask(self, vacancy_df: pd.DataFrame, filters: tuple):
+        """
+        Маска вакансий по фильтру, индекс фильтров строится один раз для датасета.
+
+        :return: Логический массив или None если фильтр пустой.
+        """
+
+        if not filters:
+            return None
+
+        df, filter_index = self._filter_index
+        if df is not vacancy_df:
+            filter_index = FilterIndex(vacancy_df)
+            self._filter_index = (vacancy_df, filter_index)
+        return filter_index.get_mask(filters)
+
+    def _calc_top_n_rows(self, name: str, vacancy_df: pd.DataFrame, tokens: str, rows: np.ndarray, n_top: int = 10):
+        """
+        Поиск N-топ вакансий среди вакансий rows (score вычисляется только для них).
+
+        :return: (номера вакансий, score)
+        """
+
+        score = self._calc_total_score(name, vacancy_df, tokens, rows=rows)
+        idx = Searcher._get_top_idx(score, n_top=n_top)
+        return rows[idx], score[idx]
+
+    def _get_segment_index(self, name: str) -> SegmentIndex:
+        index = self._segment_indexes.get(name)
+        if index is None:
+            index = SegmentIndex(
+                f'{self._working_dir}/data/segments/{name}',
+                fields=[field for field, _ in self._fields],
+                columns=self._segment_columns,
+                min_segment_size=self._min_segment_size)
+            index.refresh()
+            self._segment_indexes[name] = index
+        return index
+
+    def update_segments(self, vacancy_df: pd.DataFrame, max_age_days: int = None, names: list = None) -> None:
+        """
+        Обновление сегментов вакансий: вакансии, которых еще нет в индексе, добавляются новыми
+        сегментами (по дням публикации), сегменты старше max_age_days дней удаляются,
+        маленькие сегменты сливаются.
+
+        Матрицы сегментов строятся текущими (обученными) моделями, модели не меняются.
+
+        :param vacancy_df: Датасет вакансий (со столбцами токенов и столбцом 'day').
+        :param max_age_days: Срок хранения вакансий в днях, None - без ограничения.
+        :param names: Список моделей, по умолчанию все.
+        """
+
+        # Датасет мог быть разобран без части полей (например, без дня публикации,
+        # тогда вакансии считаются опубликованными сегодня).
+        missing = [column for column in self._segment_columns if column not in vacancy_df.columns]
+        if missing:
+            vacancy_df = vacancy_df.assign(**{column: '' for column in missing})
+
+        for name in names or self._registry.names:
+            index = self._get_segment_index(name)
+
+            n_added = index.add(
+                vacancy_df[~vacancy_df['id'].isin(index.ids)],
+                lambda field, rows: self._get_model(name, field, vacancy_df).transform_corpus(
+                    self._registry.get_corpus(name, field, rows)))
+            n_expired = index.expire(max_age_days) if max_age_days is not None else 0
+            n_merged = index.merge()
+            print(f'segments "{name}": {n_added} vacancies added, {n_expired} segments expired, '
+                  f'{n_merged} segments merged, {len(index.segments)} segments')
+
+    def delete_vacancies(self, ids: list) -> int:
+        """
+        Удаление вакансий из сегментов (вакансии исключаются из поиска без перестроения сегментов).
+
+        :return: Количество удаленных вакансий (по всем моделям).
+        """
+
+        return sum(self._get_segment_index(name).delete(ids) for name in self._registry.names)
+
+    def _search_segments(self,
+                         name: str,
+                         vacancy_df: pd.DataFrame,
+                         tokens: str,
+                         n_top: int = 10,
+                         filters: tuple = None) -> pd.DataFrame:
+        """
+        Поиск N-топ вакансий по сегментам.
+        """
+
+        models = {field: self._get_model(name, field, vacancy_df) for field, _ in self._fields}
+        targets = {field: model.transform(self._prepare_query(name, tokens)) for field, model in models.items()}
+
+        def score(segment, rows):
+            scores = {}
+            for field, model in models.items():
+                matrix = segment.get_matrix(field)
+                matrix = matrix if rows is None else matrix[rows]
+                scores[field] = np.asarray(model.get_similarity_matrix(targets[field], matrix), dtype=np.float64)
+            return Searcher._calc_score(scores, self._fields)
+
+        df = self._get_segment_index(name).search(score, n_top=n_top, filters=filters)
+        return df[['id', 'title', 'url', 'score']]
+
+    def _search_tokens(self,
+                       name: str,
+                       vacancy_df: pd.DataFrame,
+                       tokens: str,
+                       n_top: int = 10,
+                       filters: tuple = ()) -> pd.DataFrame:
+        """
+        Поиск N-топ вакансий по нормализованному запросу с кэшированием результатов.
+
+        Ключ кэша (модель, нормализованный запрос, n_top, фильтр), записи хранят версию моделей
+        и устаревают при перезагрузке моделей (см. ModelRegistry.refresh) и изменении сегментов модели.
+
+        :param tokens: Нормализованный запрос (результат TextTransformer.transform).
+        :param filters: Фильтр вакансий (результат FilterIndex.normalize_filters), score
+                        вычисляется только для вакансий, удовлетворяющих фильтру.
+        """
+
+        key = (name, tokens, n_top, filters)
+        version = self._registry.generation
+
+        index = None
+        if self._segments_enable:
+            index = self._get_segment_index(name)
+            version = (version, index.version)
+
+        df = self._cache.get(key, version=version)
+        if df is None:
+            top = None
+            if index is not None and index.segments:
+                df = self._search_segments(name, vacancy_df, tokens, n_top=n_top, filters=filters)
+            else:
+                mask = self._get_mask(vacancy_df, filters)
+                if mask is not None and mask.sum() <= len(mask) * self._filter_rows_ratio:
+                    # Фильтр оставляет мало вакансий: score вычисляется только для них.
+                    top = self._calc_top_n_rows(name, vacancy_df, tokens, np.flatnonzero(mask), n_top=n_top)
+                if top is None and self._index_enable:
+                    top = self._calc_top_n_index(name, vacancy_df, tokens, n_top=n_top, mask=mask)
+                if top is None and self._ann_active:
+                    top = self._calc_top_n_ann(name, vacancy_df, tokens, n_top=n_top, mask=mask)
+                if top is not None:
+                    df = Searcher._get_rows(vacancy_df, *top)
+                else:
+                    score = self._calc_total_score(name, vacancy_df, tokens)
+                    if mask is not None:
+                        # Фильтр оставляет много вакансий: score вычисляется по всей матрице (без копирования
+                        # строк), вакансии не из фильтра отбрасываются до выбора N-топ.
+                        score[~Searcher._resize_mask(mask, len(score))] = 0.0
+                    idx = Searcher._get_top_idx(score, n_top=n_top)
+                    df = Searcher._get_rows(vacancy_df, idx, score[idx])
+            self._cache.put(key, df, version=version)
+
+        return df
+
+    def _search_api(self,
+                    name: str,
+                    vacancy_df: pd.DataFrame,
+                    query: str,
+                    n_top: int = 10,
+                    filters: dict = None) -> pd.DataFrame:
+        """
+        Поиск N-топ вакансий с кэшированием результатов (см. _search_tokens).
+
+        :param filters: Фильтр вакансий (см. FilterIndex.get_mask).
+        """
+
+        tokens = self._text_transformer.transform(query, split=False)
+        filters = FilterIndex.normalize_filters(filters)
+        return self._search_tokens(name, vacancy_df, tokens, n_top=n_top, filters=filters).copy()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """
+        Пул потоков гибридного поиска. Пул создается заново в каждом процессе:
+        потоки родительского процесса не переживают fork (режим pre-fork сервиса).
+        """
+
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=2 * len(self._hybrid_weights),
+                                                    thread_name_prefix='hybrid')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _fuse(self, results: dict, n_top: int = 10, fusion: str = 'rrf') -> pd.DataFrame:
+        """
+        Объединение N-топ вакансий нескольких моделей.
+
+        - 'rrf' (reciprocal rank fusion): score = sum(1 / (k + rank)), rank - позиция вакансии
+          в результате модели (с 1);
+        - 'score': score = sum(score[i] * weight[i]), вакансия, отсутствующая в результате модели,
+          получает от нее 0.
+
+        :param results: Словарь {model: DataFrame} с N-топ вакансий моделей.
+        """
+
+        frames = []
+        for name, df in results.items():
+            if fusion == 'rrf':
+                score = 1.0 / (self._rrf_k + np.arange(1, len(df) + 1))
+            else:
+                score = df['score'].to_numpy() * self._hybrid_weights[name]
+            frames.append(df[['id', 'title', 'url']].assign(score=score))
+
+        df = pd.concat(frames, ignore_index=True)
+        df['score'] = df.groupby('id', sort=False)['score'].transform('sum')
+        df = df.drop_duplicates('id').sort_values('score', ascending=False, kind='stable')
+        return df.head(n_top).reset_index(drop=True)
+
+    def hybrid_api(self,
+                   vacancy_df: pd.DataFrame,
+                   query: str,
+                   n_top: int = 10,
+                   filters: dict = None,
+                   fusion: str = 'rrf') -> pd.DataFrame:
+        """
+        Гибридный поиск: запрос нормализуется один раз, модели Bag of Words, Tf-idf и Word2vec
+        выполняются параллельно в пуле потоков (вычисления NumPy/SciPy отпускают GIL),
+        результаты моделей объединяются (см. _fuse).
+
+        :param fusion: Способ объединения результатов: 'rrf' или 'score'.
+        """
+
+        if fusion not in ('rrf', 'score'):
+            raise ValueError(f'Unknown fusion "{fusion}"')
+
+        tokens = self._text_transformer.transform(query, split=False)
+        filters = FilterIndex.normalize_filters(filters)
+        depth = max(n_top, self._hybrid_depth)
+
+        executor = self._get_executor()
+        futures = {
+            name: executor.submit(self._search_tokens, name, vacancy_df, tokens, depth, filters)
+            for name in self._hybrid_weights
+        }
+        results = {name: future.result() for name, future in futures.items()}
+
+        return self._fuse(results, n_top=n_top, fusion=fusion)
+
+    def bow(self, vacancy_df: pd.DataFrame, query: str) -> None:
+        """
+        Модель "Bag of Words" в целом работает хорошо, но
+        может находить не совсем подходящие вакансии по описанию резюме.
+        """
+
+        print('Модель: Bag of Words')
+
+        scores = self._calc_field_scores('bow', vacancy_df, self._text_transformer.transform(query))
+
+        print()
+
+        self._print_stat(vacancy_df, scores)
+
+    def bow_api(self, vacancy_df: pd.DataFrame, query: str, n_top: int = 10, filters: dict = None) -> pd.DataFrame:
+        return self._search_api('bow', vacancy_df, query, n_top=n_top, filters=filters)
 
     def tfidf(self, vacancy_df: pd.DataFrame, query: str) -> None:
         """
@@ -126,58 +812,31 @@ class Searcher:
 
         print('Модель: Tf-idf')
 
-        df = vacancy_df.copy()
+        scores = self._calc_field_scores('tfidf', vacancy_df, self._text_transformer.transform(query))
 
-        for field, _ in self._fields:
-            tm_start = time.time()
+        print()
 
-            # Инициализация и обучение модели.
-            model = TfidfModel(smooth_idf=True, use_idf=True, ngram_range=(1, 2), max_features=20000)
-
-            # NOTE: При первом запуске происходит создание и кэширование модели (занимает некоторое время).
-            file_path = f'{self._working_dir}/data/model/tfidf/{field}.model'
-            if not os.path.isfile(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                # Подготовка данных для обучения модели.
-                corpus = df[f'{field}_tok'].tolist()
-                model.fit(corpus)
-                model.save(file_path)
-            else:
-                model.load(file_path)
+        self._print_stat(vacancy_df, scores)
 
-            # Подготовка запроса.
-            target = model.transform(self._text_transformer.transform(query, split=False))
+    def tfidf_api(self, vacancy_df: pd.DataFrame, query: str, n_top: int = 10, filters: dict = None) -> pd.DataFrame:
+        return self._search_api('tfidf', vacancy_df, query, n_top=n_top, filters=filters)
 
-            # Вычисление score для столбца field.
-            df[f'{field}_score'] = model.get_similarity(target)
+    def hashing(self, vacancy_df: pd.DataFrame, query: str) -> None:
+        """
+        Модель "Hashing" - Tf-idf по хэшам n-грамм без словаря и без ограничения количества
+        признаков, обучается за один проход по корпусу в ограниченной памяти.
+        """
 
-            tm_elapsed = time.time() - tm_start
-            print(f'time: {tm_elapsed:.06f} for "{field}_tok"')
+        print('Модель: Hashing')
 
-        print()
+        scores = self._calc_field_scores('hashing', vacancy_df, self._text_transformer.transform(query))
 
-        self._print_stat(df)
-
-    def tfidf_api(self, vacancy_df: pd.DataFrame, query: str, n_top: int = 10) -> pd.DataFrame:
-        df = vacancy_df.copy()
+        print()
 
-        for field, _ in self._fields:
-            tm_start = time.time()
-            model = TfidfModel(smooth_idf=True, use_idf=True, ngram_range=(1, 2), max_features=20000)
-            file_path = f'{self._working_dir}/data/model/tfidf/{field}.model'
-            if not os.path.isfile(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                corpus = df[f'{field}_tok'].tolist()
-                model.fit(corpus)
-                model.save(file_path)
-            else:
-                model.load(file_path)
-            target = model.transform(self._text_transformer.transform(query, split=False))
-            df[f'{field}_score'] = model.get_similarity(target)
-            tm_elapsed = time.time() - tm_start
-            print(f'time: {tm_elapsed:.06f} for "{field}_tok"')
+        self._print_stat(vacancy_df, scores)
 
-        return self._get_n_top(df, n_top=n_top)
+    def hashing_api(self, vacancy_df: pd.DataFrame, query: str, n_top: int = 10, filters: dict = None) -> pd.DataFrame:
+        return self._search_api('hashing', vacancy_df, query, n_top=n_top, filters=filters)
 
     def w2v(self, vacancy_df: pd.DataFrame, query: str) -> None:
         """
@@ -187,55 +846,44 @@ class Searcher:
 
         print('Модель: Word2vec')
 
-        df = vacancy_df.copy()
-
-        for field, _ in self._fields:
-            tm_start = time.time()
-
-            # Инициализация и обучение модели.
-            model = W2VModel(vector_size=512, window=5, min_count=1, workers=8, epochs=150)
-
-            # NOTE: При первом запуске происходит создание и кэширование модели (занимает некоторое время).
-            file_path = f'{self._working_dir}/data/model/w2v/{field}.model'
-            if not os.path.isfile(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                # Подготовка данных для обучения модели.
-                corpus = [w.split() for w in df[f'{field}_tok'].tolist()]
-                model.fit(corpus)
-                model.save(file_path)
-            else:
-                model.load(file_path)
+        scores = self._calc_field_scores('w2v', vacancy_df, self._text_transformer.transform(query))
 
-            # Подготовка запроса.
-            target = model.transform(self._text_transformer.transform(query, split=True))
+        print()
 
-            # Вычисление score для столбца field.
-            df[f'{field}_score'] = model.get_similarity(target)
+        self._print_stat(vacancy_df, scores)
 
-            tm_elapsed = time.time() - tm_start
-            print(f'time: {tm_elapsed:.06f} for "{field}_tok"')
+    def w2v_api(self, vacancy_df: pd.DataFrame, query: str, n_top: int = 10, filters: dict = None) -> pd.DataFrame:
+        return self._search_api('w2v', vacancy_df, query, n_top=n_top, filters=filters)
 
-        print()
+    def search_batch(self,
+                     vacancy_df: pd.DataFrame,
+                     queries: list,
+                     model: str,
+                     n_top: int = 10,
+                     chunk_size: int = None,
+                     max_memory: int = 256 * 2 ** 20) -> list:
+        """
+        Пакетный поиск вакансий для списка запросов.
+
+        :param vacancy_df: Датасет вакансий.
+        :param queries: Список запросов.
+        :param model: Название модели ('bow', 'tfidf', 'hashing', 'w2v').
+        :param n_top: Количество вакансий в ответе для каждого запроса.
+        :param chunk_size: Количество запросов обрабатываемых за одно матричное произведение,
+                           None - вычисляется по max_memory и количеству вакансий.
+        :param max_memory: Ограничение памяти (в байтах) под промежуточные матрицы score.
+        :return: Список DataFrame'ов (N-топ вакансий) в порядке следования запросов.
+        """
 
-        self._print_stat(df)
+        result = []
+        if chunk_size is None:
+            chunk_size = self._get_batch_chunk_size(model, vacancy_df, max_memory)
 
-    def w2v_api(self, vacancy_df: pd.DataFrame, query: str, n_top: int = 10) -> pd.DataFrame:
-        df = vacancy_df.copy()
+        for offset in range(0, len(queries), chunk_size):
+            score = self._calc_score_batch(model, vacancy_df, queries[offset:offset + chunk_size])
 
-        for field, _ in self._fields:
-            tm_start = time.time()
-            model = W2VModel(vector_size=512, window=5, min_count=1, workers=8, epochs=100)
-            file_path = f'{self._working_dir}/data/model/w2v/{field}.model'
-            if not os.path.isfile(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                corpus = [w.split() for w in df[f'{field}_tok'].tolist()]
-                model.fit(corpus)
-                model.save(file_path)
-            else:
-                model.load(file_path)
-            target = model.transform(self._text_transformer.transform(query, split=True))
-            df[f'{field}_score'] = model.get_similarity(target)
-            tm_elapsed = time.time() - tm_start
-            print(f'time: {tm_elapsed:.06f} for "{field}_tok"')
+            for row in score:
+                idx = Searcher._get_top_idx(row, n_top=n_top)
+                result.append(Searcher._get_rows(vacancy_df, idx, row[idx].astype(np.float64)))
 
-        return self._get_n_top(df, n_top=n_top)
+        return result
@@ -1,40 +1,140 @@
 import datetime
 import os
 import random
+import time
 
 import requests
 
+from requests.adapters import HTTPAdapter
+
+from src.api.RateController import RateController
+
+
+class HHApiError(Exception):
+    """
+    Ошибка запроса к hh.ru (после всех повторных попыток).
+    """
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class HHApi:
     """
     https://github.com/hhru/api
+
+    Все запросы выполняются через одну сессию requests с пулом соединений (keep-alive),
+    которая разделяется потоками загрузчиков. Ответы 429 и 5xx, а также сетевые ошибки
+    повторяются с экспоненциальной задержкой со случайной составляющей (jitter).
+    Частота и количество одновременных запросов ограничиваются RateController.
     """
 
-    def __init__(self, user_agents_file: str = None, verbose: bool = False):
+    # Коды ответа, при которых запрос повторяется.
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
+
+    def __init__(self,
+                 user_agents_file: str = None,
+                 verbose: bool = False,
+                 pool_size: int = 4,
+                 max_retries: int = 5,
+                 backoff_factor: float = 0.5,
+                 backoff_max: float = 30.0,
+                 rate_controller: RateController = None):
         """
-        :param user_agents_file:
+        :param user_agents_file: Файл со списком USER_AGENT (по одному в строке).
         :param verbose:
+        :param pool_size: Размер пула соединений (по количеству потоков загрузчиков).
+        :param max_retries: Количество повторных попыток запроса.
+        :param backoff_factor: Задержка перед первой повторной попыткой (в секундах), далее удваивается.
+        :param backoff_max: Максимальная задержка перед повторной попыткой (в секундах).
+        :param rate_controller: Ограничение частоты запросов, None - без ограничения.
         """
 
         self.user_agents_file = user_agents_file
         self.verbose = verbose
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.rate_controller = rate_controller
 
-    def __get_user_agent(self) -> str:
+        self._user_agents = self.__load_user_agents()
+
+        # Повторные попытки выполняются в __requests_get, адаптер только держит пул соединений.
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self._session = requests.Session()
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+    def close(self) -> None:
+        self._session.close()
+
+    def __load_user_agents(self) -> list:
         """
-        Загружает случайный USER_AGENT из файла,
+        Загружает список USER_AGENT из файла (один раз),
         если файл не определен или не найден возвращает значение по умолчанию.
 
         :return:
         """
 
+        user_agents = []
         if self.user_agents_file and os.path.isfile(self.user_agents_file):
-            user_agents = []
             with open(self.user_agents_file, mode='r', encoding='utf8') as fr:
                 for user_agent in fr:
-                    user_agents.append(user_agent.strip())
-            return random.choice(user_agents)
+                    user_agent = user_agent.strip()
+                    if user_agent:
+                        user_agents.append(user_agent)
+
+        return user_agents or [self.DEFAULT_USER_AGENT]
+
+    def __get_user_agent(self) -> str:
+        """
+        Случайный USER_AGENT.
+
+        :return:
+        """
 
-        return 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36'
+        return random.choice(self._user_agents)
+
+    def _get_backoff(self, attempt: int, res: requests.Response = None) -> float:
+        """
+        Задержка перед повторной попыткой: backoff_factor * 2^attempt (не больше backoff_max)
+        со случайной составляющей, для ответа 429 учитывается заголовок Retry-After.
+
+        :param attempt: Номер попытки (с 0).
+        :param res: Ответ сервера, None - сетевая ошибка.
+        :return:
+        """
+
+        backoff = min(self.backoff_max, self.backoff_factor * (2 ** attempt))
+        backoff = random.uniform(backoff / 2, backoff)
+
+        if res is not None:
+            retry_after = res.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                backoff = max(backoff, min(self.backoff_max, float(retry_after)))
+
+        return backoff
+
+    def _get(self, url, params=None, headers=None, timeout=15) -> requests.Response:
+        """
+        Один запрос через пул соединений с учетом ограничения частоты запросов.
+        """
+
+        if self.rate_controller is None:
+            return self._session.get(url, params=params, headers=headers, timeout=timeout)
+
+        self.rate_controller.acquire()
+        status_code = None
+        tm_start = time.monotonic()
+        try:
+            res = self._session.get(url, params=params, headers=headers, timeout=timeout)
+            status_code = res.status_code
+            return res
+        finally:
+            self.rate_controller.release(status_code, time.monotonic() - tm_start)
 
     def __requests_get(self, url, params=None, headers=None, timeout=15):
         """
@@ -44,24 +144,34 @@ class HHApi:
         :param params:
         :param headers:
         :param timeout:
-        :return:
+        :return: Ответ сервера (код 200).
+        :raises HHApiError: Сервер вернул ошибку или запрос не удался после всех повторных попыток.
         """
 
-        try:
-            res = requests.get(url, params=params, headers=headers, timeout=timeout)
+        for attempt in range(self.max_retries + 1):
+            res = None
+            try:
+                res = self._get(url, params=params, headers=headers, timeout=timeout)
 
-            if self.verbose:
-                print(f'[TRACE] {res.url}')
+                if self.verbose:
+                    print(f'[TRACE] {res.url}')
 
-            if 200 != res.status_code:
-                print(f"Can't load data from URL {url}, err={res.status_code}")
-                return None
+                if 200 == res.status_code:
+                    return res
 
-            return res
-        except Exception as err:
-            print("err: " + str(err))
+                if res.status_code not in self.RETRY_STATUS_CODES:
+                    raise HHApiError(f"Can't load data from URL {url}, err={res.status_code}", res.status_code)
+
+                error = HHApiError(f"Can't load data from URL {url}, err={res.status_code}", res.status_code)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as err:
+                error = HHApiError(f"Can't load data from URL {url}, err={err}")
+
+            if attempt < self.max_retries:
+                backoff = self._get_backoff(attempt, res)
+                print(f'{error}, retry in {backoff:.1f} sec')
+                time.sleep(backoff)
 
-        return None
+        raise error
 
     def get_professional_roles(self):
         """
@@ -2,6 +2,37 @@
 Общие настройки для скачивания данных с сайта "hh.ru".
 """
 
+# CRAWL
+# ==========
+
+# Максимальное количество одновременных запросов к hh.ru (для всех запросов вакансий и резюме вместе).
+HH_CRAWL_CONCURRENCY = 4
+
+# Размер очереди ID вакансий и резюме, ожидающих загрузки.
+HH_CRAWL_QUEUE_SIZE = 1000
+
+# Состояние скачивания (см. CrawlState): время (в секундах), в течение которого скачанная
+# страница выдачи не запрашивается повторно, и максимальное количество попыток скачивания
+# вакансии (резюме), после которого документ больше не скачивается.
+HH_CRAWL_PAGE_TTL = 3600
+HH_CRAWL_MAX_ATTEMPTS = 5
+
+# Адаптивное ограничение частоты запросов (см. RateController): начальное, минимальное и
+# максимальное количество запросов в секунду, начальное количество одновременных запросов
+# (максимальное - HH_CRAWL_CONCURRENCY).
+HH_RATE = 1.5
+HH_RATE_MIN = 0.2
+HH_RATE_MAX = 10.0
+HH_RATE_CONCURRENCY = 2
+
+# Увеличение частоты запросов после успешного ответа и коэффициент уменьшения
+# частоты и количества одновременных запросов при ответах 429/403.
+HH_RATE_INCREASE = 0.1
+HH_RATE_DECREASE = 0.5
+
+# Время ответа (в секундах), при превышении которого частота запросов уменьшается.
+HH_RATE_LATENCY_THRESHOLD = 3.0
+
 # VACANCY
 # ==========
 
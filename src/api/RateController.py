@@ -0,0 +1,132 @@
+import time
+
+from threading import Condition
+
+
+class RateController:
+    """
+    Адаптивное ограничение частоты запросов к hh.ru.
+
+    Запросы ограничиваются ведром токенов (rate запросов в секунду) и количеством
+    одновременных запросов (concurrency). Оба ограничения подстраиваются по схеме AIMD:
+    - успешный быстрый ответ - аддитивное увеличение rate (на increase) и concurrency
+      (на 1 после concurrency успешных ответов подряд);
+    - ответ 429/403 (hh.ru ограничивает запросы), ответ 5xx, сетевая ошибка или ответ
+      медленнее latency_threshold секунд - мультипликативное уменьшение (в decrease раз),
+      не чаще одного раза в cooldown секунд, чтобы серия ошибок от уже отправленных
+      запросов не сбросила ограничения до минимума.
+
+    Один экземпляр разделяется всеми потоками загрузчиков (через HHApi).
+    """
+
+    # Коды ответа, означающие что hh.ru ограничивает запросы.
+    THROTTLE_STATUS_CODES = (403, 429)
+
+    def __init__(self,
+                 rate: float = 1.5,
+                 min_rate: float = 0.2,
+                 max_rate: float = 10.0,
+                 concurrency: int = 2,
+                 min_concurrency: int = 1,
+                 max_concurrency: int = 4,
+                 increase: float = 0.1,
+                 decrease: float = 0.5,
+                 latency_threshold: float = 3.0,
+                 cooldown: float = 2.0):
+        """
+        :param rate: Начальное количество запросов в секунду.
+        :param min_rate: Минимальное количество запросов в секунду.
+        :param max_rate: Максимальное количество запросов в секунду.
+        :param concurrency: Начальное количество одновременных запросов.
+        :param min_concurrency: Минимальное количество одновременных запросов.
+        :param max_concurrency: Максимальное количество одновременных запросов.
+        :param increase: Увеличение rate после успешного ответа.
+        :param decrease: Коэффициент уменьшения rate и concurrency при ограничении запросов.
+        :param latency_threshold: Время ответа (в секундах), больше которого сервер считается перегруженным.
+        :param cooldown: Минимальный интервал (в секундах) между уменьшениями.
+        """
+
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._min_concurrency = min_concurrency
+        self._max_concurrency = max_concurrency
+        self._increase = increase
+        self._decrease = decrease
+        self._latency_threshold = latency_threshold
+        self._cooldown = cooldown
+
+        self._rate = min(max(rate, min_rate), max_rate)
+        self._concurrency = min(max(concurrency, min_concurrency), max_concurrency)
+
+        self._cond = Condition()
+        self._active = 0
+        self._successes = 0
+        # Токены не накапливаются больше чем на одну секунду (ограничение всплеска запросов).
+        self._tokens = 1.0
+        self._time = time.monotonic()
+        self._decrease_time = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def concurrency(self) -> int:
+        return self._concurrency
+
+    def acquire(self) -> None:
+        """
+        Ожидание разрешения на запрос (свободное место среди одновременных запросов и токен).
+        После запроса обязательно вызывается release().
+        """
+
+        with self._cond:
+            while self._active >= self._concurrency:
+                self._cond.wait()
+            self._active += 1
+
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                self._tokens = min(max(self._rate, 1.0), self._tokens + (now - self._time) * self._rate)
+                self._time = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                delay = (1.0 - self._tokens) / self._rate
+            time.sleep(delay)
+
+    def release(self, status_code: int = None, latency: float = None) -> None:
+        """
+        Завершение запроса и подстройка ограничений по результату запроса.
+
+        :param status_code: Код ответа, None - сетевая ошибка.
+        :param latency: Время ответа в секундах.
+        """
+
+        with self._cond:
+            self._active -= 1
+
+            congested = (status_code is None
+                         or status_code in self.THROTTLE_STATUS_CODES
+                         or status_code >= 500
+                         or (latency is not None and latency > self._latency_threshold))
+
+            if congested:
+                self._successes = 0
+                now = time.monotonic()
+                if now - self._decrease_time >= self._cooldown:
+                    self._decrease_time = now
+                    self._rate = max(self._min_rate, self._rate * self._decrease)
+                    self._concurrency = max(self._min_concurrency, int(self._concurrency * self._decrease))
+            elif status_code < 400:
+                self._rate = min(self._max_rate, self._rate + self._increase)
+                self._successes += 1
+                if self._successes >= self._concurrency:
+                    self._successes = 0
+                    self._concurrency = min(self._max_concurrency, self._concurrency + 1)
+
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {'rate': self._rate, 'concurrency': self._concurrency}
@@ -0,0 +1,176 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from src.loader.CrawlState import CrawlState
+
+
+class CrawlQuery:
+    """
+    Поисковый запрос для CrawlEngine: страницы поисковой выдачи и загрузка найденных документов.
+    """
+
+    def __init__(self,
+                 kind: str,
+                 load_page: Callable[[int], tuple],
+                 load_item: Callable[[str], None],
+                 max_page: int = None,
+                 key: str = None):
+        """
+        :param kind: Тип документов ('vacancy', 'resume'), ID документов уникальны в пределах типа.
+        :param load_page: Функция загрузки страницы выдачи page -> (список ID документов, есть ли следующая страница).
+                          При ошибке загрузки функция выбрасывает исключение.
+        :param load_item: Функция загрузки документа по ID. При ошибке загрузки функция выбрасывает исключение.
+        :param max_page: Сколько скачать страниц, None - все страницы.
+        :param key: Ключ запроса в CrawlState (тип, дата и параметры запроса), None - страницы выдачи не сохраняются.
+        """
+
+        self.kind = kind
+        self.load_page = load_page
+        self.load_item = load_item
+        self.max_page = max_page
+        self.key = key
+
+
+class CrawlEngine:
+    """
+    Конвейер скачивания на asyncio.
+
+    Страницы выдачи всех запросов загружаются параллельно, ID документов сразу попадают
+    в общую ограниченную очередь, которую непрерывно разбирают загрузчики документов,
+    поэтому загрузка следующей страницы выдачи не ждет загрузки документов предыдущей.
+    Количество одновременных запросов ограничено для всех запросов вместе, документы,
+    найденные несколькими запросами, загружаются один раз.
+
+    Функции загрузки синхронные (HHApi), они выполняются в пуле потоков.
+
+    Если задано состояние скачивания (CrawlState), то повторный запуск продолжает с места остановки:
+    сохраненные страницы выдачи не запрашиваются, уже скачанные документы отбрасываются до постановки
+    в очередь (одним запросом к базе на страницу), документы с ошибками скачиваются повторно.
+    """
+
+    def __init__(self,
+                 max_concurrency: int = 4,
+                 queue_size: int = 1000,
+                 log: Callable[[str], None] = print,
+                 state: CrawlState = None):
+        """
+        :param max_concurrency: Максимальное количество одновременных запросов.
+        :param queue_size: Размер очереди ID документов (загрузка страниц выдачи приостанавливается,
+                           если загрузчики документов не успевают).
+        :param log: Функция вывода сообщений.
+        :param state: Состояние скачивания, None - состояние не сохраняется.
+        """
+
+        self._max_concurrency = max_concurrency
+        self._queue_size = queue_size
+        self._log = log
+        self._state = state
+
+    def run(self, queries: list) -> dict:
+        """
+        Выполнение запросов.
+
+        :param queries: Список запросов CrawlQuery.
+        :return: Статистика {'pages': ..., 'cached_pages': ..., 'items': ..., 'skipped': ...,
+                 'duplicates': ..., 'errors': ...}.
+        """
+
+        return asyncio.run(self._run(queries))
+
+    async def _run(self, queries: list) -> dict:
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self._queue_size)
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+        state = self._state
+        seen = set()
+        stats = {'pages': 0, 'cached_pages': 0, 'items': 0, 'skipped': 0, 'duplicates': 0, 'errors': 0}
+
+        executor = ThreadPoolExecutor(max_workers=self._max_concurrency, thread_name_prefix='crawl')
+
+        async def call(func, *args):
+            async with semaphore:
+                return await loop.run_in_executor(executor, func, *args)
+
+        async def put(query: CrawlQuery, item_ids: list):
+            if state is not None:
+                pending = state.get_pending(query.kind, item_ids)
+                stats['skipped'] += len(item_ids) - len(pending)
+                item_ids = pending
+
+            for item_id in item_ids:
+                key = (query.kind, item_id)
+                if key in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add(key)
+                await queue.put((query, item_id))
+
+        async def produce(query: CrawlQuery):
+            use_state = state is not None and query.key is not None
+            page = 0
+            while (query.max_page is None) or (query.max_page >= (page + 1)):
+                result = state.get_page(query.key, page) if use_state else None
+                if result is not None:
+                    stats['cached_pages'] += 1
+                else:
+                    try:
+                        result = await call(query.load_page, page)
+                    except Exception as err:
+                        self._log(f'err: {err}')
+                        stats['errors'] += 1
+                        if use_state:
+                            state.set_page(query.key, page, error=str(err))
+                        break
+
+                    stats['pages'] += 1
+                    if use_state:
+                        state.set_page(query.key, page, *result)
+
+                item_ids, has_next = result
+                await put(query, item_ids)
+
+                if not has_next:
+                    break
+                page += 1
+
+        async def produce_failed(query: CrawlQuery):
+            # Документы, которые не скачались при предыдущих запусках (и могли пропасть из выдачи).
+            await put(query, state.get_failed(query.kind))
+
+        async def consume():
+            while True:
+                query, item_id = await queue.get()
+                try:
+                    await call(query.load_item, item_id)
+                    stats['items'] += 1
+                    if state is not None:
+                        state.set_item(query.kind, item_id)
+                except Exception as err:
+                    self._log(f'err: {err}')
+                    stats['errors'] += 1
+                    if state is not None:
+                        state.set_item(query.kind, item_id, error=str(err))
+                finally:
+                    queue.task_done()
+
+        producers = [produce(query) for query in queries]
+        if state is not None:
+            # Один запрос на тип документов, которым загружаются документы с ошибками.
+            producers += [produce_failed(query) for query in {query.kind: query for query in queries}.values()]
+
+        workers = [asyncio.create_task(consume()) for _ in range(self._max_concurrency)]
+        try:
+            await asyncio.gather(*producers)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            executor.shutdown(wait=True)
+
+        self._log(f'crawl: {stats["pages"]} pages ({stats["cached_pages"]} cached), '
+                  f'{stats["items"]} items ({stats["skipped"]} skipped), '
+                  f'{stats["duplicates"]} duplicates, {stats["errors"]} errors')
+        return stats
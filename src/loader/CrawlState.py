@@ -0,0 +1,158 @@
+import json
+import os
+import sqlite3
+import time
+
+from threading import Lock
+
+
+class CrawlState:
+    """
+    Состояние скачивания (SQLite), общее для загрузчиков вакансий и резюме.
+
+    Для каждой страницы выдачи хранятся ID найденных документов и признак следующей страницы,
+    для каждого документа - статус ('done', 'failed'), количество неудачных попыток, время последней
+    попытки и текст ошибки. Это позволяет после сбоя продолжить скачивание с места остановки:
+    скачанные страницы выдачи не запрашиваются повторно (в течение page_ttl секунд),
+    скачанные документы пропускаются одним запросом к базе, повторяются только ошибки.
+    """
+
+    def __init__(self, file_path: str, page_ttl: float = 3600.0, max_attempts: int = 5):
+        """
+        :param file_path: Путь к файлу базы.
+        :param page_ttl: Время (в секундах), в течение которого скачанная страница выдачи не запрашивается повторно.
+        :param max_attempts: Максимальное количество попыток скачивания документа.
+        """
+
+        self._file_path = file_path
+        self._page_ttl = page_ttl
+        self._max_attempts = max_attempts
+        self._lock = Lock()
+        self._conn = None
+        self._pid = None
+
+    def _get_connection(self):
+        """
+        Соединение с SQLite создается отдельно в каждом процессе (после fork соединение не наследуется).
+        """
+
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+            self._conn = sqlite3.connect(self._file_path, timeout=60, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'query TEXT NOT NULL, page INTEGER NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, '
+                'fetched_at REAL NOT NULL, error TEXT, item_ids TEXT, has_next INTEGER, '
+                'PRIMARY KEY (query, page)) WITHOUT ROWID')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS items ('
+                'kind TEXT NOT NULL, id TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL, '
+                'fetched_at REAL NOT NULL, error TEXT, '
+                'PRIMARY KEY (kind, id)) WITHOUT ROWID')
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def get_page(self, query: str, page: int):
+        """
+        Результат скачанной страницы выдачи.
+
+        :param query: Ключ запроса (см. CrawlQuery.key).
+        :return: (список ID документов, есть ли следующая страница) или None если страницу нужно скачать.
+        """
+
+        with self._lock:
+            row = self._get_connection().execute(
+                'SELECT item_ids, has_next, fetched_at FROM pages WHERE query = ? AND page = ? AND status = ?',
+                (query, page, 'done')).fetchone()
+
+        if row is None or (self._page_ttl is not None and time.time() - row[2] > self._page_ttl):
+            return None
+        return json.loads(row[0]), bool(row[1])
+
+    def set_page(self, query: str, page: int, item_ids: list = None, has_next: bool = False, error: str = None) -> None:
+        """
+        Сохранение результата скачивания страницы выдачи.
+
+        :param error: Текст ошибки, None - страница скачана.
+        """
+
+        with self._lock:
+            conn = self._get_connection()
+            conn.execute(
+                'INSERT INTO pages (query, page, status, attempts, fetched_at, error, item_ids, has_next) '
+                'VALUES (?, ?, ?, 1, ?, ?, ?, ?) '
+                'ON CONFLICT (query, page) DO UPDATE SET status = excluded.status, attempts = attempts + 1, '
+                'fetched_at = excluded.fetched_at, error = excluded.error, '
+                'item_ids = excluded.item_ids, has_next = excluded.has_next',
+                (query, page, 'failed' if error else 'done', time.time(), error,
+                 json.dumps(item_ids or []), int(has_next)))
+            conn.commit()
+
+    def get_pending(self, kind: str, item_ids: list, chunk_size: int = 500) -> list:
+        """
+        ID документов, которые нужно скачать: документы, которые еще не скачивались
+        или не скачались, но количество попыток меньше max_attempts.
+
+        :param kind: Тип документов ('vacancy', 'resume').
+        :param item_ids: Список ID документов.
+        :return: Список ID в исходном порядке.
+        """
+
+        skip = set()
+
+        with self._lock:
+            conn = self._get_connection()
+            for start in range(0, len(item_ids), chunk_size):
+                chunk = item_ids[start:start + chunk_size]
+                rows = conn.execute(
+                    f'SELECT id FROM items WHERE kind = ? AND id IN ({",".join("?" * len(chunk))}) AND '
+                    f'(status = ? OR attempts >= ?)',
+                    (kind, *chunk, 'done', self._max_attempts))
+                skip.update(row[0] for row in rows)
+
+        return [item_id for item_id in item_ids if item_id not in skip]
+
+    def get_failed(self, kind: str) -> list:
+        """
+        ID документов, которые не скачались и для которых еще остались попытки.
+        """
+
+        with self._lock:
+            rows = self._get_connection().execute(
+                'SELECT id FROM items WHERE kind = ? AND status = ? AND attempts < ?',
+                (kind, 'failed', self._max_attempts))
+            return [row[0] for row in rows]
+
+    def set_item(self, kind: str, item_id: str, error: str = None) -> None:
+        """
+        Сохранение результата скачивания документа.
+        Количество попыток (attempts) считает неудачные попытки подряд и сбрасывается после успешной.
+
+        :param error: Текст ошибки, None - документ скачан.
+        """
+
+        with self._lock:
+            conn = self._get_connection()
+            conn.execute(
+                'INSERT INTO items (kind, id, status, attempts, fetched_at, error) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (kind, id) DO UPDATE SET status = excluded.status, '
+                'attempts = CASE WHEN excluded.attempts = 0 THEN 0 ELSE attempts + 1 END, '
+                'fetched_at = excluded.fetched_at, error = excluded.error',
+                (kind, item_id, 'failed' if error else 'done', 1 if error else 0, time.time(), error))
+            conn.commit()
+
+    def stats(self) -> dict:
+        """
+        Количество страниц и документов по статусам.
+        """
+
+        with self._lock:
+            conn = self._get_connection()
+            stats = {}
+            for table in ('pages', 'items'):
+                for status, count in conn.execute(f'SELECT status, COUNT(*) FROM {table} GROUP BY status'):
+                    stats[f'{table}_{status}'] = count
+            return stats
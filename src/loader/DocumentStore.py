@@ -0,0 +1,179 @@
+import os
+import struct
+import zlib
+
+from threading import Lock
+
+
+class DocumentStore:
+    """
+    Хранилище исходных документов (описания вакансий и резюме).
+
+    Документы сжимаются (zlib) и дописываются в конец файлов-сегментов большого размера
+    вместо отдельного файла на каждый документ. Расположение документов хранится в
+    индексе ID -> (сегмент, смещение, длина), который тоже только дописывается и
+    целиком читается в память при открытии хранилища: проверка наличия документа и
+    чтение документа по ID не обращаются к файловой системе (кроме чтения самой записи).
+
+    Повторная запись документа добавляет новую запись, действующей считается последняя.
+    Запись выполняет один процесс (потоки загрузчиков разделяют один экземпляр хранилища),
+    читать хранилище могут несколько процессов одновременно.
+
+    Формат записи сегмента: <длина ID: uint32><длина данных: uint32><ID: utf-8><данные: zlib>.
+    Формат индекса 'index.tsv': строка "<ID>\\t<сегмент>\\t<смещение>\\t<длина>" на каждую запись.
+    """
+
+    _HEADER = struct.Struct('<II')
+
+    def __init__(self, dir_path: str, max_segment_size: int = 256 * 1024 * 1024, level: int = 6):
+        """
+        :param dir_path: Директория хранилища.
+        :param max_segment_size: Размер сегмента (в байтах), после которого записи пишутся в новый сегмент.
+        :param level: Уровень сжатия zlib.
+        """
+
+        self.dir_path = dir_path
+        self._max_segment_size = max_segment_size
+        self._level = level
+        self._lock = Lock()
+        self._index = {}
+        self._segment = 0
+        # Размер прочитанной (целой) части индекса, см. _repair_index().
+        self._index_size = None
+
+        self._load_index()
+
+    def _get_segment_path(self, segment: int) -> str:
+        return f'{self.dir_path}/{segment:06d}.seg'
+
+    def _load_index(self) -> None:
+        file_path = f'{self.dir_path}/index.tsv'
+        if not os.path.isfile(file_path):
+            return
+
+        size = 0
+        with open(file_path, mode='rb') as fr:
+            for line in fr:
+                if not line.endswith(b'\n'):
+                    break
+                size += len(line)
+                doc_id, segment, offset, length = line.decode('utf-8').rstrip('\n').split('\t')
+                self._index[doc_id] = (int(segment), int(offset), int(length))
+                self._segment = max(self._segment, int(segment))
+
+        self._index_size = size
+
+    def _repair_index(self) -> None:
+        """
+        Последняя строка индекса могла быть записана не полностью (сбой во время записи),
+        перед первой записью она удаляется.
+        """
+
+        file_path = f'{self.dir_path}/index.tsv'
+        if self._index_size is not None and os.path.getsize(file_path) != self._index_size:
+            with open(file_path, mode='r+b') as fw:
+                fw.truncate(self._index_size)
+        self._index_size = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(f'{self.dir_path}/index.tsv')
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_ids(self) -> list:
+        """
+        ID документов в порядке их расположения в сегментах (порядок последовательного чтения).
+        """
+
+        return sorted(self._index.keys(), key=self._index.get)
+
+    def get_location(self, doc_id: str) -> list:
+        """
+        Расположение действующей записи документа [сегмент, смещение], меняется при повторной записи.
+        """
+
+        segment, offset, _ = self._index[doc_id]
+        return [segment, offset]
+
+    def put(self, doc_id: str, data) -> None:
+        """
+        Запись документа.
+
+        :param doc_id: ID документа.
+        :param data: Содержимое документа (str или bytes).
+        """
+
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        id_bytes = doc_id.encode('utf-8')
+        payload = zlib.compress(data, self._level)
+        record = self._HEADER.pack(len(id_bytes), len(payload)) + id_bytes + payload
+
+        with self._lock:
+            os.makedirs(self.dir_path, exist_ok=True)
+            self._repair_index()
+
+            segment_path = self._get_segment_path(self._segment)
+            offset = os.path.getsize(segment_path) if os.path.isfile(segment_path) else 0
+            if offset >= self._max_segment_size:
+                self._segment += 1
+                segment_path = self._get_segment_path(self._segment)
+                offset = 0
+
+            # Сначала запись документа, затем строка индекса: при сбое между ними
+            # остается только неиспользуемая запись в сегменте.
+            with open(segment_path, mode='ab') as fw:
+                fw.write(record)
+            with open(f'{self.dir_path}/index.tsv', mode='a', encoding='utf8') as fw:
+                fw.write(f'{doc_id}\t{self._segment}\t{offset}\t{len(record)}\n')
+
+            self._index[doc_id] = (self._segment, offset, len(record))
+
+    def _read_record(self, fr, offset: int, length: int) -> bytes:
+        fr.seek(offset)
+        record = fr.read(length)
+        id_length, data_length = self._HEADER.unpack_from(record)
+        start = self._HEADER.size + id_length
+        return zlib.decompress(record[start:start + data_length])
+
+    def get(self, doc_id: str) -> bytes:
+        """
+        Чтение документа по ID.
+
+        :raises KeyError: Документ не найден.
+        """
+
+        segment, offset, length = self._index[doc_id]
+        with open(self._get_segment_path(segment), mode='rb') as fr:
+            return self._read_record(fr, offset, length)
+
+    def scan(self, doc_ids: list = None):
+        """
+        Последовательное чтение документов.
+
+        Документы читаются в указанном порядке, для каждого сегмента файл открывается один раз,
+        поэтому для ID в порядке get_ids() чтение последовательное.
+
+        :param doc_ids: Список ID документов, по умолчанию все документы (в порядке get_ids()).
+        :return: Итератор (ID, содержимое документа).
+        """
+
+        fr = None
+        fr_segment = None
+        try:
+            for doc_id in (self.get_ids() if doc_ids is None else doc_ids):
+                segment, offset, length = self._index[doc_id]
+                if segment != fr_segment:
+                    if fr is not None:
+                        fr.close()
+                    fr = open(self._get_segment_path(segment), mode='rb')
+                    fr_segment = segment
+                yield doc_id, self._read_record(fr, offset, length)
+        finally:
+            if fr is not None:
+                fr.close()
@@ -1,21 +1,23 @@
-import concurrent
 import hashlib
+import json
 import os
 import re
-import time
 
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from bs4 import BeautifulSoup
 
-from src import Utils
 from src.api.HHApi import HHApi
+from src.loader.CrawlEngine import CrawlEngine, CrawlQuery
 from src.loader.DataLoader import DataLoader
+from src.loader.DocumentStore import DocumentStore
+from src.parser.HtmlExtractor import HtmlExtractor
 
 
 class ResumeLoader(DataLoader):
     """
     Класс загружает и кэширует на диске описания резюме.
+
+    Страницы резюме сохраняются в хранилище документов '/data/resume.store' (см. DocumentStore),
+    резюме, сохраненные предыдущей версией отдельными файлами в '/data/resume', повторно не скачиваются.
     """
 
     def __init__(self,
@@ -33,18 +35,18 @@ class ResumeLoader(DataLoader):
         super().__init__(threadpool_enable, threadpool_max_workers)
         self._hh = hh
         self._working_dir = working_dir
+        self._store = DocumentStore(f'{working_dir}/data/resume.store')
+        self._html_extractor = HtmlExtractor()
 
-    def _get_total_pages(self, html: str) -> int:
+    def _get_total_pages(self, pager_hrefs: list) -> int:
         """
         Метод возвращает общее количество страниц.
+
+        :param pager_hrefs: Ссылки пейджера страницы поисковой выдачи.
         """
 
-        bs = BeautifulSoup(html, 'html.parser')
-        elements = bs.select('div[class="pager"] a[href^="/search/resume"]')
         pages = set()
-        for element in elements:
-            # Получить ID из URL резюме.
-            href_attr = element['href']
+        for href_attr in pager_hrefs:
             # Получить список параметров ключ=значение из URL резюме.
             result = re.findall(pattern=r'[\?&]{1}([0-9_a-z]+)=([0-9_a-z]+)',
                                 string=href_attr,
@@ -61,6 +63,24 @@ class ResumeLoader(DataLoader):
         except:
             return 0
 
+    def get_query(self, text: str, max_page: int = None, **kwargs) -> CrawlQuery:
+        """
+        Запрос резюме для CrawlEngine.
+
+        :param text: Ключевые слова в названии резюме.
+        :param max_page: Сколько скачать страниц, по умолчанию качаем все.
+        :param kwargs: Данный параметр хранит настройки для вызова метода HHApi.get_resume_list().
+        :return:
+        """
+
+        dt = datetime.now().strftime('%Y%m%d')
+        return CrawlQuery(
+            kind='resume',
+            load_page=lambda page: self._load_page(text, page, dt, **kwargs),
+            load_item=self._load_resume,
+            max_page=max_page,
+            key=f'resume:{dt}:{json.dumps(dict(kwargs, text=text), ensure_ascii=False, sort_keys=True)}')
+
     def load(self, text: str, max_page: int = None, **kwargs) -> None:
         """
         Скачивание резюме.
@@ -72,62 +92,49 @@ class ResumeLoader(DataLoader):
         :return:
         """
 
-        dt = datetime.now().strftime('%Y%m%d')
-        page = 0
-        total_pages = -1
-
-        while (max_page is None) or (max_page >= (page + 1)):
-            html = ''
-            file_path = f'{self._working_dir}/data/resume_pages/{dt}/rp_{page:06d}_{dt}.html'
-            self._log(file_path)
-
-            if not os.path.isfile(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-            try:
-                html = self._hh.get_resume_list(text, page=page, **kwargs)
-                with open(file_path, mode='w', encoding='utf8') as fw:
-                    fw.write(html)
-            except Exception as e:
-                self._log(str(e))
-
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-
-            if total_pages == -1:
-                # Получить количество страниц (запрашиваем один раз).
-                total_pages = self._get_total_pages(html)
-
-            # Подготовка к скачиванию резюме.
-            resume_ids = self._get_resume_ids(html)
-
-            if self.threadpool_enable:
-                # Загрузка описания резюме в несколько потоков.
-                with ThreadPoolExecutor(max_workers=self.threadpool_max_workers) as pool:
-                    futures = []
-                    for resume_id in resume_ids:
-                        futures.append(pool.submit(self._load_resume, resume_id))
-                    concurrent.futures.wait(futures)
-            else:
-                # Скачать список резюме.
-                for resume_id in resume_ids:
-                    self._load_resume(resume_id=resume_id)
-
-            # Обновление счетчиков и проверка условия выхода из бесконечного цикла.
-
-            if page > total_pages:
-                break
-
-            page += 1
-
-    def _get_resume_ids(self, resume_html: str):
+        engine = CrawlEngine(
+            max_concurrency=self.threadpool_max_workers if self.threadpool_enable else 1,
+            log=self._log)
+        engine.run([self.get_query(text, max_page=max_page, **kwargs)])
+
+    def _load_page(self, text: str, page: int, dt: str, **kwargs) -> tuple:
+        """
+        Загрузка страницы поисковой выдачи резюме.
+
+        :param text: Ключевые слова в названии резюме.
+        :param page: Номер страницы.
+        :param dt: Дата загрузки (директория страниц).
+        :return: (список ID резюме, есть ли следующая страница).
+        :raises Exception: Ошибка загрузки страницы.
+        """
+
+        file_path = f'{self._working_dir}/data/resume_pages/{dt}/rp_{page:06d}_{dt}.html'
+        self._log(file_path)
+
+        if not os.path.isfile(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        try:
+            html = self._hh.get_resume_list(text, page=page, **kwargs)
+            with open(file_path, mode='w', encoding='utf8') as fw:
+                fw.write(html)
+        except Exception:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+            raise
+
+        # Ссылки пейджера и ссылки на резюме выбираются за один разбор страницы (см. HtmlExtractor).
+        pager_hrefs, resume_hrefs = self._html_extractor.select(
+            html, selectors=[HtmlExtractor.PAGER_LINKS, HtmlExtractor.RESUME_LINKS], attr='href')
+
+        # Пейджер страницы содержит ссылки на следующие страницы, если они есть.
+        return self._get_resume_ids(resume_hrefs), page < self._get_total_pages(pager_hrefs)
+
+    def _get_resume_ids(self, resume_hrefs: list):
         resume_ids = []
-        bs = BeautifulSoup(resume_html, 'html.parser')
-        # Поиск ссылок на резюме и подготовка списка ID резюме.
-        elements = bs.select('main[class="resume-serp-content"] a[href^="/resume/"]')
-        for element in elements:
+        # Подготовка списка ID резюме по ссылкам на резюме.
+        for href_attr in resume_hrefs:
             # Получить ID резюме.
-            href_attr = element['href']
             resume_id = href_attr[href_attr.rindex('/') + 1:href_attr.index('?')]
             resume_ids.append(resume_id)
         return resume_ids
@@ -138,26 +145,16 @@ class ResumeLoader(DataLoader):
 
         :param resume_id:
         :return:
+        :raises Exception: Ошибка загрузки резюме.
         """
         resume_id_hash = hashlib.md5(resume_id.encode('utf-8')).hexdigest()
         file_path = f'{self._working_dir}/data/resume/{resume_id_hash[:2]}/{resume_id}.html'
 
-        if not os.path.isfile(file_path):
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-            try:
-                self._log(f'trying to download resume ID={resume_id}')
-                resume = self._hh.get_resume(resume_id=resume_id)
-
-                # Сохранить резюме.
-                with open(file_path, mode='w', encoding='utf8') as fw:
-                    fw.write(resume)
-
-                time.sleep(Utils.get_random_sleep(0.0, 0.1))
-            except Exception as e:
-                self._log(str(e))
+        if resume_id not in self._store and not os.path.isfile(file_path):
+            self._log(f'trying to download resume ID={resume_id}')
+            resume = self._hh.get_resume(resume_id=resume_id)
 
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
+            # Сохранить резюме.
+            self._store.put(resume_id, resume)
         else:
             self._log(f'Resume ID={resume_id} already exists')
@@ -1,20 +1,21 @@
-import concurrent
 import hashlib
 import json
 import os
-import time
-import src.Utils as Utils
 
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from src.api.HHApi import HHApi
+from src.loader.CrawlEngine import CrawlEngine, CrawlQuery
 from src.loader.DataLoader import DataLoader
+from src.loader.DocumentStore import DocumentStore
 
 
 class VacancyLoader(DataLoader):
     """
     Класс загружает и кэширует на диске описания вакансий.
+
+    Описания вакансий сохраняются в хранилище документов '/data/vacancy.store' (см. DocumentStore),
+    вакансии, сохраненные предыдущей версией отдельными файлами в '/data/vacancy', повторно не скачиваются.
     """
 
     def __init__(self,
@@ -32,66 +33,74 @@ class VacancyLoader(DataLoader):
         super().__init__(threadpool_enable, threadpool_max_workers)
         self._hh = hh
         self._working_dir = working_dir
+        self._store = DocumentStore(f'{working_dir}/data/vacancy.store')
 
-    def load(self, max_page: int = None, **kwargs) -> None:
+    def get_query(self, max_page: int = None, **kwargs) -> CrawlQuery:
         """
-        Загрузка вакансий.
+        Запрос вакансий для CrawlEngine.
 
         :param max_page: Сколько скачать страниц, по умолчанию качаем все.
-        :param kwargs: Данный параметр хранит настройки для вызова метода HHApi.get_vacancies_list(),
-                       чтобы не дублировать параметры метода HHApi.get_vacancies_list() в методе VacancyLoader.load().
+        :param kwargs: Данный параметр хранит настройки для вызова метода HHApi.get_vacancies_list().
         :return:
         """
 
         dt = datetime.now().strftime('%Y%m%d')
-        page = 0
+        return CrawlQuery(
+            kind='vacancy',
+            load_page=lambda page: self._load_page(page, dt, **kwargs),
+            load_item=self._load_vacancy,
+            max_page=max_page,
+            key=f'vacancy:{dt}:{json.dumps(kwargs, ensure_ascii=False, sort_keys=True)}')
 
-        while (max_page is None) or (max_page >= (page + 1)):
-            file_path = f'{self._working_dir}/data/vacancy_pages/{dt}/vacancies_{page:06d}_{dt}.json'
-            self._log(file_path)
+    def load(self, max_page: int = None, **kwargs) -> None:
+        """
+        Загрузка вакансий.
 
-            if not os.path.isfile(file_path):
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        :param max_page: Сколько скачать страниц, по умолчанию качаем все.
+        :param kwargs: Данный параметр хранит настройки для вызова метода HHApi.get_vacancies_list(),
+                       чтобы не дублировать параметры метода HHApi.get_vacancies_list() в методе VacancyLoader.load().
+        :return:
+        """
 
-            vacancies = None
+        engine = CrawlEngine(
+            max_concurrency=self.threadpool_max_workers if self.threadpool_enable else 1,
+            log=self._log)
+        engine.run([self.get_query(max_page=max_page, **kwargs)])
 
-            try:
-                vacancies = self._hh.get_vacancies_list(page=page, **kwargs)
+    def _load_page(self, page: int, dt: str, **kwargs) -> tuple:
+        """
+        Загрузка страницы со списком вакансий.
 
-                with open(file_path, mode='w', encoding='utf8') as fw:
-                    fw.write(json.dumps(vacancies, ensure_ascii=False, indent=2))
-            except Exception as e:
-                self._log(str(e))
+        :param page: Номер страницы.
+        :param dt: Дата загрузки (директория страниц).
+        :return: (список ID вакансий, есть ли следующая страница).
+        :raises Exception: Ошибка загрузки страницы.
+        """
 
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
+        file_path = f'{self._working_dir}/data/vacancy_pages/{dt}/vacancies_{page:06d}_{dt}.json'
+        self._log(file_path)
 
-            # Проверить условие выхода из бесконечного цикла.
-            if not vacancies:
-                break  # Нет данных.
+        if not os.path.isfile(file_path):
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
 
-            # Собрать все уникальные ID вакансий (без повторений если они будут).
-            vacancy_ids = {vacancy['id'] for vacancy in vacancies['items']}
+        try:
+            vacancies = self._hh.get_vacancies_list(page=page, **kwargs)
 
-            if self.threadpool_enable:
-                # Загрузка описания вакансий в несколько потоков.
-                with ThreadPoolExecutor(max_workers=self.threadpool_max_workers) as pool:
-                    futures = []
-                    for vacancy_id in vacancy_ids:
-                        futures.append(pool.submit(self._load_vacancy, vacancy_id))
-                    concurrent.futures.wait(futures)
-            else:
-                # Скачать список вакансий.
-                for vacancy_id in vacancy_ids:
-                    self._load_vacancy(vacancy_id=vacancy_id)
+            with open(file_path, mode='w', encoding='utf8') as fw:
+                fw.write(json.dumps(vacancies, ensure_ascii=False, indent=2))
+        except Exception:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+            raise
 
-            # Обновление счетчиков и проверка условия выхода из бесконечного цикла.
+        if not vacancies:
+            return [], False  # Нет данных.
 
-            page += 1
-            pages = int(vacancies.get('pages', 0))
+        # Собрать все уникальные ID вакансий (без повторений если они будут).
+        vacancy_ids = list(dict.fromkeys(vacancy['id'] for vacancy in vacancies['items']))
 
-            if (pages - page) == 0:
-                break
+        pages = int(vacancies.get('pages', 0))
+        return vacancy_ids, (page + 1) < pages
 
     def _is_valid(self, vacancy: dict) -> bool:
         """
@@ -117,32 +126,20 @@ class VacancyLoader(DataLoader):
 
         :param vacancy_id:
         :return:
+        :raises Exception: Ошибка загрузки вакансии.
         """
 
         vacancy_id_hash = hashlib.md5(vacancy_id.encode('utf-8')).hexdigest()
         file_path = f'{self._working_dir}/data/vacancy/{vacancy_id_hash[:2]}/vacancy_{int(vacancy_id):012d}.json'
 
-        if not os.path.isfile(file_path):
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if vacancy_id not in self._store and not os.path.isfile(file_path):
+            self._log(f'Trying to download vacancy ID={vacancy_id}')
+            vacancy = self._hh.get_vacancy(vacancy_id=vacancy_id)
 
-            try:
-                self._log(f'Trying to download vacancy ID={vacancy_id}')
-                vacancy = self._hh.get_vacancy(vacancy_id=vacancy_id)
-
-                # Проверка что скачали корректное описание вакансии, т.е.
-                # описание вакансии должно содержать поля ('id', 'name', 'description')
-                if self._is_valid(vacancy):
-                    # Сохранить вакансию.
-                    with open(file_path, mode='w', encoding='utf8') as fw:
-                        fw.write(json.dumps(vacancy, ensure_ascii=False, indent=2))
-
-                    # Добавить таймаут скачивания вакансий,
-                    # иначе hh.ru не дает скачивать вакансии.
-                    time.sleep(Utils.get_random_sleep(1.0, 1.5))
-            except Exception as e:
-                self._log(str(e))
-
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
+            # Проверка что скачали корректное описание вакансии, т.е.
+            # описание вакансии должно содержать поля ('id', 'name', 'description')
+            if self._is_valid(vacancy):
+                # Сохранить вакансию.
+                self._store.put(vacancy_id, json.dumps(vacancy, ensure_ascii=False))
         else:
             self._log(f'Vacancy ID={vacancy_id} already exists')
@@ -0,0 +1,151 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnStore:
+    """
+    Колоночное хранилище датасета (DataFrame) на диске.
+
+    Каждый столбец хранится в отдельном файле, поэтому можно загружать только
+    нужные столбцы, не десериализуя весь датасет:
+    - числовые и логические столбцы - файл '<column>.npy' (читается через memory map);
+    - строковые столбцы - файл '<column>.txt' (строки в UTF-8, разделенные символом '\\0')
+      и файл '<column>.offsets.npy' со смещениями строк (для чтения по частям),
+      пропущенные значения отмечаются в файле '<column>.null.npy'.
+
+    Описание столбцов хранится в файле 'meta.json'.
+    """
+
+    SEPARATOR = '\0'
+
+    def __init__(self, dir_path: str):
+        """
+        :param dir_path: Директория хранилища.
+        """
+
+        self._dir_path = dir_path
+        self._meta = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(f'{self._dir_path}/meta.json')
+
+    def _get_meta(self) -> dict:
+        if self._meta is None:
+            with open(f'{self._dir_path}/meta.json', mode='r', encoding='utf8') as fr:
+                self._meta = json.load(fr)
+        return self._meta
+
+    @property
+    def columns(self) -> list:
+        return list(self._get_meta()['columns'].keys())
+
+    @property
+    def rows(self) -> int:
+        return self._get_meta()['rows']
+
+    @staticmethod
+    def _write_column(dir_path: str, column: str, series: pd.Series) -> dict:
+        if series.dtype.kind in 'biuf':
+            np.save(f'{dir_path}/{column}.npy', series.to_numpy())
+            return {'type': 'array'}
+
+        # Все остальные столбцы сохраняются как строки.
+        null = series.isna().to_numpy()
+        values = ['' if is_null else str(value) for value, is_null in zip(series.tolist(), null)]
+
+        if any(ColumnStore.SEPARATOR in value for value in values):
+            raise ValueError(f'Column "{column}" contains separator character')
+
+        encoded = [value.encode('utf8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        # Смещение строки i с учетом разделителей перед ней.
+        offsets[1:] = np.cumsum([len(value) + 1 for value in encoded])
+
+        with open(f'{dir_path}/{column}.txt', mode='wb') as fw:
+            fw.write(ColumnStore.SEPARATOR.encode('utf8').join(encoded))
+        np.save(f'{dir_path}/{column}.offsets.npy', offsets)
+        if null.any():
+            np.save(f'{dir_path}/{column}.null.npy', null)
+
+        return {'type': 'str', 'null': bool(null.any())}
+
+    def write(self, df: pd.DataFrame) -> None:
+        """
+        Сохранение DataFrame.
+
+        Данные записываются во временную директорию, которая затем заменяет текущую.
+        """
+
+        tmp_dir_path = f'{self._dir_path}.tmp'
+        shutil.rmtree(tmp_dir_path, ignore_errors=True)
+        os.makedirs(tmp_dir_path)
+
+        meta = {'rows': len(df), 'columns': {}}
+        for column in df.columns:
+            meta['columns'][column] = self._write_column(tmp_dir_path, column, df[column])
+
+        with open(f'{tmp_dir_path}/meta.json', mode='w', encoding='utf8') as fw:
+            json.dump(meta, fw, ensure_ascii=False, indent=2)
+
+        old_dir_path = f'{self._dir_path}.old'
+        shutil.rmtree(old_dir_path, ignore_errors=True)
+        if os.path.isdir(self._dir_path):
+            os.replace(self._dir_path, old_dir_path)
+        os.replace(tmp_dir_path, self._dir_path)
+        shutil.rmtree(old_dir_path, ignore_errors=True)
+
+        self._meta = meta
+
+    def _read_column(self, column: str, start: int, stop: int):
+        info = self._get_meta()['columns'][column]
+
+        if info['type'] == 'array':
+            values = np.load(f'{self._dir_path}/{column}.npy', mmap_mode='r')
+            return values[start:stop]
+
+        if start >= stop:
+            return np.array([], dtype=object)
+
+        offsets = np.load(f'{self._dir_path}/{column}.offsets.npy', mmap_mode='r')
+        with open(f'{self._dir_path}/{column}.txt', mode='rb') as fr:
+            fr.seek(int(offsets[start]))
+            data = fr.read(int(offsets[stop] - offsets[start]) - 1)
+
+        # Разделение всего блока строк за один вызов.
+        values = np.array(data.decode('utf8').split(ColumnStore.SEPARATOR), dtype=object)
+
+        if info.get('null'):
+            null = np.load(f'{self._dir_path}/{column}.null.npy', mmap_mode='r')[start:stop]
+            values[null] = None
+
+        return values
+
+    def read(self, columns: list = None, start: int = 0, stop: int = None) -> pd.DataFrame:
+        """
+        Чтение DataFrame.
+
+        :param columns: Список столбцов, по умолчанию все столбцы.
+        :param start: Номер первой строки.
+        :param stop: Номер строки, следующей за последней, по умолчанию до конца.
+        :return:
+        """
+
+        columns = columns or self.columns
+        stop = self.rows if stop is None else min(stop, self.rows)
+        start = min(start, stop)
+
+        return pd.DataFrame({column: self._read_column(column, start, stop) for column in columns},
+                            index=pd.RangeIndex(start, stop),
+                            columns=columns)
+
+    def iter_chunks(self, columns: list = None, chunk_size: int = 100000):
+        """
+        Чтение DataFrame по частям.
+        """
+
+        for start in range(0, self.rows, chunk_size):
+            yield self.read(columns=columns, start=start, stop=start + chunk_size)
@@ -1,20 +1,66 @@
+import io
+import itertools
 import json
 import os
+import numpy as np
 import pandas as pd
 
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
 
+from src.loader.DocumentStore import DocumentStore
+from src.parser.HtmlExtractor import HtmlExtractor
 from src.parser.TextTransformer import TextTransformer
 
+# Экземпляр парсера в рабочем процессе (у каждого процесса свой TextTransformer).
+_worker_parser = None
+
+
+def _init_worker(working_dir: str, categories_file_path: str) -> None:
+    global _worker_parser
+    _worker_parser = DataParser(working_dir=working_dir, categories_file_path=categories_file_path)
+
+
+def _parse_chunk(method_name: str, file_paths: list) -> list:
+    """
+    Разбор части файлов в рабочем процессе.
+    """
+
+    parse = getattr(_worker_parser, method_name)
+    items = [parse(file_path, content) for file_path, content in _worker_parser.iter_documents(file_paths)]
+    # Сохранить новые нормальные формы токенов (atexit в рабочих процессах не вызывается).
+    _worker_parser.flush()
+    return items
+
 
 class DataParser:
     """
     Парсер описания ваканий и резюме загруженных с сайта hh.ru.
+
+    Документы читаются из хранилищ документов '/data/vacancy.store' и '/data/resume.store'
+    (см. DocumentStore) и из отдельных файлов, сохраненных предыдущей версией. Документ
+    хранилища обозначается путем '<директория хранилища>/<ID>', поэтому он разбирается
+    и учитывается в манифесте (см. get_fingerprint) так же, как отдельный файл.
     """
 
-    def __init__(self, working_dir: str, categories_file_path: str = None):
+    def __init__(self,
+                 working_dir: str,
+                 categories_file_path: str = None,
+                 workers: int = 1,
+                 chunk_size: int = 250):
+        """
+        :param working_dir: Директория проекта.
+        :param categories_file_path: Путь к файлу категорий вакансий.
+        :param workers: Количество процессов для разбора данных (1 - разбор в текущем процессе).
+        :param chunk_size: Количество файлов, передаваемых в рабочий процесс за один раз.
+        """
+
         self._working_dir = working_dir
+        self._categories_file_path = categories_file_path
+        self._workers = workers
+        self._chunk_size = chunk_size
         self._text_transformer = TextTransformer(working_dir=working_dir)
+        self._html_extractor = HtmlExtractor()
+        self._stores = {}
 
         # Загрузить категории вакансий если они есть.
         self._categories = None
@@ -34,135 +80,297 @@ class DataParser:
                         return self._categories[key]['name']
         return ''
 
-    def get_resume_dataframe(self, limit: int = None) -> pd.DataFrame:
-        counter = 0
-        data = []
-        base_dir = f'{self._working_dir}/data/resume'
+    @staticmethod
+    def _get_file_paths(base_dir: str, ext: str) -> list:
+        """
+        Список файлов с расширением ext в директории base_dir (в стабильном порядке).
+        """
+
+        file_paths = []
         for root, dirs, filenames in os.walk(base_dir):
             for filename in filenames:
-                file_path = f'{root}/{filename}'
-                # print(file_path)
-                if filename.endswith('.html'):
-                    with open(file_path, mode='r', encoding='utf8') as fr:
-                        resume_parser = BeautifulSoup(fr, 'html.parser')
-                        resume_id = os.path.basename(file_path).split('.')[0]
-
-                        # Формирование описания резюме.
-                        item = {}
-
-                        item['id'] = resume_id
-                        item['url'] = f'https://hh.ru/resume/{resume_id}?customDomain=1'  # Регион Москва
-                        item['title'] = ''
-                        item['title_tok'] = ''
-                        item['experience'] = ''
-                        # item['experience_tok'] = ''
-
-                        try:
-                            # Название резюме.
-                            result = resume_parser.select(
-                                selector='span[data-qa="resume-block-title-position"]')
-                            if result:
-                                text = result[0].text.strip()
-                                item['title'] = text
-                                item['title_tok'] = self._text_transformer.transform(text)
-                            else:
-                                print('[!!] название резюме: is empty or not found')
-
-                            # Опыт работы.
-                            result = resume_parser.select(
-                                selector='div[data-qa="resume-block-experience"] div[data-qa="resume-block-experience-description"]')
-                            if result:
-                                # Объединить весь опыт работы в одну строку.
-                                text = '\n'.join(s.text.strip() for s in result)
-                                item['experience'] = text
-                                # item['experience_tok'] = self._text_transformer.transform(text)
-                            else:
-                                print('[!!] опыт работы: is empty or not found')
-
-                            # Обо мне.
-                            result = resume_parser.select(
-                                selector='div[data-qa="resume-block-skills"] div[data-qa="resume-block-skills-content"]')
-                            if result:
-                                text = result[0].text.strip()
-                                if text:
-                                    # Если значение 'experience' либо 'experience_tok' есть, то
-                                    # добавить к нему еще блок данных иначе нужно указать значение.
-
-                                    if item['experience']:
-                                        item['experience'] += f'\n{text}'
-                                    else:
-                                        item['experience'] = text
-
-                                    # if item['experience_tok']:
-                                    #     item['experience_tok'] += ' '
-                                    #     item['experience_tok'] += self._text_transformer.transform(text)
-                                    # else:
-                                    #     item['experience_tok'] = self._text_transformer.transform(text)
-                            else:
-                                print('[!!] обо мне: is empty or not found')
-
-                            # Добавить запись.
-                            data.append(item)
-
-                            # Ограничение данных добавляемых в DataFrame.
-                            counter += 1
-
-                            if counter > 0 and counter % 250 == 0:
-                                if limit:
-                                    print(f'{counter} resume processed of {limit}')
-                                else:
-                                    print(f'{counter} resume processed')
-
-                            if limit and (counter >= limit):
-                                return pd.json_normalize(data)
-                        except AttributeError as err:
-                            print("err: " + str(err))
+                if filename.endswith(ext):
+                    file_paths.append(f'{root}/{filename}')
+        return sorted(file_paths)
 
-        # Формируем pandas DataFrame.
-        return pd.json_normalize(data)
+    def _get_store(self, name: str) -> DocumentStore:
+        """
+        Хранилище документов name ('vacancy', 'resume'), индекс хранилища читается один раз.
+        """
+
+        store = self._stores.get(name)
+        if store is None:
+            store = DocumentStore(f'{self._working_dir}/data/{name}.store')
+            self._stores[name] = store
+        return store
+
+    def _find_store(self, dir_path: str):
+        for name in ('vacancy', 'resume'):
+            if dir_path == f'{self._working_dir}/data/{name}.store':
+                return self._get_store(name)
+        return None
+
+    def _get_store_paths(self, name: str) -> list:
+        """
+        Пути документов хранилища name в порядке их расположения в хранилище.
+        """
+
+        store = self._get_store(name)
+        return [f'{store.dir_path}/{doc_id}' for doc_id in store.get_ids()]
+
+    def get_fingerprint(self, file_path: str) -> list:
+        """
+        Отпечаток документа для манифеста (см. ParseManifest): для документа хранилища -
+        расположение записи, для файла - размер и время изменения.
+        """
+
+        store = self._find_store(os.path.dirname(file_path))
+        if store is not None:
+            return store.get_location(os.path.basename(file_path))
+
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def iter_documents(self, file_paths: list):
+        """
+        Чтение документов в порядке следования путей.
+
+        Документы хранилища читаются последовательно (DocumentStore.scan), для отдельных
+        файлов содержимое не читается (файл открывается при разборе).
+
+        :return: Итератор (путь, содержимое документа или None).
+        """
+
+        for dir_path, paths in itertools.groupby(file_paths, key=os.path.dirname):
+            paths = list(paths)
+            store = self._find_store(dir_path)
+            if store is None:
+                for file_path in paths:
+                    yield file_path, None
+            else:
+                documents = store.scan([os.path.basename(file_path) for file_path in paths])
+                for file_path, (_, data) in zip(paths, documents):
+                    yield file_path, data.decode('utf-8')
+
+    def flush(self) -> None:
+        """
+        Сохранение новых нормальных форм токенов (см. TextTransformer.flush).
+        """
+
+        self._text_transformer.flush()
+
+    def _parse_resume(self, file_path: str, content: str = None):
+        """
+        Разбор описания резюме.
+
+        :param content: Содержимое документа, None - прочитать файл file_path.
+        :return: Описание резюме.
+        """
+
+        with (io.StringIO(content) if content is not None else open(file_path, mode='r', encoding='utf8')) as fr:
+            # Блоки резюме выбираются за один разбор страницы (см. HtmlExtractor).
+            titles, experiences, skills = self._html_extractor.select(
+                fr.read(),
+                selectors=[HtmlExtractor.RESUME_TITLE, HtmlExtractor.RESUME_EXPERIENCE, HtmlExtractor.RESUME_SKILLS])
+            resume_id = os.path.basename(file_path).split('.')[0]
+
+            # Формирование описания резюме.
+            item = {}
+
+            item['id'] = resume_id
+            item['url'] = f'https://hh.ru/resume/{resume_id}?customDomain=1'  # Регион Москва
+            item['title'] = ''
+            item['title_tok'] = ''
+            item['experience'] = ''
+            # item['experience_tok'] = ''
+
+            # Название резюме.
+            if titles:
+                text = titles[0].strip()
+                item['title'] = text
+                item['title_tok'] = self._text_transformer.transform(text)
+            else:
+                print('[!!] название резюме: is empty or not found')
+
+            # Опыт работы.
+            if experiences:
+                # Объединить весь опыт работы в одну строку.
+                text = '\n'.join(s.strip() for s in experiences)
+                item['experience'] = text
+                # item['experience_tok'] = self._text_transformer.transform(text)
+            else:
+                print('[!!] опыт работы: is empty or not found')
+
+            # Обо мне.
+            if skills:
+                text = skills[0].strip()
+                if text:
+                    # Если значение 'experience' либо 'experience_tok' есть, то
+                    # добавить к нему еще блок данных иначе нужно указать значение.
+
+                    if item['experience']:
+                        item['experience'] += f'\n{text}'
+                    else:
+                        item['experience'] = text
+
+                    # if item['experience_tok']:
+                    #     item['experience_tok'] += ' '
+                    #     item['experience_tok'] += self._text_transformer.transform(text)
+                    # else:
+                    #     item['experience_tok'] = self._text_transformer.transform(text)
+            else:
+                print('[!!] обо мне: is empty or not found')
+
+            return item
+
+    def _parse_vacancy(self, file_path: str, content: str = None):
+        """
+        Разбор описания вакансии.
+
+        :param content: Содержимое документа, None - прочитать файл file_path.
+        :return: Описание вакансии.
+        """
+
+        with (io.StringIO(content) if content is not None else open(file_path, mode='r', encoding='utf8')) as fr:
+            vacancy = json.load(fr)
+
+            # Формирование описания вакансии.
+            item = {}
+
+            item['id'] = vacancy['id']
+            item['url'] = vacancy['alternate_url'] + '?customDomain=1'  # Регион Москва
+            item['title'] = vacancy['name']
+            # item['description'] = vacancy['description']
+            item['title_tok'] = self._text_transformer.transform(vacancy['name'])
+            item['description_tok'] = self._text_transformer.transform(vacancy['description'])
+
+            # День публикации вакансии (YYYYMMDD).
+            item['day'] = (vacancy.get('published_at') or '')[:10].replace('-', '')
+
+            # Структурированные поля для фильтров.
+            salary = vacancy.get('salary') or {}
+            item['salary_from'] = float(salary['from']) if salary.get('from') is not None else np.nan
+            item['salary_to'] = float(salary['to']) if salary.get('to') is not None else np.nan
+            item['salary_currency'] = salary.get('currency') or ''
+            for key in ('schedule', 'employment', 'area', 'experience'):
+                item[key] = (vacancy.get(key) or {}).get('id') or ''
+
+            if 'professional_roles' in vacancy:
+                professional_roles = [int(role['id']) for role in vacancy['professional_roles']]
+                item['category'] = self._get_category(professional_roles)
+            else:
+                item['category'] = ''
+
+            return item
+
+    def _iter_parsed(self, method_name: str, file_paths: list):
+        """
+        Разбор списка файлов, результаты возвращаются в порядке следования файлов.
+
+        При workers > 1 файлы разбиваются на части, которые обрабатываются в пуле процессов.
+        Одновременно в работе находится не более 2 * workers частей, поэтому при достижении
+        ограничения limit лишние файлы не разбираются.
+        """
+
+        if self._workers <= 1:
+            parse = getattr(self, method_name)
+            for file_path, content in self.iter_documents(file_paths):
+                yield parse(file_path, content)
+            return
+
+        chunks = [file_paths[i:i + self._chunk_size] for i in range(0, len(file_paths), self._chunk_size)]
+
+        with ProcessPoolExecutor(max_workers=self._workers,
+                                 initializer=_init_worker,
+                                 initargs=(self._working_dir, self._categories_file_path)) as pool:
+            futures = []
+            next_chunk = 0
+            try:
+                while next_chunk < len(chunks) or futures:
+                    # Поддерживаем ограниченное количество частей в работе.
+                    while next_chunk < len(chunks) and len(futures) < 2 * self._workers:
+                        futures.append(pool.submit(_parse_chunk, method_name, chunks[next_chunk]))
+                        next_chunk += 1
+
+                    # Результаты забираем строго по порядку частей.
+                    for item in futures.pop(0).result():
+                        yield item
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _get_dataframe(self, method_name: str, file_paths: list, name: str, limit: int = None) -> tuple:
+        """
+        Разбор файлов и формирование DataFrame.
+
+        Каждая запись дополняется полем 'file' - путь к исходному файлу относительно
+        директории данных, это позволяет обновлять датасет по отдельным файлам.
+
+        :return: (DataFrame, список обработанных файлов)
+        """
 
-    def get_vacancy_dataframe(self, limit: int = None) -> pd.DataFrame:
         counter = 0
         data = []
-        base_dir = f'{self._working_dir}/data/vacancy'
-        for root, dirs, filenames in os.walk(base_dir):
-            for filename in filenames:
-                file_path = f'{root}/{filename}'
-                # print(file_path)
-                if filename.endswith('.json'):
-                    with open(file_path, mode='r', encoding='utf8') as fr:
-                        vacancy = json.load(fr)
-
-                        # Формирование описания вакансии.
-                        item = {}
-
-                        item['id'] = vacancy['id']
-                        item['url'] = vacancy['alternate_url'] + '?customDomain=1'  # Регион Москва
-                        item['title'] = vacancy['name']
-                        # item['description'] = vacancy['description']
-                        item['title_tok'] = self._text_transformer.transform(vacancy['name'])
-                        item['description_tok'] = self._text_transformer.transform(vacancy['description'])
-
-                        if 'professional_roles' in vacancy:
-                            professional_roles = [int(role['id']) for role in vacancy['professional_roles']]
-                            item['category'] = self._get_category(professional_roles)
-                        else:
-                            item['category'] = ''
-
-                        # Добавить запись.
-                        data.append(item)
-
-                        # Ограничение данных добавляемых в DataFrame.
-                        counter += 1
-
-                        if counter > 0 and counter % 250 == 0:
-                            if limit:
-                                print(f'{counter} vacancy processed of {limit}')
-                            else:
-                                print(f'{counter} vacancy processed')
-
-                        if limit and (counter >= limit):
-                            return pd.json_normalize(data)
+        processed = 0
+        data_dir = f'{self._working_dir}/data'
+
+        items = self._iter_parsed(method_name, file_paths)
+        try:
+            for item in items:
+                processed += 1
+
+                if item is None:
+                    continue
+
+                # Добавить запись.
+                item['file'] = os.path.relpath(file_paths[processed - 1], data_dir)
+                data.append(item)
+
+                # Ограничение данных добавляемых в DataFrame.
+                counter += 1
+
+                if counter > 0 and counter % 250 == 0:
+                    if limit:
+                        print(f'{counter} {name} processed of {limit}')
+                    else:
+                        print(f'{counter} {name} processed')
+
+                if limit and (counter >= limit):
+                    break
+        finally:
+            # Остановить разбор оставшихся файлов.
+            items.close()
+
+        # Сохранить словарь нормальных форм токенов.
+        self.flush()
 
         # Формируем pandas DataFrame.
-        return pd.json_normalize(data)
+        return pd.json_normalize(data), file_paths[:processed]
+
+    def get_resume_file_paths(self) -> list:
+        return self._get_file_paths(f'{self._working_dir}/data/resume', '.html') + self._get_store_paths('resume')
+
+    def get_vacancy_file_paths(self) -> list:
+        return self._get_file_paths(f'{self._working_dir}/data/vacancy', '.json') + self._get_store_paths('vacancy')
+
+    def parse_resume_files(self, file_paths: list, limit: int = None) -> tuple:
+        """
+        Разбор указанных файлов резюме.
+
+        :return: (DataFrame, список обработанных файлов)
+        """
+        return self._get_dataframe('_parse_resume', file_paths, name='resume', limit=limit)
+
+    def parse_vacancy_files(self, file_paths: list, limit: int = None) -> tuple:
+        """
+        Разбор указанных файлов вакансий.
+
+        :return: (DataFrame, список обработанных файлов)
+        """
+        return self._get_dataframe('_parse_vacancy', file_paths, name='vacancy', limit=limit)
+
+    def get_resume_dataframe(self, limit: int = None) -> pd.DataFrame:
+        return self.parse_resume_files(self.get_resume_file_paths(), limit=limit)[0]
+
+    def get_vacancy_dataframe(self, limit: int = None) -> pd.DataFrame:
+        return self.parse_vacancy_files(self.get_vacancy_file_paths(), limit=limit)[0]
@@ -0,0 +1,158 @@
+import re
+
+from html.entities import html5
+from bs4 import BeautifulSoup
+from lxml import etree
+
+
+class HtmlExtractor:
+    """
+    Извлечение блоков из HTML-страниц hh.ru (страницы резюме и страницы поисковой выдачи резюме).
+
+    Вместо построения полного дерева BeautifulSoup на чистом Python страница разбирается
+    парсером libxml2 (lxml), нужные блоки выбираются заранее скомпилированными XPath-выражениями,
+    а текст собирается только внутри найденных блоков.
+
+    Результат совпадает с результатом BeautifulSoup(html, 'html.parser'): текст блока собирается
+    так же, как Tag.text (без комментариев и содержимого script/style/template/rt/rp, строки из
+    одних пробельных символов вне pre/textarea заменяются на '\\n' или ' '). Страницы, которые
+    libxml2 разбирает иначе (символы '\\r', секции CDATA, неизвестные ссылки на символы и ссылки
+    без ';'), и страницы, которые libxml2 не смог разобрать, обрабатываются BeautifulSoup.
+    Страницы hh.ru - корректный HTML, для страниц с неверной вложенностью тегов (например,
+    '<p><div>') деревья libxml2 и html.parser, а значит и текст блоков, могут отличаться.
+    """
+
+    # Селекторы блоков: (CSS-селектор для BeautifulSoup, XPath для lxml).
+    RESUME_TITLE = (
+        'span[data-qa="resume-block-title-position"]',
+        '//span[@data-qa="resume-block-title-position"]')
+    RESUME_EXPERIENCE = (
+        'div[data-qa="resume-block-experience"] div[data-qa="resume-block-experience-description"]',
+        '//div[@data-qa="resume-block-experience"]//div[@data-qa="resume-block-experience-description"]')
+    RESUME_SKILLS = (
+        'div[data-qa="resume-block-skills"] div[data-qa="resume-block-skills-content"]',
+        '//div[@data-qa="resume-block-skills"]//div[@data-qa="resume-block-skills-content"]')
+    PAGER_LINKS = (
+        'div[class="pager"] a[href^="/search/resume"]',
+        '//div[normalize-space(@class)="pager"]//a[starts-with(@href, "/search/resume")]')
+    RESUME_LINKS = (
+        'main[class="resume-serp-content"] a[href^="/resume/"]',
+        '//main[normalize-space(@class)="resume-serp-content"]//a[starts-with(@href, "/resume/")]')
+
+    # Теги, строки внутри которых BeautifulSoup не включает в текст блока.
+    _SKIP_TAGS = frozenset(('script', 'style', 'template', 'rt', 'rp'))
+    # Теги, внутри которых BeautifulSoup сохраняет пробельные строки.
+    _PRESERVE_TAGS = frozenset(('pre', 'textarea'))
+    _ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+    _ENTITY_RE = re.compile(r'&([a-zA-Z][a-zA-Z0-9]*)(;?)')
+    # Ссылки на символы, которые распознаются без ';' (например, '&copy2024').
+    _LEGACY_ENTITY_RE = re.compile('|'.join(sorted((name for name in html5 if not name.endswith(';')),
+                                                   key=len, reverse=True)))
+
+    def __init__(self, fast: bool = True):
+        """
+        :param fast: Использовать lxml, False - всегда BeautifulSoup.
+        """
+
+        self._fast = fast
+        self._parser = etree.HTMLParser(encoding='utf-8')
+        self._xpaths = {}
+
+    def _get_xpath(self, xpath: str) -> etree.XPath:
+        compiled = self._xpaths.get(xpath)
+        if compiled is None:
+            compiled = etree.XPath(xpath)
+            self._xpaths[xpath] = compiled
+        return compiled
+
+    def _is_supported(self, html: str) -> bool:
+        if not self._fast or '\r' in html or '<![CDATA[' in html:
+            return False
+
+        # Неизвестные ссылки на символы и ссылки без ';' html.parser и libxml2 разбирают по-разному.
+        if '&' in html:
+            for match in self._ENTITY_RE.finditer(html):
+                name, semicolon = match.groups()
+                if semicolon:
+                    if f'{name};' not in html5:
+                        return False
+                elif self._LEGACY_ENTITY_RE.match(name):
+                    return False
+        return True
+
+    def _clean_string(self, string: str, preserve: bool) -> str:
+        if not preserve and not string.strip(self._ASCII_SPACES):
+            return '\n' if '\n' in string else ' '
+        return string
+
+    def _append_text(self, element, parts: list, preserve: bool) -> None:
+        """
+        Текст элемента (без хвоста) в порядке документа.
+        """
+
+        tag = element.tag
+        # Комментарии и инструкции обработки.
+        if not isinstance(tag, str) or tag in self._SKIP_TAGS:
+            return
+
+        preserve = preserve or tag in self._PRESERVE_TAGS
+        if element.text:
+            parts.append(self._clean_string(element.text, preserve))
+        for child in element:
+            self._append_text(child, parts, preserve)
+            if child.tail:
+                parts.append(self._clean_string(child.tail, preserve))
+
+    def get_text(self, element) -> str:
+        """
+        Текст элемента lxml, совпадающий с Tag.text BeautifulSoup.
+        """
+
+        parts = []
+        preserve = any(ancestor.tag in self._PRESERVE_TAGS for ancestor in element.iterancestors())
+        self._append_text(element, parts, preserve)
+        return ''.join(parts)
+
+    def _select_fast(self, html: str, selectors: list, attr: str = None):
+        root = etree.fromstring(html.encode('utf-8'), self._parser)
+        if root is None:
+            # Пустой документ.
+            return [[] for _ in selectors]
+
+        result = []
+        for _, xpath in selectors:
+            elements = self._get_xpath(xpath)(root)
+            if attr is None:
+                result.append([self.get_text(element) for element in elements])
+            else:
+                result.append([element.get(attr) for element in elements])
+        return result
+
+    @staticmethod
+    def _select_soup(html: str, selectors: list, attr: str = None) -> list:
+        bs = BeautifulSoup(html, 'html.parser')
+        result = []
+        for selector, _ in selectors:
+            elements = bs.select(selector)
+            if attr is None:
+                result.append([element.text for element in elements])
+            else:
+                result.append([element[attr] for element in elements])
+        return result
+
+    def select(self, html: str, selectors: list, attr: str = None) -> list:
+        """
+        Выбор блоков страницы за один разбор страницы.
+
+        :param html: HTML-страница.
+        :param selectors: Список селекторов, например, [HtmlExtractor.RESUME_TITLE, ...].
+        :param attr: Название атрибута, None - текст блоков.
+        :return: Для каждого селектора список текстов (значений атрибута) найденных блоков в порядке документа.
+        """
+
+        if self._is_supported(html):
+            try:
+                return self._select_fast(html, selectors, attr)
+            except (etree.ParserError, ValueError):
+                pass
+        return self._select_soup(html, selectors, attr)
@@ -0,0 +1,90 @@
+import json
+import os
+
+from typing import Callable
+
+
+class ParseManifest:
+    """
+    Манифест разобранных файлов.
+
+    Для каждого разобранного файла хранится его размер и время изменения,
+    что позволяет при следующем запуске разбирать только новые и измененные файлы.
+
+    Формат файла манифеста:
+    {
+      "<путь к файлу относительно base_dir>": [<size>, <mtime_ns>],
+      ...
+    }
+    """
+
+    def __init__(self, file_path: str, base_dir: str, fingerprint: Callable[[str], list] = None):
+        """
+        :param file_path: Путь к файлу манифеста.
+        :param base_dir: Директория относительно которой хранятся пути к файлам.
+        :param fingerprint: Функция вычисления отпечатка файла, по умолчанию [размер, время изменения]
+                            (см. DataParser.get_fingerprint для документов хранилища).
+        """
+
+        self._file_path = file_path
+        self._base_dir = base_dir
+        self._fingerprint = fingerprint or self._get_fingerprint
+        self._files = {}
+
+        if os.path.isfile(file_path):
+            with open(file_path, mode='r', encoding='utf8') as fr:
+                self._files = json.load(fr)
+
+    def exists(self) -> bool:
+        return os.path.isfile(self._file_path)
+
+    def get_relative_path(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self._base_dir)
+
+    @staticmethod
+    def _get_fingerprint(file_path: str) -> list:
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def diff(self, file_paths: list) -> tuple:
+        """
+        Сравнение списка файлов с манифестом.
+
+        :param file_paths: Текущий список файлов.
+        :return: (список новых и измененных файлов, список относительных путей удаленных файлов)
+        """
+
+        changed = []
+        current = set()
+        for file_path in file_paths:
+            path = self.get_relative_path(file_path)
+            current.add(path)
+            if self._files.get(path) != self._fingerprint(file_path):
+                changed.append(file_path)
+
+        removed = [path for path in self._files.keys() if path not in current]
+
+        return changed, removed
+
+    def update(self, file_paths: list) -> None:
+        for file_path in file_paths:
+            self._files[self.get_relative_path(file_path)] = self._fingerprint(file_path)
+
+    def remove(self, paths: list) -> int:
+        """
+        :param paths: Список относительных путей к файлам.
+        :return: Количество удаленных из манифеста файлов.
+        """
+
+        n_removed = 0
+        for path in paths:
+            if self._files.pop(path, None) is not None:
+                n_removed += 1
+        return n_removed
+
+    def save(self) -> None:
+        # Запись через временный файл, чтобы не повредить манифест при сбое.
+        tmp_file_path = f'{self._file_path}.tmp'
+        with open(tmp_file_path, mode='w', encoding='utf8') as fw:
+            json.dump(self._files, fw, ensure_ascii=False)
+        os.replace(tmp_file_path, self._file_path)
@@ -9,6 +9,8 @@ from nltk.stem import WordNetLemmatizer
 from nltk.downloader import Downloader
 from pymorphy2 import MorphAnalyzer
 
+from src.parser.TokenDictionary import TokenDictionary
+
 
 class TextTransformer:
     """
@@ -25,9 +27,25 @@ class TextTransformer:
     - приведение текста к нормальной форме
         - лемматизация для русских и английских слов
         - cтемминг для русских и английских слов
+
+    Нормальные формы токенов запоминаются в словаре TokenDictionary
+    (data/token_dict.sqlite3), поэтому морфологический анализ выполняется
+    один раз для каждого уникального токена.
     """
 
-    def __init__(self, working_dir: str = None):
+    def __init__(self,
+                 working_dir: str = None,
+                 token_dict_enable: bool = True,
+                 token_dict_max_size: int = 100000,
+                 token_dict_persist: bool = True):
+        """
+        :param working_dir: Директория проекта.
+        :param token_dict_enable: Включить словарь нормальных форм токенов.
+        :param token_dict_max_size: Максимальное количество токенов в кэше словаря в памяти.
+        :param token_dict_persist: Хранить словарь на диске (False - только в памяти, без обращений
+                                   к SQLite, например, для нормализации запросов в сервисе).
+        """
+
         # Скачать ресурсы nltk в директорию nltk_dir.
         nltk_dir = f'{working_dir}/data/nltk' if working_dir is not None else '/tmp/nltk'
         os.makedirs(nltk_dir, exist_ok=True)
@@ -60,6 +78,48 @@ class TextTransformer:
         self._re_html_link = re.compile(r'https?://\S+', flags=flags)
         self._re_space = re.compile(r'[\s\t]{1,}', flags=flags)
 
+        # Словарь нормальных форм токенов.
+        self._token_dict = None
+        if token_dict_enable:
+            self._token_dict = TokenDictionary(
+                file_path=f'{working_dir}/data/token_dict.sqlite3' if working_dir is not None and token_dict_persist else None,
+                max_size=token_dict_max_size)
+
+    def _normalize(self, w: str) -> str:
+        """
+        Приведение токена к нормальной форме.
+        """
+
+        # Лемматизация (привести русские и английские слова к нормальной форме слова).
+        w = self._lemmatizer_ru.parse(w)[0].normal_form
+        w = self._lemmatizer_en.lemmatize(w)
+        # Стемминг (выделить основу слова).
+        w = self._stemmer_ru.stem(w)
+        w = self._stemmer_en.stem(w)
+        return w
+
+    def normalize(self, w: str) -> str:
+        """
+        Приведение токена к нормальной форме с использованием словаря нормальных форм.
+        """
+
+        if self._token_dict is None:
+            return self._normalize(w)
+
+        normal = self._token_dict.get(w)
+        if normal is None:
+            normal = self._normalize(w)
+            self._token_dict.put(w, normal)
+        return normal
+
+    def flush(self) -> None:
+        """
+        Сохранить словарь нормальных форм токенов на диск.
+        """
+
+        if self._token_dict is not None:
+            self._token_dict.flush()
+
     def transform(self, text: str, split: bool = False) -> Union[str, list]:  # str|list in Python 3.10
         """
         Метод фильтрует и преобразовываем входной текст.
@@ -85,13 +145,7 @@ class TextTransformer:
             w = token.strip()
             # Фильтрация русских и английских стоп-слов плюс ограничение на длину токена.
             if w not in self._stopwords_ru and w not in self._stopwords_en and len(w) > max_token_length:
-                # Лемматизация (привести русские и английские слова к нормальной форме слова).
-                w = self._lemmatizer_ru.parse(w)[0].normal_form
-                w = self._lemmatizer_en.lemmatize(w)
-                # Стемминг (выделить основу слова).
-                w = self._stemmer_ru.stem(w)
-                w = self._stemmer_en.stem(w)
-                tokens_filtered.append(w)
+                tokens_filtered.append(self.normalize(w))
 
         if split:
             return tokens_filtered
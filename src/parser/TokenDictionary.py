@@ -0,0 +1,106 @@
+import atexit
+import os
+import sqlite3
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class TokenDictionary:
+    """
+    Словарь нормальных форм токенов (токен -> нормальная форма).
+
+    Состоит из двух уровней:
+    - ограниченного по размеру кэша в памяти (LRU);
+    - словаря на диске (SQLite), который переиспользуется между запусками и
+      может одновременно читаться несколькими процессами.
+
+    Новые значения накапливаются в памяти и записываются на диск пачками.
+    """
+
+    def __init__(self, file_path: str = None, max_size: int = 100000, flush_size: int = 10000):
+        """
+        :param file_path: Путь к файлу словаря, None - словарь хранится только в памяти.
+        :param max_size: Максимальное количество токенов в кэше в памяти.
+        :param flush_size: Количество новых токенов, после которого они записываются на диск.
+        """
+
+        self._file_path = file_path
+        self._max_size = max_size
+        self._flush_size = flush_size
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = Lock()
+        self._conn = None
+        self._pid = None
+
+        if file_path:
+            atexit.register(self.flush)
+
+    def _get_connection(self):
+        """
+        Соединение с SQLite создается отдельно в каждом процессе (после fork соединение не наследуется).
+        """
+
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self._file_path), exist_ok=True)
+            self._conn = sqlite3.connect(self._file_path, timeout=60, check_same_thread=False)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS tokens (token TEXT PRIMARY KEY, normal TEXT NOT NULL) WITHOUT ROWID')
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _cache_put(self, token: str, normal: str) -> None:
+        self._cache[token] = normal
+        self._cache.move_to_end(token)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
+
+    def get(self, token: str):
+        """
+        :return: Нормальная форма токена или None если токен не найден.
+        """
+
+        with self._lock:
+            normal = self._cache.get(token)
+            if normal is not None:
+                self._cache.move_to_end(token)
+                return normal
+
+            normal = self._pending.get(token)
+            if normal is None and self._file_path:
+                row = self._get_connection().execute('SELECT normal FROM tokens WHERE token = ?', (token,)).fetchone()
+                if row:
+                    normal = row[0]
+
+            if normal is not None:
+                self._cache_put(token, normal)
+
+            return normal
+
+    def put(self, token: str, normal: str) -> None:
+        with self._lock:
+            self._cache_put(token, normal)
+            if self._file_path:
+                self._pending[token] = normal
+                if len(self._pending) >= self._flush_size:
+                    self._flush()
+
+    def _flush(self) -> None:
+        if self._pending:
+            try:
+                conn = self._get_connection()
+                conn.executemany('INSERT OR IGNORE INTO tokens (token, normal) VALUES (?, ?)', self._pending.items())
+                conn.commit()
+                self._pending = {}
+            except sqlite3.Error as err:
+                # Словарь занят другим процессом, токены будут записаны при следующей попытке.
+                print("err: " + str(err))
+
+    def flush(self) -> None:
+        """
+        Записать накопленные токены на диск.
+        """
+
+        with self._lock:
+            self._flush()
@@ -0,0 +1,155 @@
+import numpy as np
+import pandas as pd
+
+
+class FilterIndex:
+    """
+    Индекс фильтров вакансий.
+
+    Для категориальных полей (категория, график работы, тип занятости, регион, опыт, валюта)
+    хранятся битовые карты вакансий для каждого значения поля (np.packbits), для зарплаты -
+    отсортированные массивы нижней и верхней границы зарплаты с номерами вакансий.
+    Маска вакансий вычисляется операциями над битовыми картами и бинарным поиском,
+    без просмотра строк датасета.
+    """
+
+    # Категориальные поля, по которым строятся битовые карты.
+    FIELDS = ('category', 'schedule', 'employment', 'area', 'experience', 'salary_currency')
+
+    # Параметры фильтра зарплаты.
+    SALARY_FIELDS = ('salary_min', 'salary_max')
+
+    def __init__(self, vacancy_df: pd.DataFrame):
+        """
+        :param vacancy_df: Датасет вакансий.
+        """
+
+        self.n_rows = len(vacancy_df)
+        self._bitsets = {}
+        self._salary = None
+
+        for field in self.FIELDS:
+            if field not in vacancy_df.columns:
+                continue
+
+            values = vacancy_df[field].fillna('').astype(str).to_numpy()
+            codes, uniques = pd.factorize(values)
+            bitsets = {}
+            for code, value in enumerate(uniques):
+                bitsets[value] = np.packbits(codes == code)
+            self._bitsets[field] = bitsets
+
+        if 'salary_from' in vacancy_df.columns and 'salary_to' in vacancy_df.columns:
+            salary_from = pd.to_numeric(vacancy_df['salary_from'], errors='coerce').to_numpy(dtype=np.float64)
+            salary_to = pd.to_numeric(vacancy_df['salary_to'], errors='coerce').to_numpy(dtype=np.float64)
+
+            # Нижняя и верхняя граница зарплаты (если указана только одна граница, то она используется для обеих).
+            low = np.where(np.isnan(salary_from), salary_to, salary_from)
+            high = np.where(np.isnan(salary_to), salary_from, salary_to)
+
+            self._salary = {}
+            for name, values in (('low', low), ('high', high)):
+                rows = np.flatnonzero(~np.isnan(values))
+                order = np.argsort(values[rows], kind='stable')
+                self._salary[name] = (values[rows][order], rows[order])
+
+    @property
+    def fields(self) -> tuple:
+        """
+        Поддерживаемые параметры фильтра.
+        """
+
+        fields = tuple(self._bitsets.keys())
+        if self._salary is not None:
+            fields += self.SALARY_FIELDS
+        return fields
+
+    @staticmethod
+    def normalize_filters(filters: dict) -> tuple:
+        """
+        Приведение фильтра к каноническому виду (ключ кэша результатов поиска).
+
+        :param filters: {field: value или список значений, 'salary_min': число, 'salary_max': число}
+                        (либо уже приведенный фильтр).
+        :return: Кортеж ((field, values), ...), пустые значения отбрасываются.
+        :raises ValueError: Некорректный фильтр.
+        """
+
+        if filters is None:
+            return ()
+        if isinstance(filters, tuple):
+            return filters
+        if not isinstance(filters, dict):
+            raise ValueError('Filters must be an object')
+
+        normalized = []
+        for field, value in sorted(filters.items()):
+            if value is None or value == '' or value == []:
+                continue
+            if field in FilterIndex.SALARY_FIELDS:
+                normalized.append((field, FilterIndex._to_salary(field, value)))
+            else:
+                values = value if isinstance(value, (list, tuple)) else [value]
+                if any(isinstance(v, (dict, list, tuple)) for v in values):
+                    raise ValueError(f'Filter "{field}" must be a value or a list of values')
+                normalized.append((field, tuple(sorted(str(v) for v in values))))
+        return tuple(normalized)
+
+    @staticmethod
+    def _to_salary(field: str, value) -> float:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f'Filter "{field}" must be a number')
+        try:
+            salary = float(value)
+        except ValueError:
+            raise ValueError(f'Filter "{field}" must be a number') from None
+        if not np.isfinite(salary):
+            raise ValueError(f'Filter "{field}" must be a finite number')
+        return salary
+
+    def _get_salary_bits(self, field: str, value: float) -> np.ndarray:
+        if field == 'salary_min':
+            # Верхняя граница зарплаты не меньше value.
+            values, rows = self._salary['high']
+            rows = rows[np.searchsorted(values, value, side='left'):]
+        else:
+            # Нижняя граница зарплаты не больше value.
+            values, rows = self._salary['low']
+            rows = rows[:np.searchsorted(values, value, side='right')]
+
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def get_mask(self, filters) -> np.ndarray:
+        """
+        Маска вакансий, удовлетворяющих фильтру: значения одного поля объединяются (ИЛИ),
+        разные поля пересекаются (И).
+
+        :param filters: Фильтр (словарь или результат normalize_filters).
+        :return: Логический массив по строкам датасета или None если фильтр пустой.
+        """
+
+        if isinstance(filters, dict):
+            filters = self.normalize_filters(filters)
+        if not filters:
+            return None
+
+        bits = None
+        for field, value in filters:
+            if field in self.SALARY_FIELDS:
+                if self._salary is None:
+                    raise ValueError(f'Unknown filter "{field}"')
+                field_bits = self._get_salary_bits(field, value)
+            else:
+                bitsets = self._bitsets.get(field)
+                if bitsets is None:
+                    raise ValueError(f'Unknown filter "{field}"')
+                field_bits = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+                for v in value:
+                    if v in bitsets:
+                        field_bits |= bitsets[v]
+
+            bits = field_bits if bits is None else bits & field_bits
+
+        return np.unpackbits(bits, count=self.n_rows).astype(bool)
@@ -0,0 +1,484 @@
+import json
+import os
+import shutil
+
+from threading import Lock
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from src.searcher.algorithms.BaseModel import BaseModel
+from src.searcher.algorithms.FusedModel import FusedModel
+
+
+class ModelRegistry:
+    """
+    Реестр моделей поиска.
+
+    Все пары (модель, поле) загружаются с диска один раз (либо обучаются, если
+    модель еще не сохранена) и дальше используются только для чтения. Загрузка
+    выполняется под блокировкой, а готовый набор моделей подменяется целиком,
+    поэтому потоки Flask всегда видят согласованное состояние. Проверка изменения
+    файлов моделей и их перезагрузка (refresh) выполняются фоновым потоком сервиса,
+    а не потоками обработки запросов.
+
+    Модели на диске хранятся поколениями: файлы моделей записываются в новую директорию
+    '/data/model/<модель>/v<N>', затем поколение фиксируется атомарной заменой файла
+    'model.json'. Процессы сервиса загружают только зафиксированные поколения, поэтому
+    никогда не видят частично обновленный набор моделей полей.
+
+    Если включен режим fused_enable, то для моделей, зарегистрированных с fused=True, дополнительно
+    загружается объединенная модель полей (см. FusedModel), которая хранится рядом с моделями полей
+    и перестраивается при их изменении.
+    """
+
+    def __init__(self, working_dir: str, fields: list, fused_enable: bool = False):
+        """
+        :param working_dir: Директория проекта.
+        :param fields: Список полей вакансии [(field, weight), ...].
+        :param fused_enable: Строить объединенную матрицу полей с учетом весов полей для каждой модели.
+        """
+
+        self._working_dir = working_dir
+        self._fields = [field for field, _ in fields]
+        self._weights = dict(fields)
+        self._fused_enable = fused_enable
+        self._factories = {}
+        self._models = {}
+        self._lock = Lock()
+
+        # Версия загруженных моделей, увеличивается при каждой (пере)загрузке.
+        self._generation = 0
+        self._signature = None
+        self._load_error = None
+
+    def register(self, name: str, factory: Callable[[], BaseModel], split: bool = False, fused: bool = True) -> None:
+        """
+        Регистрация модели.
+
+        :param name: Название модели, например, 'bow'.
+        :param factory: Функция создания нового экземпляра модели.
+        :param split: Модель принимает на вход список токенов, а не строку.
+        :param fused: Строить объединенную модель полей (в режиме fused_enable), False - модель
+                      обслуживается без нее (например, по инвертированному индексу).
+        :return:
+        """
+        self._factories[name] = (factory, split, fused)
+
+    @property
+    def names(self) -> list:
+        return list(self._factories.keys())
+
+    def is_split(self, name: str) -> bool:
+        return self._factories[name][1]
+
+    def is_fused(self, name: str) -> bool:
+        return self._fused_enable and self._factories[name][2]
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    @property
+    def load_error(self):
+        """
+        Ошибка последней перезагрузки моделей (см. refresh) или None.
+        """
+
+        return self._load_error
+
+    def is_loaded(self, name: str) -> bool:
+        models = self._models
+        if self.is_fused(name) and (name, FusedModel.FIELD) not in models:
+            return False
+        return all((name, field) in models for field in self._fields)
+
+    def _get_base_path(self, name: str) -> str:
+        return f'{self._working_dir}/data/model/{name}'
+
+    def _get_manifest_path(self, name: str) -> str:
+        return f'{self._get_base_path(name)}/model.json'
+
+    def _read_manifest(self, name: str):
+        """
+        Текущее поколение модели name: {'version': N, 'dir': 'v00000N'} или None если модель
+        сохранена без поколений (предыдущая версия, файлы лежат в директории модели).
+        """
+
+        file_path = self._get_manifest_path(name)
+        if not os.path.isfile(file_path):
+            return None
+        with open(file_path, mode='r', encoding='utf8') as fr:
+            return json.load(fr)
+
+    def get_dir_path(self, name: str, manifest: dict = None) -> str:
+        """
+        Директория текущего поколения модели name.
+        """
+
+        manifest = manifest if manifest is not None else self._read_manifest(name)
+        if manifest is None:
+            return self._get_base_path(name)
+        return f'{self._get_base_path(name)}/{manifest["dir"]}'
+
+    def get_file_path(self, name: str, field: str, dir_path: str = None) -> str:
+        return f'{dir_path or self.get_dir_path(name)}/{field}.model'
+
+    def get_ids_path(self, name: str, dir_path: str = None) -> str:
+        return f'{dir_path or self.get_dir_path(name)}/ids.npy'
+
+    def get_ids(self, name: str, dir_path: str = None):
+        """
+        Идентификаторы вакансий, по которым построены модели name (в порядке строк матриц моделей).
+
+        :return: Массив идентификаторов или None если модель сохранена без них (предыдущая версия).
+        """
+
+        file_path = self.get_ids_path(name, dir_path)
+        return np.load(file_path) if os.path.isfile(file_path) else None
+
+    def _save_ids(self, name: str, ids, dir_path: str) -> None:
+        file_path = self.get_ids_path(name, dir_path)
+        with open(f'{file_path}.tmp', mode='wb') as fw:
+            np.save(fw, np.asarray(ids, dtype=str))
+        os.replace(f'{file_path}.tmp', file_path)
+
+    def _is_saved(self, name: str, dir_path: str = None) -> bool:
+        dir_path = dir_path or self.get_dir_path(name)
+        return all(os.path.isfile(self.get_file_path(name, field, dir_path)) for field in self._fields)
+
+    def is_saved(self) -> bool:
+        """
+        Все модели обучены и сохранены на диске (для загрузки не нужен датасет вакансий).
+        """
+
+        return all(self._is_saved(name) for name in self.names)
+
+    def _get_signature(self) -> dict:
+        """
+        Сигнатура моделей на диске: {модель: директория текущего поколения}.
+        """
+
+        return {name: self.get_dir_path(name) for name in self.names}
+
+    def _new_generation(self, name: str) -> tuple:
+        """
+        Директория нового поколения модели name (файлы пишутся в нее, текущее поколение не меняется).
+
+        :return: (версия, путь к директории).
+        """
+
+        manifest = self._read_manifest(name)
+        version = (manifest['version'] if manifest is not None else 0) + 1
+        dir_path = f'{self._get_base_path(name)}/v{version:06d}'
+        # Директория могла остаться от сбоя до фиксации поколения.
+        shutil.rmtree(dir_path, ignore_errors=True)
+        os.makedirs(dir_path)
+        return version, dir_path
+
+    def _commit(self, name: str, version: int, dir_path: str) -> None:
+        """
+        Фиксация нового поколения модели name атомарной заменой файла 'model.json'.
+
+        Предыдущее поколение сохраняется (его могут дочитывать процессы сервиса),
+        более старые поколения удаляются.
+        """
+
+        previous = self._read_manifest(name)
+        file_path = self._get_manifest_path(name)
+        with open(f'{file_path}.tmp', mode='w', encoding='utf8') as fw:
+            json.dump({'version': version, 'dir': os.path.basename(dir_path)}, fw)
+        os.replace(f'{file_path}.tmp', file_path)
+
+        if previous is None:
+            # Файлы модели без поколений удаляются при фиксации следующего поколения.
+            return
+
+        keep = {os.path.basename(dir_path), previous['dir'], os.path.basename(file_path)}
+        base_path = self._get_base_path(name)
+        for entry in os.listdir(base_path):
+            if entry not in keep:
+                if os.path.isdir(f'{base_path}/{entry}'):
+                    shutil.rmtree(f'{base_path}/{entry}', ignore_errors=True)
+                else:
+                    os.remove(f'{base_path}/{entry}')
+
+    def get_corpus(self, name: str, field: str, vacancy_df: pd.DataFrame) -> list:
+        corpus = vacancy_df[f'{field}_tok'].tolist()
+        if self.is_split(name):
+            return [w.split() for w in corpus]
+        return corpus
+
+    def _create(self, name: str, field: str, dir_path: str) -> BaseModel:
+        """
+        Загрузка модели с диска.
+        """
+
+        file_path = self.get_file_path(name, field, dir_path)
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f'Model file "{file_path}" not found')
+
+        factory, _, _ = self._factories[name]
+        model = factory()
+        model.load(file_path)
+        return model
+
+    def _check(self, name: str, models: dict, dir_path: str) -> None:
+        """
+        Проверка согласованности моделей полей name: одинаковое количество документов,
+        совпадающее с количеством сохраненных ID вакансий.
+
+        :raises ValueError: Модели построены по разным версиям датасета.
+        """
+
+        n_docs = {models[(name, field)].n_docs for field in self._fields}
+        ids = self.get_ids(name, dir_path)
+        if len(n_docs) > 1 or (ids is not None and n_docs != {len(ids)}):
+            raise ValueError(f'Model "{name}" is inconsistent: documents {sorted(n_docs)}, '
+                             f'ids {None if ids is None else len(ids)}')
+
+    def _build(self, name: str, vacancy_df: pd.DataFrame) -> dict:
+        """
+        Обучение моделей полей name на всем датасете, новое поколение сохраняется на диск.
+
+        :return: Словарь {(name, field): модель}.
+        """
+
+        version, dir_path = self._new_generation(name)
+
+        models = {}
+        for field in self._fields:
+            print(f'fitting model "{name}" for "{field}_tok"')
+            factory, _, _ = self._factories[name]
+            model = factory()
+            model.fit(self.get_corpus(name, field, vacancy_df))
+            model.save(self.get_file_path(name, field, dir_path))
+            models[(name, field)] = model
+        if self.is_fused(name):
+            models[(name, FusedModel.FIELD)] = self._create_fused(name, models, dir_path)
+        # Список ID записывается последним.
+        self._save_ids(name, vacancy_df['id'], dir_path)
+
+        self._commit(name, version, dir_path)
+        return models
+
+    def _load_name(self, name: str, vacancy_df: pd.DataFrame = None, save: bool = True) -> dict:
+        """
+        Загрузка моделей полей name текущего поколения, если модели не сохранены, то они обучаются.
+
+        :param save: Сохранить построенную объединенную модель на диск (см. _create_fused).
+        :return: Словарь {(name, field): модель}.
+        """
+
+        dir_path = self.get_dir_path(name)
+        if not self._is_saved(name, dir_path):
+            # NOTE: При первом запуске происходит создание и кэширование модели (занимает некоторое время).
+            if vacancy_df is None:
+                raise FileNotFoundError(f'Model "{name}" not found in "{dir_path}"')
+            return self._build(name, vacancy_df)
+
+        models = {}
+        for field in self._fields:
+            print(f'loading model "{name}" for "{field}_tok"')
+            models[(name, field)] = self._create(name, field, dir_path)
+        self._check(name, models, dir_path)
+        if self.is_fused(name):
+            models[(name, FusedModel.FIELD)] = self._create_fused(name, models, dir_path, save=save)
+        return models
+
+    def _get_fused_stamp(self, name: str, dir_path: str) -> list:
+        """
+        Отметка файлов моделей полей (вес поля, размер и время изменения файла модели),
+        по которым построена объединенная модель.
+        """
+
+        stamp = []
+        for field in self._fields:
+            stat = os.stat(self.get_file_path(name, field, dir_path))
+            stamp.append([field, self._weights[field], stat.st_size, stat.st_mtime_ns])
+        return stamp
+
+    def _create_fused(self, name: str, models: dict, dir_path: str, save: bool = True) -> FusedModel:
+        """
+        Загрузка объединенной модели полей с диска, если она построена по текущим файлам моделей полей,
+        иначе объединенная модель строится заново.
+
+        :param models: Набор моделей, в котором уже есть модели полей name.
+        :param dir_path: Директория поколения моделей полей.
+        :param save: Сохранить построенную модель на диск (при перезагрузке моделей в процессах сервиса
+                     модель строится только в памяти, на диск ее сохраняет процесс, обновивший модели).
+        """
+
+        model = FusedModel([(models[(name, field)], self._weights[field]) for field in self._fields])
+
+        file_path = self.get_file_path(name, FusedModel.FIELD, dir_path)
+        stamp = self._get_fused_stamp(name, dir_path)
+        if os.path.isfile(file_path):
+            with open(file_path, mode='r', encoding='utf8') as fr:
+                if json.load(fr) == stamp:
+                    model.load(file_path)
+                    return model
+
+        print(f'building fused model "{name}"')
+        model.fit()
+        if save:
+            model.save(file_path)
+            with open(f'{file_path}.tmp', mode='w', encoding='utf8') as fw:
+                json.dump(stamp, fw)
+            os.replace(f'{file_path}.tmp', file_path)
+
+        return model
+
+    def load(self, vacancy_df: pd.DataFrame = None, names: list = None) -> None:
+        """
+        Загрузка моделей в память.
+
+        :param vacancy_df: Датасет вакансий, нужен для обучения отсутствующих на диске моделей.
+        :param names: Список моделей для загрузки, по умолчанию загружаются все.
+        :return:
+        """
+
+        with self._lock:
+            models = dict(self._models)
+            for name in names or self.names:
+                if not self.is_loaded(name):
+                    models.update(self._load_name(name, vacancy_df))
+            # Подменяем набор моделей целиком (атомарная операция).
+            self._models = models
+            self._signature = self._get_signature()
+            self._generation += 1
+
+    def update(self, vacancy_df: pd.DataFrame, names: list = None) -> int:
+        """
+        Добавление новых вакансий в обученные модели без полного переобучения.
+
+        Датасет должен начинаться с вакансий, по которым построены модели (в том же порядке),
+        новыми считаются вакансии после них. Обновленные модели сохраняются новым поколением
+        (см. _commit) и подменяют текущие, остальные процессы сервиса подхватят их через refresh().
+        Модели, которые еще не сохранены на диске (например, добавленные в новой версии),
+        обучаются на всем датасете.
+
+        :param vacancy_df: Датасет вакансий.
+        :param names: Список моделей для обновления, по умолчанию все.
+        :return: Количество добавленных вакансий.
+        :raises ValueError: Датасет не является продолжением датасета моделей, нужно полное переобучение.
+        """
+
+        with self._lock:
+            models = dict(self._models)
+            n_added = 0
+            changed = False
+
+            for name in names or self.names:
+                dir_path = self.get_dir_path(name)
+                if not any(os.path.isfile(self.get_file_path(name, field, dir_path)) for field in self._fields):
+                    models.update(self._build(name, vacancy_df))
+                    changed = True
+                    continue
+                if not self._is_saved(name, dir_path):
+                    raise ValueError(f'Model "{name}" is saved partially, full rebuild required')
+
+                # Модели загружаются с диска заново: текущие экземпляры используются запросами.
+                field_models = {(name, field): self._create(name, field, dir_path) for field in self._fields}
+                n_docs = next(iter(field_models.values())).n_docs
+
+                # Без списка ID (модели сохранены предыдущей версией) нельзя проверить, что вакансии
+                # датасета идут в том же порядке, что и строки моделей.
+                ids = self.get_ids(name, dir_path)
+                if ids is None or len(vacancy_df) < n_docs or (
+                        not np.array_equal(vacancy_df['id'].iloc[:n_docs].to_numpy(dtype=str), ids)):
+                    raise ValueError(f'Dataset does not extend model "{name}", full rebuild required')
+                self._check(name, field_models, dir_path)
+
+                new_df = vacancy_df.iloc[n_docs:]
+                if new_df.empty:
+                    continue
+
+                # Обновленные модели пишутся в новое поколение, процессы сервиса до фиксации
+                # поколения продолжают читать текущее.
+                version, new_dir_path = self._new_generation(name)
+                for (_, field), model in field_models.items():
+                    print(f'updating model "{name}" for "{field}_tok": {len(new_df)} new documents')
+                    model.update(self.get_corpus(name, field, new_df))
+                    model.save(self.get_file_path(name, field, new_dir_path))
+                if self.is_fused(name):
+                    field_models[(name, FusedModel.FIELD)] = self._create_fused(name, field_models, new_dir_path)
+                self._save_ids(name, vacancy_df['id'], new_dir_path)
+                self._commit(name, version, new_dir_path)
+
+                models.update(field_models)
+                n_added = max(n_added, len(new_df))
+                changed = True
+
+            if changed:
+                self._models = models
+                self._signature = self._get_signature()
+                self._generation += 1
+
+            return n_added
+
+    def rebuild(self, vacancy_df: pd.DataFrame, names: list = None) -> None:
+        """
+        Полное переобучение моделей на датасете. Новые модели сохраняются новым поколением,
+        процессы сервиса продолжают работать с текущими моделями до фиксации поколения.
+
+        :param vacancy_df: Датасет вакансий.
+        :param names: Список моделей, по умолчанию все.
+        """
+
+        with self._lock:
+            models = dict(self._models)
+            for name in names or self.names:
+                models.update(self._build(name, vacancy_df))
+            self._models = models
+            self._signature = self._get_signature()
+            self._generation += 1
+
+    def refresh(self) -> bool:
+        """
+        Перезагрузка моделей, для которых на диске зафиксировано новое поколение.
+
+        Вызывается периодически фоновым потоком (см. RESTService), запросы продолжают
+        работать с текущими моделями до подмены набора моделей.
+
+        :return: True если модели были перезагружены.
+        """
+
+        # Проверку выполняет только один поток, остальные продолжают работать с текущими моделями.
+        if not self._lock.acquire(blocking=False):
+            return False
+
+        try:
+            signature = self._get_signature()
+            if signature == self._signature:
+                return False
+
+            models = dict(self._models)
+            for name in {name for name, _ in self._models.keys()}:
+                if signature.get(name) != (self._signature or {}).get(name):
+                    models.update(self._load_name(name, save=False))
+
+            self._models = models
+            self._signature = signature
+            self._generation += 1
+            self._load_error = None
+            print('models reloaded')
+            return True
+        except Exception as err:
+            # Поколение моделей не удалось загрузить, текущие модели остаются, повторим попытку позже.
+            print("err: " + str(err))
+            self._load_error = str(err)
+            return False
+        finally:
+            self._lock.release()
+
+    def get(self, name: str, field: str) -> BaseModel:
+        return self._models[(name, field)]
+
+    def get_fused(self, name: str):
+        """
+        Объединенная модель полей name или None если режим fused_enable выключен.
+        """
+
+        return self._models.get((name, FusedModel.FIELD))
@@ -0,0 +1,88 @@
+import time
+
+from collections import OrderedDict
+from threading import Lock
+
+
+class QueryCache:
+    """
+    Кэш результатов поиска с вытеснением LRU и (опционально) временем жизни записей.
+
+    Ключ кэша формируется из нормализованного запроса, поэтому разные написания
+    запроса, которые приводятся к одним и тем же токенам, разделяют одну запись.
+    Каждая запись хранит версию моделей, для которой вычислено значение: запись с другой
+    версией считается устаревшей. Версии разных моделей (например, версии индексов сегментов)
+    меняются независимо, поэтому общей версии кэша нет, устаревшие записи вытесняются LRU.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = None):
+        """
+        :param max_size: Максимальное количество записей в кэше.
+        :param ttl: Время жизни записи в секундах, None - без ограничения.
+        """
+
+        self._max_size = max_size
+        self._ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, version=None):
+        """
+        Получить значение из кэша.
+
+        :param key: Ключ записи.
+        :param version: Версия моделей, значение другой версии считается устаревшим.
+        :return: Значение или None если значение не найдено (либо устарело).
+        """
+
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expire_at, item_version, value = item
+                if item_version == version and (expire_at is None or expire_at > time.monotonic()):
+                    self._data.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._data[key]
+
+            self._misses += 1
+            return None
+
+    def put(self, key, value, version=None) -> None:
+        """
+        Добавить значение в кэш.
+
+        :param key: Ключ записи.
+        :param value: Значение.
+        :param version: Версия моделей для которых вычислено значение.
+        :return:
+        """
+
+        if self._max_size <= 0:
+            return
+
+        expire_at = time.monotonic() + self._ttl if self._ttl else None
+
+        with self._lock:
+            self._data[key] = (expire_at, version, value)
+            self._data.move_to_end(key)
+
+            # Вытеснить давно не использованные записи.
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'max_size': self._max_size,
+                'ttl': self._ttl,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
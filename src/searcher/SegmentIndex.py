@@ -0,0 +1,428 @@
+import json
+import os
+import shutil
+
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from scipy import sparse
+
+from src.parser.ColumnStore import ColumnStore
+from src.searcher.FilterIndex import FilterIndex
+from src.searcher.algorithms.BaseModel import BaseModel
+
+
+class Segment:
+    """
+    Неизменяемый сегмент индекса: вакансии за один день (или за несколько дней после слияния).
+
+    Директория сегмента:
+    - '<field>_matrix' - матрица документов поля (см. BaseModel._save_matrix);
+    - 'rows.columns' - поля вакансий для ответа (ColumnStore);
+    - 'deleted.npy' - битовая карта удаленных вакансий (tombstones), единственный изменяемый файл;
+    - 'meta.json' - количество вакансий и диапазон дней.
+    """
+
+    def __init__(self, dir_path: str, fields: list):
+        self.dir_path = dir_path
+        self.name = os.path.basename(dir_path)
+
+        with open(f'{dir_path}/meta.json', mode='r', encoding='utf8') as fr:
+            meta = json.load(fr)
+
+        self.n_rows = meta['rows']
+        self.day_from = meta['day_from']
+        self.day_to = meta['day_to']
+        self.rows = ColumnStore(f'{dir_path}/rows.columns').read()
+        self._matrices = {field: BaseModel._load_matrix(f'{dir_path}/{field}_matrix') for field in fields}
+
+        self.deleted = np.zeros(self.n_rows, dtype=bool)
+        if os.path.isfile(f'{dir_path}/deleted.npy'):
+            self.deleted = np.load(f'{dir_path}/deleted.npy')
+
+        self._filter_index = None
+
+    @property
+    def filter_index(self) -> FilterIndex:
+        if self._filter_index is None:
+            self._filter_index = FilterIndex(self.rows)
+        return self._filter_index
+
+    @property
+    def n_live(self) -> int:
+        return self.n_rows - int(self.deleted.sum())
+
+    def get_matrix(self, field: str):
+        return self._matrices[field]
+
+    def set_deleted(self, deleted: np.ndarray) -> None:
+        np.save(f'{self.dir_path}/deleted.tmp.npy', deleted)
+        os.replace(f'{self.dir_path}/deleted.tmp.npy', f'{self.dir_path}/deleted.npy')
+        self.deleted = deleted
+
+    @staticmethod
+    def write(dir_path: str, rows: pd.DataFrame, matrices: dict, day_from: str, day_to: str) -> None:
+        tmp_dir_path = f'{dir_path}.tmp'
+        shutil.rmtree(tmp_dir_path, ignore_errors=True)
+        os.makedirs(tmp_dir_path)
+
+        for field, matrix in matrices.items():
+            BaseModel._save_matrix(f'{tmp_dir_path}/{field}_matrix', matrix)
+        ColumnStore(f'{tmp_dir_path}/rows.columns').write(rows.reset_index(drop=True))
+        with open(f'{tmp_dir_path}/meta.json', mode='w', encoding='utf8') as fw:
+            json.dump({'rows': len(rows), 'day_from': day_from, 'day_to': day_to}, fw)
+
+        # Директория с тем же именем могла остаться от сбоя между записью сегмента и фиксацией
+        # списка сегментов (next_id не был сохранен), в списке сегментов ее нет.
+        shutil.rmtree(dir_path, ignore_errors=True)
+        os.replace(tmp_dir_path, dir_path)
+
+
+class SegmentIndex:
+    """
+    Индекс вакансий из неизменяемых сегментов по дням публикации.
+
+    Новые вакансии добавляются новыми сегментами (по одному на день), поэтому
+    стоимость обновления индекса пропорциональна объему данных за день. Поиск
+    выполняется по всем сегментам, N-топ сегментов объединяются.
+
+    - удаление вакансии - отметка в битовой карте сегмента (tombstone), удаленные
+      вакансии исключаются при вычислении score;
+    - устаревание - удаление сегментов старше N дней целиком;
+    - слияние - соседние маленькие сегменты (и сегменты с большой долей удаленных
+      вакансий) переписываются в один сегмент без удаленных вакансий.
+
+    Список активных сегментов хранится в файле 'segments.json', его атомарная
+    замена фиксирует изменение индекса, процессы сервиса подхватывают его через refresh().
+    """
+
+    def __init__(self,
+                 dir_path: str,
+                 fields: list,
+                 columns: list,
+                 min_segment_size: int = 1000,
+                 max_deleted_ratio: float = 0.5):
+        """
+        :param dir_path: Директория индекса.
+        :param fields: Список полей вакансии.
+        :param columns: Столбцы вакансий, которые хранятся в сегментах (поля для ответа).
+        :param min_segment_size: Сегменты меньшего размера сливаются с соседними.
+        :param max_deleted_ratio: Сегменты с большей долей удаленных вакансий переписываются.
+        """
+
+        self._dir_path = dir_path
+        self._fields = fields
+        self._columns = columns
+        self._min_segment_size = min_segment_size
+        self._max_deleted_ratio = max_deleted_ratio
+
+        self._lock = Lock()
+        self._segments = []
+        self._ids = {}
+        # Удаленные вакансии {id: день} (чтобы они не добавлялись повторно), хранятся до устаревания дня.
+        self._deleted = {}
+        self._version = 0
+        self._next_id = 0
+        self._signature = None
+
+    @property
+    def segments(self) -> list:
+        return self._segments
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def ids(self) -> set:
+        """
+        Идентификаторы вакансий в индексе, включая удаленные.
+        """
+        return set(self._ids.keys()) | set(self._deleted.keys())
+
+    def _get_manifest_path(self) -> str:
+        return f'{self._dir_path}/segments.json'
+
+    def _get_signature(self):
+        file_path = self._get_manifest_path()
+        if not os.path.isfile(file_path):
+            return None
+        stat = os.stat(file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def refresh(self) -> bool:
+        """
+        Перечитать список сегментов, если индекс был изменен.
+
+        :return: True если индекс был перечитан.
+        """
+
+        signature = self._get_signature()
+        if signature == self._signature:
+            return False
+
+        with self._lock:
+            self._load()
+        return True
+
+    def _load(self) -> None:
+        self._signature = self._get_signature()
+        if self._signature is None:
+            return
+
+        with open(self._get_manifest_path(), mode='r', encoding='utf8') as fr:
+            manifest = json.load(fr)
+
+        # Сегменты неизменяемы: открываются заново только новые сегменты и карты удаленных вакансий.
+        opened = {segment.name: segment for segment in self._segments}
+        segments = []
+        for name in manifest['segments']:
+            segment = opened.get(name)
+            if segment is None:
+                segment = Segment(f'{self._dir_path}/{name}', self._fields)
+            elif os.path.isfile(f'{segment.dir_path}/deleted.npy'):
+                segment.deleted = np.load(f'{segment.dir_path}/deleted.npy')
+            segments.append(segment)
+
+        self._set_segments(segments)
+        self._deleted = manifest.get('deleted', {})
+        self._version = manifest['version']
+        self._next_id = manifest['next_id']
+
+    def _set_segments(self, segments: list) -> None:
+        ids = {}
+        for segment in segments:
+            for row, vacancy_id in enumerate(segment.rows['id'].tolist()):
+                if not segment.deleted[row]:
+                    ids[vacancy_id] = (segment, row)
+        self._segments = segments
+        self._ids = ids
+
+    def _commit(self, segments: list) -> None:
+        """
+        Зафиксировать новый список сегментов и удалить директории неиспользуемых сегментов.
+        """
+
+        self._version += 1
+        manifest = {
+            'version': self._version,
+            'next_id': self._next_id,
+            'segments': [segment.name for segment in segments],
+            'deleted': self._deleted,
+        }
+
+        os.makedirs(self._dir_path, exist_ok=True)
+        with open(f'{self._get_manifest_path()}.tmp', mode='w', encoding='utf8') as fw:
+            json.dump(manifest, fw, indent=2)
+        os.replace(f'{self._get_manifest_path()}.tmp', self._get_manifest_path())
+
+        names = {segment.name for segment in segments}
+        for segment in self._segments:
+            if segment.name not in names:
+                shutil.rmtree(segment.dir_path, ignore_errors=True)
+
+        self._set_segments(segments)
+        self._signature = self._get_signature()
+
+    def _create_segment(self, rows: pd.DataFrame, matrices: dict, day_from: str, day_to: str) -> Segment:
+        name = f'{day_from}_{day_to}_{self._next_id:06d}'
+        self._next_id += 1
+        Segment.write(f'{self._dir_path}/{name}', rows, matrices, day_from, day_to)
+        return Segment(f'{self._dir_path}/{name}', self._fields)
+
+    def _mark_deleted(self, ids) -> list:
+        """
+        Отметить вакансии удаленными (в битовых картах сегментов).
+
+        :return: Список измененных сегментов.
+        """
+
+        changed = {}
+        for vacancy_id in ids:
+            found = self._ids.pop(vacancy_id, None)
+            if found is None:
+                continue
+            segment, row = found
+            if segment.name not in changed:
+                changed[segment.name] = (segment, segment.deleted.copy())
+            changed[segment.name][1][row] = True
+
+        for segment, deleted in changed.values():
+            segment.set_deleted(deleted)
+
+        return [segment for segment, _ in changed.values()]
+
+    def add(self, rows: pd.DataFrame, transform: Callable[[str, pd.DataFrame], object]) -> int:
+        """
+        Добавление вакансий: по одному новому сегменту на каждый день публикации.
+        Вакансии, которые уже есть в индексе, заменяются (старая версия отмечается удаленной).
+
+        :param rows: Вакансии (столбцы columns, столбец 'day' - день публикации 'YYYYMMDD',
+                     и столбцы, нужные функции transform).
+        :param transform: Функция (field, rows) -> матрица документов поля (нормированные строки).
+        :return: Количество добавленных вакансий.
+        """
+
+        if rows.empty:
+            return 0
+
+        with self._lock:
+            self._load()
+
+            today = datetime.now().strftime('%Y%m%d')
+            days = rows['day'].fillna('').replace('', today)
+
+            segments = list(self._segments)
+            for day in sorted(days.unique()):
+                day_rows = rows[(days == day).to_numpy()]
+                matrices = {field: transform(field, day_rows) for field in self._fields}
+                segments.append(self._create_segment(day_rows[self._columns].assign(day=day), matrices, day, day))
+
+            # Старые версии вакансий исключаются из поиска.
+            for vacancy_id in rows['id'].tolist():
+                self._deleted.pop(vacancy_id, None)
+            self._mark_deleted(rows['id'].tolist())
+            self._commit(segments)
+
+        return len(rows)
+
+    def delete(self, ids: list) -> int:
+        """
+        Удаление вакансий (отметка в битовой карте сегмента).
+
+        :return: Количество удаленных вакансий.
+        """
+
+        with self._lock:
+            self._load()
+            n_deleted = 0
+            for vacancy_id in ids:
+                found = self._ids.get(vacancy_id)
+                if found is not None:
+                    self._deleted[vacancy_id] = found[0].day_to
+                    n_deleted += 1
+            if n_deleted:
+                self._mark_deleted(ids)
+                self._commit(self._segments)
+
+        return n_deleted
+
+    def expire(self, max_age_days: int, today: datetime = None) -> int:
+        """
+        Удаление сегментов, все вакансии которых старше max_age_days дней.
+
+        :return: Количество удаленных сегментов.
+        """
+
+        cutoff = ((today or datetime.now()) - timedelta(days=max_age_days)).strftime('%Y%m%d')
+
+        with self._lock:
+            self._load()
+            segments = [segment for segment in self._segments if segment.day_to >= cutoff]
+            n_expired = len(self._segments) - len(segments)
+            deleted = {vacancy_id: day for vacancy_id, day in self._deleted.items() if day >= cutoff}
+            if n_expired or len(deleted) < len(self._deleted):
+                self._deleted = deleted
+                self._commit(segments)
+
+        return n_expired
+
+    def _merge_segments(self, run: list) -> Segment:
+        rows = []
+        matrices = {field: [] for field in self._fields}
+        for segment in run:
+            live = ~segment.deleted
+            rows.append(segment.rows[live])
+            for field in self._fields:
+                matrices[field].append(segment.get_matrix(field)[np.flatnonzero(live)])
+
+        return self._create_segment(
+            pd.concat(rows, ignore_index=True),
+            {field: sparse.vstack(parts, format='csr') if sparse.issparse(parts[0]) else np.vstack(parts)
+             for field, parts in matrices.items()},
+            min(segment.day_from for segment in run),
+            max(segment.day_to for segment in run))
+
+    def merge(self) -> int:
+        """
+        Слияние сегментов.
+
+        Подряд идущие (по дням) сегменты, в которых меньше min_segment_size вакансий,
+        объединяются, пока объединенный сегмент не достигнет min_segment_size.
+        Сегменты с долей удаленных вакансий больше max_deleted_ratio переписываются.
+
+        :return: Количество новых сегментов.
+        """
+
+        with self._lock:
+            self._load()
+
+            runs = []
+            run = []
+            for segment in sorted(self._segments, key=lambda s: (s.day_from, s.day_to, s.name)):
+                if segment.n_live < self._min_segment_size:
+                    run.append(segment)
+                    if sum(s.n_live for s in run) >= self._min_segment_size:
+                        runs.append(run)
+                        run = []
+                    continue
+
+                if run:
+                    runs.append(run)
+                    run = []
+                if segment.n_live < segment.n_rows * (1 - self._max_deleted_ratio):
+                    runs.append([segment])
+            if run:
+                runs.append(run)
+
+            runs = [run for run in runs if len(run) > 1 or run[0].deleted.any()]
+            if not runs:
+                return 0
+
+            merged = {segment.name for run in runs for segment in run}
+            segments = [segment for segment in self._segments if segment.name not in merged]
+            segments.extend(self._merge_segments(run) for run in runs)
+            self._commit(segments)
+
+        return len(runs)
+
+    def search(self, score: Callable[[Segment, np.ndarray], np.ndarray], n_top: int = 10, filters: tuple = None) -> pd.DataFrame:
+        """
+        Поиск N-топ вакансий по всем сегментам.
+
+        :param score: Функция (segment, rows) -> общий score вакансий rows сегмента (rows = None - все вакансии).
+        :param n_top: Количество вакансий в результате.
+        :param filters: Фильтр вакансий (см. FilterIndex), score вычисляется только для подходящих вакансий.
+        :return: DataFrame (поля вакансий и score) по убыванию score, вакансии с нулевым score не возвращаются.
+        """
+
+        found = []
+        for segment in self._segments:
+            rows = None
+            if filters:
+                rows = np.flatnonzero(segment.filter_index.get_mask(filters) & ~segment.deleted)
+                if len(rows) == 0:
+                    continue
+
+            segment_score = np.array(score(segment, rows), dtype=np.float64)
+            if rows is None:
+                segment_score[segment.deleted] = 0.0
+
+            n = min(n_top, len(segment_score))
+            if n == 0:
+                continue
+            idx = np.argpartition(-segment_score, n - 1)[:n]
+            idx = idx[segment_score[idx] > 0.0]
+            if len(idx):
+                found.append(segment.rows.iloc[idx if rows is None else rows[idx]].assign(score=segment_score[idx]))
+
+        if not found:
+            return pd.DataFrame(columns=['id', 'title', 'url', 'score'])
+
+        # Объединение N-топ сегментов.
+        df = pd.concat(found, ignore_index=True)
+        return df.sort_values('score', ascending=False, kind='stable').head(n_top).reset_index(drop=True)
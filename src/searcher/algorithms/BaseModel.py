@@ -1,16 +1,47 @@
+import json
+import os
 import pickle
+import shutil
+
+import numpy as np
 
 from abc import abstractmethod
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from sklearn.utils.extmath import safe_sparse_dot
 
 
 class BaseModel:
     """
     Базовый абстрактный класс.
     Для реализации общего интерфейса поиска для различных алгоритмов.
+
+    Матрица документов хранится с нормированными строками (L2), поэтому косинусное
+    сходство вычисляется одним произведением без копирования матрицы. На диске
+    матрица хранится в виде набора массивов .npy (см. _save_matrix), которые
+    открываются через memory map только для чтения: несколько процессов сервиса
+    разделяют одну копию матрицы в page cache.
     """
 
+    # Режим открытия массивов матрицы (None - загрузить в память).
+    mmap_mode = 'r'
+
     def __init__(self, **kwargs):
-        pass
+        self._sparse_matrix = None
+
+    @property
+    def n_docs(self) -> int:
+        """
+        Количество документов в матрице модели.
+        """
+        return 0 if self._sparse_matrix is None else self._sparse_matrix.shape[0]
+
+    @property
+    def matrix(self):
+        """
+        Матрица документов модели (нормированные строки).
+        """
+        return self._sparse_matrix
 
     def _save(self, file_path: str, obj: object):
         with open(file_path, mode='wb') as fw:
@@ -20,6 +51,134 @@ class BaseModel:
         with open(file_path, mode='rb') as fr:
             return pickle.load(fr)
 
+    @staticmethod
+    def _save_matrix(file_path: str, matrix, arrays: dict = None) -> None:
+        """
+        Сохранение матрицы в директорию file_path.
+
+        - разреженная матрица (CSR): data.npy, indices.npy, indptr.npy
+        - плотная матрица: vectors.npy
+
+        :param arrays: Дополнительные массивы {название: массив}, сохраняются рядом с матрицей
+                       в файлы '<название>.npy' (см. _load_array).
+        """
+
+        tmp_file_path = f'{file_path}.tmp'
+        shutil.rmtree(tmp_file_path, ignore_errors=True)
+        os.makedirs(tmp_file_path)
+
+        if sparse.issparse(matrix):
+            matrix = matrix.tocsr()
+            np.save(f'{tmp_file_path}/data.npy', matrix.data)
+            np.save(f'{tmp_file_path}/indices.npy', matrix.indices)
+            np.save(f'{tmp_file_path}/indptr.npy', matrix.indptr)
+            meta = {'format': 'csr', 'shape': list(matrix.shape)}
+        else:
+            np.save(f'{tmp_file_path}/vectors.npy', np.ascontiguousarray(matrix))
+            meta = {'format': 'dense', 'shape': list(matrix.shape)}
+
+        for name, array in (arrays or {}).items():
+            np.save(f'{tmp_file_path}/{name}.npy', array)
+
+        with open(f'{tmp_file_path}/meta.json', mode='w', encoding='utf8') as fw:
+            json.dump(meta, fw)
+
+        # Подменить матрицу целиком: процессы, открывшие старые файлы, продолжают работать с ними.
+        old_file_path = f'{file_path}.old'
+        shutil.rmtree(old_file_path, ignore_errors=True)
+        if os.path.isdir(file_path):
+            os.replace(file_path, old_file_path)
+        os.replace(tmp_file_path, file_path)
+        shutil.rmtree(old_file_path, ignore_errors=True)
+
+    @classmethod
+    def _load_matrix(cls, file_path: str):
+        with open(f'{file_path}/meta.json', mode='r', encoding='utf8') as fr:
+            meta = json.load(fr)
+
+        if meta['format'] == 'csr':
+            return sparse.csr_matrix(
+                (np.load(f'{file_path}/data.npy', mmap_mode=cls.mmap_mode),
+                 np.load(f'{file_path}/indices.npy', mmap_mode=cls.mmap_mode),
+                 np.load(f'{file_path}/indptr.npy', mmap_mode=cls.mmap_mode)),
+                shape=tuple(meta['shape']),
+                copy=False)
+
+        return np.load(f'{file_path}/vectors.npy', mmap_mode=cls.mmap_mode)
+
+    @classmethod
+    def _load_array(cls, file_path: str, name: str):
+        """
+        Дополнительный массив матрицы (см. _save_matrix) или None если он не сохранен.
+        """
+
+        array_path = f'{file_path}/{name}.npy'
+        return np.load(array_path, mmap_mode=cls.mmap_mode) if os.path.isfile(array_path) else None
+
+    def _save_sparse_matrix(self, file_path: str, matrix) -> None:
+        self._save_matrix(f'{file_path}_matrix', matrix)
+
+    def _load_sparse_matrix(self, file_path: str):
+        """
+        Загрузка матрицы документов, поддерживается формат предыдущей версии (pickle).
+        """
+
+        if os.path.isdir(f'{file_path}_matrix'):
+            return self._load_matrix(f'{file_path}_matrix')
+
+        return normalize(self._load(f'{file_path}_sparse_matrix'))
+
+    @staticmethod
+    def _append_rows(matrix, rows):
+        """
+        Добавление строк новых документов в конец матрицы документов.
+        """
+
+        if sparse.issparse(matrix):
+            return sparse.vstack([matrix, rows], format='csr')
+        return np.vstack([matrix, rows])
+
+    @staticmethod
+    def _cosine_similarity(queries, matrix) -> np.ndarray:
+        """
+        Косинусное сходство запросов с документами (строки matrix должны быть нормированы).
+
+        :return: Матрица размера (количество запросов, количество документов).
+        """
+
+        return safe_sparse_dot(normalize(queries), matrix.T, dense_output=True)
+
+    def transform_corpus(self, corpus):
+        """
+        Матрица документов (нормированные строки) для корпуса при текущем словаре и весах модели,
+        модель не меняется (используется для сегментов индекса, см. SegmentIndex).
+        """
+
+        return normalize(self.transform_batch(corpus))
+
+    def get_similarity_matrix(self, query, matrix) -> np.ndarray:
+        """
+        Сходство запроса с документами произвольной матрицы документов (см. transform_corpus).
+        """
+
+        return self._cosine_similarity(query, matrix).flatten()
+
+    def get_terms(self, query, weight: float = 1.0):
+        """
+        Списки документов термов запроса для поиска по инвертированному индексу.
+
+        :return: Список [(doc_ids, contributions, upper_bound), ...] или None если модель не поддерживает индекс.
+        """
+        return None
+
+    def get_candidates(self, query, n_probe: int = None):
+        """
+        Номера документов-кандидатов для запроса по индексу приближенного поиска.
+
+        :return: Отсортированный массив номеров документов или None если модель не поддерживает индекс.
+        """
+        return None
+
     def save(self, file_path: str):
         pass
 
@@ -30,10 +189,39 @@ class BaseModel:
     def fit(self, corpus):
         pass
 
+    @abstractmethod
+    def update(self, corpus):
+        """
+        Добавление новых документов в обученную модель без полного переобучения.
+        Строки новых документов добавляются в конец матрицы документов.
+        """
+        pass
+
     @abstractmethod
     def transform(self, query):
         pass
 
     @abstractmethod
-    def get_similarity(self, query):
+    def get_similarity(self, query, rows: np.ndarray = None):
+        """
+        Вычисление сходства запроса с документами.
+
+        :param rows: Номера документов, None - все документы.
+        """
+        pass
+
+    @abstractmethod
+    def transform_batch(self, queries: list):
+        """
+        Преобразование списка запросов в матрицу запросов (одна строка на запрос).
+        """
+        pass
+
+    @abstractmethod
+    def get_similarity_batch(self, queries):
+        """
+        Вычисление сходства матрицы запросов со всеми документами.
+
+        :return: Матрица размера (количество запросов, количество документов).
+        """
         pass
@@ -1,7 +1,12 @@
+import os
+
+import numpy as np
+
 from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 
 from src.searcher.algorithms.BaseModel import BaseModel
+from src.searcher.algorithms.InvertedIndex import InvertedIndex
 
 
 class BoWModel(BaseModel):
@@ -13,20 +18,46 @@ class BoWModel(BaseModel):
         super().__init__(**kwargs)
         self._vectorizer = CountVectorizer(**kwargs)
         self._sparse_matrix = None
+        self._index = None
 
     def save(self, file_path: str):
         super()._save(file_path, self._vectorizer)
-        super()._save(f'{file_path}_sparse_matrix', self._sparse_matrix)
+        super()._save_sparse_matrix(file_path, self._sparse_matrix)
+        super()._save_matrix(f'{file_path}_index', self._index.postings,
+                             arrays={'max_weights': self._index.max_weights})
 
     def load(self, file_path: str):
         self._vectorizer = super()._load(file_path)
-        self._sparse_matrix = super()._load(f'{file_path}_sparse_matrix')
+        self._sparse_matrix = super()._load_sparse_matrix(file_path)
+        if os.path.isdir(f'{file_path}_index'):
+            self._index = InvertedIndex()
+            self._index.set_postings(super()._load_matrix(f'{file_path}_index'),
+                                     max_weights=super()._load_array(f'{file_path}_index', 'max_weights'))
+        else:
+            # Модель сохранена без индекса, индекс строится по матрице документов.
+            self._index = InvertedIndex(self._sparse_matrix)
 
     def fit(self, corpus):
-        self._sparse_matrix = self._vectorizer.fit_transform(corpus).astype('float')
+        self._sparse_matrix = normalize(self._vectorizer.fit_transform(corpus).astype('float'))
+        self._index = InvertedIndex(self._sparse_matrix)
+
+    def update(self, corpus):
+        # Словарь не меняется, новые документы векторизуются по текущему словарю.
+        self._sparse_matrix = self._append_rows(self._sparse_matrix, normalize(self.transform_batch(corpus)))
+        self._index = InvertedIndex(self._sparse_matrix)
 
     def transform(self, query):
         return self._vectorizer.transform([query]).astype('float')
 
-    def get_similarity(self, query):
-        return cosine_similarity(query, self._sparse_matrix).flatten()
+    def get_similarity(self, query, rows: np.ndarray = None):
+        matrix = self._sparse_matrix if rows is None else self._sparse_matrix[rows]
+        return self._cosine_similarity(query, matrix).flatten()
+
+    def get_terms(self, query, weight: float = 1.0):
+        return self._index.get_terms(normalize(query), weight)
+
+    def transform_batch(self, queries: list):
+        return self._vectorizer.transform(queries).astype('float')
+
+    def get_similarity_batch(self, queries):
+        return self._cosine_similarity(queries, self._sparse_matrix)
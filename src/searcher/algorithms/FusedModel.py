@@ -0,0 +1,71 @@
+import numpy as np
+
+from scipy import sparse
+from sklearn.preprocessing import normalize
+from sklearn.utils.extmath import safe_sparse_dot
+
+from src.searcher.algorithms.BaseModel import BaseModel
+
+
+class FusedModel(BaseModel):
+    """
+    Объединенная матрица документов по нескольким полям вакансии.
+
+    Матрицы документов полей (строки нормированы) умножаются на веса полей и склеиваются
+    по столбцам: [w_1 * M_1, w_2 * M_2, ...]. Вектор запроса - склейка нормированных
+    векторов запроса для каждого поля, поэтому одно произведение матрицы на вектор
+    сразу дает общий score = sum(w_i * cos_i) (см. Searcher._calc_score).
+
+    Модели полей используются только для преобразования запроса.
+    """
+
+    # Название "поля" объединенной модели в реестре моделей.
+    FIELD = 'fused'
+
+    def __init__(self, models: list, **kwargs):
+        """
+        :param models: Обученные модели полей [(model, weight), ...].
+        """
+
+        super().__init__(**kwargs)
+        self._models = models
+
+    def fit(self, corpus=None):
+        """
+        Построение объединенной матрицы по текущим матрицам моделей полей (корпус не нужен).
+        """
+
+        blocks = [model.matrix * weight for model, weight in self._models]
+        if sparse.issparse(blocks[0]):
+            self._sparse_matrix = sparse.hstack(blocks, format='csr')
+        else:
+            self._sparse_matrix = np.hstack(blocks)
+
+    def update(self, corpus=None):
+        self.fit()
+
+    def save(self, file_path: str):
+        super()._save_sparse_matrix(file_path, self._sparse_matrix)
+
+    def load(self, file_path: str):
+        self._sparse_matrix = super()._load_sparse_matrix(file_path)
+
+    def transform(self, query):
+        queries = self.transform_batch([query])
+        return queries if sparse.issparse(queries) else queries[0]
+
+    def transform_batch(self, queries: list):
+        blocks = [normalize(model.transform_batch(queries)) for model, _ in self._models]
+        if sparse.issparse(self._sparse_matrix):
+            return sparse.hstack(blocks, format='csr')
+        return np.hstack(blocks).astype(self._sparse_matrix.dtype, copy=False)
+
+    def get_similarity(self, query, rows: np.ndarray = None):
+        matrix = self._sparse_matrix if rows is None else self._sparse_matrix[rows]
+        if sparse.issparse(query):
+            # Произведение CSR матрицы на плотный вектор - один проход по матрице без транспонирования.
+            query = query.toarray().ravel()
+        return matrix @ query
+
+    def get_similarity_batch(self, queries):
+        return safe_sparse_dot(queries, self._sparse_matrix.T, dense_output=True)
@@ -0,0 +1,155 @@
+import os
+
+from itertools import islice
+
+import numpy as np
+
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+from src.searcher.algorithms.BaseModel import BaseModel
+from src.searcher.algorithms.InvertedIndex import InvertedIndex
+
+
+class HashingModel(BaseModel):
+    """
+    Hashing (Tf-idf по хэшам n-грамм)
+
+    Номер признака n-граммы - значение хэш-функции, поэтому словарь не строится
+    и не хранится: обучение выполняется за один проход по корпусу частями
+    (chunk_size документов), а память не зависит от количества различных n-грамм.
+    Документная частота признаков (для IDF) накапливается во время прохода.
+    """
+
+    def __init__(self, use_idf: bool = True, smooth_idf: bool = True, chunk_size: int = 10000, **kwargs):
+        """
+        :param use_idf: Использовать веса IDF.
+        :param smooth_idf: Сглаживание IDF (как в TfidfVectorizer).
+        :param chunk_size: Количество документов, векторизуемых за один раз.
+        :param kwargs: Параметры HashingVectorizer (n_features, ngram_range, ...).
+        """
+
+        super().__init__(**kwargs)
+        kwargs.setdefault('alternate_sign', False)
+        self._vectorizer = HashingVectorizer(norm=None, **kwargs)
+        self._use_idf = use_idf
+        self._smooth_idf = smooth_idf
+        self._chunk_size = chunk_size
+        self._idf = None
+        self._sparse_matrix = None
+        self._index = None
+
+    def save(self, file_path: str):
+        super()._save(file_path, {'vectorizer': self._vectorizer, 'idf': self._idf})
+        super()._save_sparse_matrix(file_path, self._sparse_matrix)
+        super()._save_matrix(f'{file_path}_index', self._index.postings,
+                             arrays={'max_weights': self._index.max_weights})
+
+    def load(self, file_path: str):
+        state = super()._load(file_path)
+        self._vectorizer = state['vectorizer']
+        self._idf = state['idf']
+        self._sparse_matrix = super()._load_sparse_matrix(file_path)
+        if os.path.isdir(f'{file_path}_index'):
+            self._index = InvertedIndex()
+            self._index.set_postings(super()._load_matrix(f'{file_path}_index'),
+                                     max_weights=super()._load_array(f'{file_path}_index', 'max_weights'))
+        else:
+            self._index = InvertedIndex(self._sparse_matrix)
+
+    def _iter_chunks(self, corpus):
+        """
+        Частоты признаков документов корпуса (TF), по chunk_size документов.
+        """
+
+        corpus = iter(corpus)
+        while True:
+            chunk = list(islice(corpus, self._chunk_size))
+            if not chunk:
+                break
+            yield self._vectorizer.transform(chunk).astype(np.float64)
+
+    def _get_idf(self, df: np.ndarray, n_docs: int) -> np.ndarray:
+        """
+        IDF признаков (как в TfidfVectorizer), признаки, которых нет в корпусе, получают вес 0
+        (аналог n-грамм, отсутствующих в словаре).
+        """
+
+        smooth_idf = int(self._smooth_idf)
+        idf = np.zeros(len(df), dtype=np.float64)
+        found = df > 0
+        idf[found] = np.log((n_docs + smooth_idf) / (df[found] + smooth_idf)) + 1
+        return idf
+
+    def _get_weights(self) -> np.ndarray:
+        """
+        Текущие веса признаков в строках матрицы документов (1 - вес не применялся).
+        """
+
+        if self._idf is None:
+            return np.ones(self._vectorizer.n_features, dtype=np.float64)
+        return np.where(self._idf > 0, self._idf, 1.0)
+
+    def _set_rows(self, rows: sparse.csr_matrix, df: np.ndarray) -> None:
+        """
+        Пересчет IDF по документной частоте df и формирование нормированной матрицы документов.
+
+        :param rows: Матрица документов, взвешенная текущими весами признаков (см. _get_weights).
+        """
+
+        if self._use_idf:
+            idf = self._get_idf(df, rows.shape[0])
+            rows = rows @ sparse.diags(idf / self._get_weights())
+            self._idf = idf
+
+        self._sparse_matrix = normalize(rows)
+        self._index = InvertedIndex(self._sparse_matrix)
+
+    def fit(self, corpus):
+        """
+        :param corpus: Итератор строк токенов (документов).
+        """
+
+        n_features = self._vectorizer.n_features
+        df = np.zeros(n_features, dtype=np.int64)
+        chunks = []
+        for rows in self._iter_chunks(corpus):
+            df += np.bincount(rows.indices, minlength=n_features)
+            chunks.append(rows)
+
+        self._idf = None
+        rows = sparse.vstack(chunks, format='csr') if chunks else sparse.csr_matrix((0, n_features))
+        self._set_rows(rows, df)
+
+    def update(self, corpus):
+        # Документная частота признака - количество ненулевых значений в столбце матрицы документов.
+        n_features = self._vectorizer.n_features
+        df = np.bincount(self._sparse_matrix.indices, minlength=n_features)
+        chunks = [self._sparse_matrix]
+        for rows in self._iter_chunks(corpus):
+            df += np.bincount(rows.indices, minlength=n_features)
+            chunks.append(rows @ sparse.diags(self._get_weights()) if self._use_idf else rows)
+
+        self._set_rows(sparse.vstack(chunks, format='csr'), df)
+
+    def transform(self, query):
+        return self.transform_batch([query])
+
+    def get_similarity(self, query, rows: np.ndarray = None):
+        matrix = self._sparse_matrix if rows is None else self._sparse_matrix[rows]
+        return self._cosine_similarity(query, matrix).flatten()
+
+    def get_terms(self, query, weight: float = 1.0):
+        return self._index.get_terms(normalize(query), weight)
+
+    def transform_batch(self, queries: list):
+        rows = self._vectorizer.transform(queries).astype(np.float64)
+        if self._use_idf:
+            # Умножение на IDF только ненулевых значений (без построения диагональной матрицы по всем признакам).
+            rows.data *= self._idf[rows.indices]
+            rows.eliminate_zeros()
+        return rows
+
+    def get_similarity_batch(self, queries):
+        return self._cosine_similarity(queries, self._sparse_matrix)
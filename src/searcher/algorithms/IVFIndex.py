@@ -0,0 +1,203 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+
+class IVFIndex:
+    """
+    Индекс для приближенного поиска ближайших соседей (IVF, inverted file).
+
+    Нормированные векторы документов разбиваются на n_lists кластеров (сферический k-means).
+    При поиске вычисляется сходство запроса только с центроидами кластеров, затем
+    документы n_probe ближайших кластеров передаются на точное вычисление score.
+
+    Параметр n_probe задает баланс между полнотой (recall) и скоростью поиска,
+    см. recall_report().
+    """
+
+    def __init__(self, n_lists: int = None, n_probe: int = 16, n_iter: int = 15, sample_size: int = 32, seed: int = 0):
+        """
+        :param n_lists: Количество кластеров, по умолчанию 4 * sqrt(количество документов).
+        :param n_probe: Количество просматриваемых кластеров при поиске.
+        :param n_iter: Количество итераций k-means.
+        :param sample_size: Размер выборки для обучения k-means (в расчете на один кластер).
+        :param seed: Начальное значение генератора случайных чисел.
+        """
+
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self._n_iter = n_iter
+        self._sample_size = sample_size
+        self._seed = seed
+
+        self._centroids = None
+        # Номера документов, упорядоченные по кластерам, и границы кластеров.
+        self._order = None
+        self._offsets = None
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """
+        Номер ближайшего центроида для каждого вектора (по частям, чтобы ограничить память).
+        """
+
+        assign = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], chunk_size):
+            assign[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+        return assign
+
+    def fit(self, vectors: np.ndarray) -> None:
+        """
+        :param vectors: Нормированные векторы документов.
+        """
+
+        n_docs = vectors.shape[0]
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(n_docs)))
+        n_lists = max(1, min(n_lists, n_docs))
+
+        rng = np.random.default_rng(self._seed)
+        sample = vectors[np.sort(rng.choice(n_docs, size=min(n_docs, n_lists * self._sample_size), replace=False))]
+        centroids = np.array(sample[rng.choice(sample.shape[0], size=n_lists, replace=False)])
+
+        for _ in range(self._n_iter):
+            assign = self._assign(sample, centroids)
+            # Сумма векторов каждого кластера одним произведением (one-hot матрица кластер-вектор).
+            one_hot = sparse.csr_matrix(
+                (np.ones(len(assign), dtype=sample.dtype), (assign, np.arange(len(assign)))),
+                shape=(n_lists, sample.shape[0]))
+            sums = np.asarray(one_hot @ sample)
+
+            # Пустые кластеры инициализируются случайными векторами выборки.
+            empty = np.flatnonzero(np.asarray(one_hot.sum(axis=1)).ravel() == 0)
+            if len(empty):
+                sums[empty] = sample[rng.choice(sample.shape[0], size=len(empty), replace=False)]
+
+            centroids = normalize(sums)
+
+        self._centroids = centroids.astype(vectors.dtype)
+        self.n_lists = n_lists
+        self._set_lists(self._assign(vectors, self._centroids))
+
+    def _set_lists(self, assign: np.ndarray) -> None:
+        self._order = np.argsort(assign, kind='stable')
+        self._offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=self.n_lists))))
+
+    def add(self, vectors: np.ndarray) -> None:
+        """
+        Добавление векторов новых документов (номера документов продолжают текущую нумерацию).
+        Центроиды не пересчитываются, новые документы распределяются по существующим кластерам.
+
+        :param vectors: Нормированные векторы новых документов.
+        """
+
+        assign = np.empty(len(self._order), dtype=np.int64)
+        assign[self._order] = np.repeat(np.arange(self.n_lists), np.diff(self._offsets))
+        self._set_lists(np.concatenate((assign, self._assign(vectors, self._centroids))))
+
+    def get_candidates(self, query: np.ndarray, n_probe: int = None) -> np.ndarray:
+        """
+        Номера документов из n_probe ближайших к запросу кластеров.
+
+        :param query: Нормированный вектор запроса.
+        :param n_probe: Количество просматриваемых кластеров, по умолчанию self.n_probe.
+        :return: Отсортированный массив номеров документов.
+        """
+
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        sims = self._centroids @ query
+        lists = np.argpartition(-sims, n_probe - 1)[:n_probe]
+        candidates = np.concatenate([self._order[self._offsets[i]:self._offsets[i + 1]] for i in lists])
+        return np.sort(candidates)
+
+    def recall_report(self,
+                      vectors: np.ndarray,
+                      queries: np.ndarray,
+                      n_top: int = 10,
+                      n_probes: tuple = None,
+                      exclude: np.ndarray = None) -> pd.DataFrame:
+        """
+        Отчет recall@k приближенного поиска относительно точного поиска.
+
+        :param vectors: Нормированные векторы документов (те же, по которым построен индекс).
+        :param queries: Нормированные векторы запросов.
+        :param n_top: Количество документов в результате (k).
+        :param n_probes: Список значений n_probe для сравнения.
+        :param exclude: Номер документа для каждого запроса, который исключается из результатов точного
+                        и приближенного поиска (если запросы - векторы документов индекса, то документ
+                        запроса всегда находится в ближайшем кластере, и recall завышен).
+        :return: DataFrame с колонками n_probe, recall, candidates (средняя доля просмотренных документов),
+                 ann_ms и exact_ms (среднее время запроса в миллисекундах).
+        """
+
+        n_probes = n_probes or tuple(p for p in (1, 2, 4, 8, 16, 32, 64) if p <= self.n_lists)
+        exclude = [None] * len(queries) if exclude is None else exclude
+        n_top = min(n_top, vectors.shape[0] - (1 if any(row is not None for row in exclude) else 0))
+
+        # Точный поиск.
+        exact = []
+        tm_start = time.time()
+        for query, row in zip(queries, exclude):
+            sims = vectors @ query
+            if row is not None:
+                sims[row] = -np.inf
+            exact.append(set(np.argpartition(-sims, n_top - 1)[:n_top].tolist()))
+        exact_ms = (time.time() - tm_start) * 1000 / max(len(queries), 1)
+
+        rows = []
+        for n_probe in n_probes:
+            hits = 0
+            n_candidates = 0
+            tm_start = time.time()
+            for query, expected, row in zip(queries, exact, exclude):
+                candidates = self.get_candidates(query, n_probe=n_probe)
+                if row is not None:
+                    candidates = candidates[candidates != row]
+                if len(candidates) == 0:
+                    continue
+                sims = vectors[candidates] @ query
+                top = candidates[np.argpartition(-sims, min(n_top, len(sims)) - 1)[:n_top]]
+                hits += len(expected.intersection(top.tolist()))
+                n_candidates += len(candidates)
+            ann_ms = (time.time() - tm_start) * 1000 / max(len(queries), 1)
+            rows.append({
+                'n_probe': n_probe,
+                'recall': hits / max(len(queries) * n_top, 1),
+                'candidates': n_candidates / max(len(queries) * vectors.shape[0], 1),
+                'ann_ms': ann_ms,
+                'exact_ms': exact_ms,
+            })
+
+        return pd.DataFrame(rows)
+
+    def save(self, file_path: str) -> None:
+        tmp_file_path = f'{file_path}.tmp'
+        shutil.rmtree(tmp_file_path, ignore_errors=True)
+        os.makedirs(tmp_file_path)
+
+        np.save(f'{tmp_file_path}/centroids.npy', self._centroids)
+        np.save(f'{tmp_file_path}/order.npy', self._order)
+        np.save(f'{tmp_file_path}/offsets.npy', self._offsets)
+        with open(f'{tmp_file_path}/meta.json', mode='w', encoding='utf8') as fw:
+            json.dump({'n_lists': self.n_lists}, fw)
+
+        old_file_path = f'{file_path}.old'
+        shutil.rmtree(old_file_path, ignore_errors=True)
+        if os.path.isdir(file_path):
+            os.replace(file_path, old_file_path)
+        os.replace(tmp_file_path, file_path)
+        shutil.rmtree(old_file_path, ignore_errors=True)
+
+    def load(self, file_path: str, mmap_mode: str = 'r') -> None:
+        with open(f'{file_path}/meta.json', mode='r', encoding='utf8') as fr:
+            self.n_lists = json.load(fr)['n_lists']
+
+        self._centroids = np.load(f'{file_path}/centroids.npy')
+        self._order = np.load(f'{file_path}/order.npy', mmap_mode=mmap_mode)
+        self._offsets = np.load(f'{file_path}/offsets.npy')
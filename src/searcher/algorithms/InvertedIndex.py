@@ -0,0 +1,190 @@
+import numpy as np
+
+from scipy import sparse
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс для моделей с разреженными векторами (BoW, TF-IDF).
+
+    Для каждого терма хранится список документов (posting list), отсортированный
+    по номеру документа, с нормированными весами терма в документе, а также
+    максимальный вес терма (верхняя граница вклада терма в score).
+
+    Индекс строится из матрицы документов (строки нормированы) и хранится в виде
+    CSR-матрицы терм-документ, т.е. строка i матрицы - posting list терма i.
+    """
+
+    def __init__(self, matrix=None):
+        """
+        :param matrix: Матрица документ-терм с нормированными строками.
+        """
+
+        self._postings = None
+        self._max_weights = None
+        self.n_docs = 0
+
+        if matrix is not None:
+            self.set_postings(sparse.csr_matrix(matrix.T))
+
+    @property
+    def postings(self) -> sparse.csr_matrix:
+        return self._postings
+
+    @property
+    def max_weights(self) -> np.ndarray:
+        return self._max_weights
+
+    def set_postings(self, postings: sparse.csr_matrix, max_weights: np.ndarray = None) -> None:
+        """
+        :param postings: Матрица терм-документ (CSR).
+        :param max_weights: Сохраненные максимальные веса термов (индекс загружен с диска), None - вычислить.
+        """
+
+        self.n_docs = postings.shape[1]
+
+        if max_weights is not None:
+            # Сохраненный индекс отсортирован (см. save моделей), чтобы не просматривать
+            # все posting lists при загрузке, проверка сортировки и вычисление весов пропускаются.
+            postings.has_sorted_indices = True
+            self._postings = postings
+            self._max_weights = max_weights
+            return
+
+        if not postings.has_sorted_indices:
+            postings = postings.copy()
+            postings.sort_indices()
+
+        self._postings = postings
+
+        # Максимальный вес каждого терма.
+        self._max_weights = np.zeros(postings.shape[0], dtype=np.float64)
+        lengths = np.diff(postings.indptr)
+        non_empty = lengths > 0
+        if non_empty.any():
+            self._max_weights[non_empty] = np.maximum.reduceat(postings.data, postings.indptr[:-1][non_empty])
+
+    def get_terms(self, query, weight: float = 1.0) -> list:
+        """
+        Списки документов для термов запроса.
+
+        :param query: Вектор запроса (разреженная строка), должен быть нормирован.
+        :param weight: Вес поля, на который умножается вклад термов.
+        :return: Список [(doc_ids, contributions, upper_bound), ...].
+        """
+
+        query = sparse.csr_matrix(query)
+        terms = []
+        for term, query_weight in zip(query.indices, query.data):
+            start, end = self._postings.indptr[term], self._postings.indptr[term + 1]
+            if start == end:
+                continue
+            scale = query_weight * weight
+            terms.append((
+                self._postings.indices[start:end],
+                self._postings.data[start:end] * scale,
+                self._max_weights[term] * scale,
+            ))
+        return terms
+
+    @staticmethod
+    def _kth_score(scores: np.ndarray, n_top: int) -> float:
+        if len(scores) < n_top:
+            return 0.0
+        return float(np.partition(scores, len(scores) - n_top)[len(scores) - n_top])
+
+    @staticmethod
+    def _merge(candidate_ids: np.ndarray, scores: np.ndarray, postings: list) -> tuple:
+        """
+        Добавление вкладов термов в score кандидатов: суммирование по номерам документов
+        (np.unique + np.bincount), память пропорциональна количеству просмотренных документов,
+        а не общему количеству документов.
+
+        :param postings: Список [(doc_ids, contributions), ...].
+        :return: (отсортированные номера кандидатов, score).
+        """
+
+        doc_ids = np.concatenate([candidate_ids] + [ids for ids, _ in postings])
+        contributions = np.concatenate([scores] + [values for _, values in postings])
+        candidate_ids, inverse = np.unique(doc_ids, return_inverse=True)
+        return candidate_ids, np.bincount(inverse, weights=contributions, minlength=len(candidate_ids))
+
+    @staticmethod
+    def top_n(terms: list, n_top: int, mask: np.ndarray = None) -> tuple:
+        """
+        Поиск N-топ документов по алгоритму MaxScore.
+
+        Термы обрабатываются в порядке убывания верхней границы вклада. Как только сумма
+        верхних границ оставшихся термов становится меньше текущего N-го score, новые
+        документы уже не могут попасть в топ: оставшиеся ("неосновные") термы только
+        досчитывают score уже найденных кандидатов, а кандидаты, которые даже с учетом
+        оставшихся термов не могут превысить порог, отбрасываются.
+
+        Score накапливается только для документов из просмотренных posting lists, поэтому
+        стоимость запроса не зависит от общего количества документов.
+
+        :param terms: Списки документов термов запроса [(doc_ids, contributions, upper_bound), ...].
+        :param n_top: Количество документов в результате.
+        :param mask: Логический массив допустимых документов (None - все документы).
+        :return: (номера документов, score) по убыванию score, документы с нулевым score не возвращаются.
+        """
+
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+        if n_top <= 0 or not terms:
+            return empty
+
+        terms = sorted(terms, key=lambda term: -term[2])
+        # remaining[i] - сумма верхних границ термов начиная с i.
+        remaining = np.append(np.cumsum([term[2] for term in terms][::-1])[::-1], 0.0)
+        # Запас на ошибки округления при сравнении с порогом.
+        eps = 1e-9
+
+        candidate_ids, scores = empty
+        pending = []
+        threshold = 0.0
+        next_check = 1
+
+        # Основные термы: находят новых кандидатов.
+        i = 0
+        while i < len(terms):
+            doc_ids, contributions, _ = terms[i]
+            if mask is not None:
+                allowed = mask[doc_ids]
+                doc_ids, contributions = doc_ids[allowed], contributions[allowed]
+            pending.append((doc_ids, contributions))
+            i += 1
+
+            # Порог пересчитывается на шагах 1, 2, 4, 8, ... чтобы не сортировать кандидатов на каждом терме.
+            if i >= next_check or i == len(terms):
+                next_check *= 2
+                candidate_ids, scores = InvertedIndex._merge(candidate_ids, scores, pending)
+                pending = []
+                threshold = InvertedIndex._kth_score(scores, n_top)
+                if threshold > 0.0 and remaining[i] + eps < threshold:
+                    break
+
+        # Неосновные термы: только досчитывают score кандидатов.
+        for j in range(i, len(terms)):
+            # Отбросить кандидатов, которые не могут попасть в N-топ.
+            keep = scores + remaining[j] + eps >= threshold
+            candidate_ids, scores = candidate_ids[keep], scores[keep]
+
+            doc_ids, contributions, _ = terms[j]
+            if len(doc_ids) == 0:
+                continue
+            pos = np.searchsorted(doc_ids, candidate_ids)
+            pos[pos >= len(doc_ids)] = 0
+            found = doc_ids[pos] == candidate_ids
+            scores[found] += contributions[pos[found]]
+
+            threshold = max(threshold, InvertedIndex._kth_score(scores, n_top))
+
+        # Итоговый N-топ.
+        n = min(n_top, len(scores))
+        if n == 0:
+            return empty
+        idx = np.argpartition(-scores, n - 1)[:n]
+        idx = idx[scores[idx] > 0.0]
+        idx = idx[np.argsort(-scores[idx], kind='stable')]
+
+        return candidate_ids[idx].astype(np.int64), scores[idx]
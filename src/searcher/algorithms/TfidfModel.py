@@ -1,7 +1,13 @@
+import os
+
+import numpy as np
+
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 
 from src.searcher.algorithms.BaseModel import BaseModel
+from src.searcher.algorithms.InvertedIndex import InvertedIndex
 
 
 class TfidfModel(BaseModel):
@@ -13,20 +19,68 @@ class TfidfModel(BaseModel):
         super().__init__(**kwargs)
         self._vectorizer = TfidfVectorizer(**kwargs)
         self._sparse_matrix = None
+        self._index = None
 
     def save(self, file_path: str):
         super()._save(file_path, self._vectorizer)
-        super()._save(f'{file_path}_sparse_matrix', self._sparse_matrix)
+        super()._save_sparse_matrix(file_path, self._sparse_matrix)
+        super()._save_matrix(f'{file_path}_index', self._index.postings,
+                             arrays={'max_weights': self._index.max_weights})
 
     def load(self, file_path: str):
         self._vectorizer = super()._load(file_path)
-        self._sparse_matrix = super()._load(f'{file_path}_sparse_matrix')
+        self._sparse_matrix = super()._load_sparse_matrix(file_path)
+        if os.path.isdir(f'{file_path}_index'):
+            self._index = InvertedIndex()
+            self._index.set_postings(super()._load_matrix(f'{file_path}_index'),
+                                     max_weights=super()._load_array(f'{file_path}_index', 'max_weights'))
+        else:
+            # Модель сохранена без индекса, индекс строится по матрице документов.
+            self._index = InvertedIndex(self._sparse_matrix)
 
     def fit(self, corpus):
-        self._sparse_matrix = self._vectorizer.fit_transform(corpus)
+        self._sparse_matrix = normalize(self._vectorizer.fit_transform(corpus))
+        self._index = InvertedIndex(self._sparse_matrix)
+
+    def update(self, corpus):
+        """
+        Словарь не меняется, веса IDF пересчитываются с учетом новых документов.
+
+        Документная частота терма - количество ненулевых значений в столбце матрицы документов,
+        поэтому IDF пересчитывается без повторной обработки корпуса, а строки документов
+        масштабируются отношением нового и старого IDF и нормируются заново.
+        """
+
+        rows = self._vectorizer.transform(corpus)
+
+        if self._vectorizer.use_idf:
+            n_features = rows.shape[1]
+            smooth_idf = int(self._vectorizer.smooth_idf)
+            n_docs = self._sparse_matrix.shape[0] + rows.shape[0] + smooth_idf
+            df = (np.bincount(self._sparse_matrix.indices, minlength=n_features)
+                  + np.bincount(rows.indices, minlength=n_features) + smooth_idf)
+            idf = np.log(n_docs / df) + 1
+
+            ratio = sparse.diags(idf / self._vectorizer.idf_)
+            self._vectorizer.idf_ = idf
+            self._sparse_matrix = normalize(self._append_rows(self._sparse_matrix, rows) @ ratio)
+        else:
+            self._sparse_matrix = self._append_rows(self._sparse_matrix, normalize(rows))
+
+        self._index = InvertedIndex(self._sparse_matrix)
 
     def transform(self, query):
         return self._vectorizer.transform([query])
 
-    def get_similarity(self, query):
-        return cosine_similarity(query, self._sparse_matrix).flatten()
+    def get_similarity(self, query, rows: np.ndarray = None):
+        matrix = self._sparse_matrix if rows is None else self._sparse_matrix[rows]
+        return self._cosine_similarity(query, matrix).flatten()
+
+    def get_terms(self, query, weight: float = 1.0):
+        return self._index.get_terms(normalize(query), weight)
+
+    def transform_batch(self, queries: list):
+        return self._vectorizer.transform(queries)
+
+    def get_similarity_batch(self, queries):
+        return self._cosine_similarity(queries, self._sparse_matrix)
@@ -1,9 +1,13 @@
+import os
+
 import numpy as np
 
 from gensim.models import Word2Vec, KeyedVectors
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from sklearn.preprocessing import normalize
 
 from src.searcher.algorithms.BaseModel import BaseModel
+from src.searcher.algorithms.IVFIndex import IVFIndex
 
 
 class W2VModel(BaseModel):
@@ -11,37 +15,129 @@ class W2VModel(BaseModel):
     Word2vec
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self,
+                 ivf_enable: bool = True,
+                 ivf_lists: int = None,
+                 ivf_probe: int = 16,
+                 update_epochs: int = 10,
+                 **kwargs):
+        """
+        :param ivf_enable: Строить индекс приближенного поиска (IVF) по векторам документов.
+        :param ivf_lists: Количество кластеров индекса, по умолчанию 4 * sqrt(количество документов).
+        :param ivf_probe: Количество просматриваемых кластеров при поиске (больше - выше recall, но медленнее).
+        :param update_epochs: Количество эпох обучения новых слов при добавлении документов (см. update()).
+        """
+
         super().__init__(**kwargs)
         self._model = Word2Vec(**kwargs)
         self._sparse_matrix = None
+        self._update_epochs = update_epochs
+
+        self._ivf = IVFIndex(n_lists=ivf_lists, n_probe=ivf_probe) if ivf_enable else None
+
+    def _build_ivf(self) -> None:
+        if self._ivf is not None:
+            self._ivf.fit(self._sparse_matrix)
 
     def save(self, file_path: str):
         self._model.save(file_path)
         self._model.wv.save(f'{file_path}_wv')
-        super()._save(f'{file_path}_sparse_matrix', self._sparse_matrix)
+        super()._save_sparse_matrix(file_path, self._sparse_matrix)
+        if self._ivf is not None:
+            self._ivf.save(f'{file_path}_ivf')
 
     def load(self, file_path: str):
         self._model = Word2Vec.load(file_path)
         self._model.wv = KeyedVectors.load(f'{file_path}_wv')
-        self._sparse_matrix = super()._load(f'{file_path}_sparse_matrix')
+        self._sparse_matrix = super()._load_sparse_matrix(file_path)
+
+        if self._ivf is not None:
+            if os.path.isdir(f'{file_path}_ivf'):
+                self._ivf.load(f'{file_path}_ivf', mmap_mode=self.mmap_mode)
+            else:
+                # Модель сохранена без индекса (предыдущая версия).
+                self._build_ivf()
 
     def fit(self, corpus):
         self._model.build_vocab(corpus_iterable=corpus)
         self._model.train(corpus_iterable=corpus, total_examples=self._model.corpus_count, epochs=self._model.epochs)
         # Собираем все преобразования в одну марицу.
-        self._sparse_matrix = np.array([self.transform(s) for s in corpus])
+        self._sparse_matrix = self.transform_batch(corpus)
+        self._build_ivf()
+
+    def update(self, corpus):
+        """
+        Словарь дополняется новыми словами, которые обучаются update_epochs эпох. Векторы слов,
+        которые уже были в словаре, не меняются (vectors_lockf = 0), поэтому векторы ранее
+        добавленных документов остаются актуальными.
+        """
+
+        wv = self._model.wv
+        n_words = len(wv)
+        self._model.build_vocab(corpus_iterable=corpus, update=True)
+
+        if len(wv) > n_words:
+            lockf = np.ones(len(wv), dtype=np.float32)
+            lockf[:n_words] = 0.0
+            wv.vectors_lockf = lockf
+            try:
+                self._model.train(corpus_iterable=corpus, total_examples=len(corpus), epochs=self._update_epochs)
+            finally:
+                wv.vectors_lockf = np.ones(1, dtype=np.float32)
+
+        vectors = self.transform_batch(corpus)
+        self._sparse_matrix = self._append_rows(self._sparse_matrix, vectors)
+        if self._ivf is not None:
+            self._ivf.add(vectors)
+
+    def _get_counts(self, queries) -> sparse.csr_matrix:
+        """
+        Матрица документ-слово (количество вхождений слов словаря в документ).
+        Слова, отсутствующие в словаре, пропускаются.
+        """
+
+        key_to_index = self._model.wv.key_to_index
+        indices = []
+        indptr = [0]
+        for query in queries:
+            indices.extend(key_to_index[word] for word in query if word in key_to_index)
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), np.array(indices, dtype=np.int64), np.array(indptr, dtype=np.int64)),
+            shape=(len(indptr) - 1, len(key_to_index)))
 
     def transform(self, query):
-        vector = np.zeros(self._model.vector_size)
+        return self.transform_batch([query])[0]
 
-        for word in query:
-            if word in self._model.wv:
-                vector = np.add(vector, self._model.wv[word])
-            else:
-                vector = np.add(vector, 0.0)
+    @property
+    def ivf(self) -> IVFIndex:
+        return self._ivf
+
+    def get_candidates(self, query, n_probe: int = None):
+        if self._ivf is None:
+            return None
+        return self._ivf.get_candidates(query, n_probe=n_probe)
+
+    def get_similarity(self, query, rows: np.ndarray = None):
+        # Векторы документов и запроса нормированы: косинусное сходство - произведение матрицы на вектор.
+        matrix = self._sparse_matrix if rows is None else self._sparse_matrix[rows]
+        return matrix @ query
+
+    def transform_corpus(self, corpus):
+        return self.transform_batch(corpus)
+
+    def get_similarity_matrix(self, query, matrix) -> np.ndarray:
+        return matrix @ query
+
+    def transform_batch(self, queries: list):
+        """
+        Вектор документа - нормированная сумма векторов его слов (float32).
+        Все векторы вычисляются одним произведением матрицы документ-слово на матрицу векторов слов.
+        """
 
-        return vector
+        vectors = self._get_counts(queries) @ self._model.wv.vectors
+        return normalize(np.asarray(vectors, dtype=np.float32)).astype(np.float32, copy=False)
 
-    def get_similarity(self, query):
-        return cosine_similarity(np.array([query]), self._sparse_matrix).flatten()
+    def get_similarity_batch(self, queries):
+        return queries @ self._sparse_matrix.T